@@ -1,11 +1,26 @@
 from django.contrib import admin
 from .models import (
     Direccion, Usuario, Celular, Laptop, Tablet, Airpod, 
-    Accesorio, Carrito, CarritoItem, Pedido, DetallePedido
+    Accesorio, Carrito, CarritoItem, Pedido, DetallePedido, ClaveIdempotencia, Tarea,
+    PedidoArchivado, Recomendacion, CompatibilidadAccesorio, CodigoPostal, HistorialEstadoPedido
 )
 
+
+@admin.register(Direccion)
+class DireccionAdmin(admin.ModelAdmin):
+    # Las direcciones son inmutables (Direccion.save() rechaza cambios) y se
+    # crean con Direccion.obtener() para no duplicarlas: aquí solo se consultan
+    list_display = ('calle', 'colonia', 'codigo_postal', 'ciudad', 'pais')
+    search_fields = ('calle', 'colonia', 'codigo_postal', 'ciudad')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 # Registra todos los modelos
-admin.site.register(Direccion)
 admin.site.register(Usuario)
 admin.site.register(Celular)
 admin.site.register(Laptop)
@@ -16,6 +31,13 @@ admin.site.register(Carrito)
 admin.site.register(CarritoItem)
 admin.site.register(Pedido)
 admin.site.register(DetallePedido)
+admin.site.register(ClaveIdempotencia)
+admin.site.register(Tarea)
+admin.site.register(PedidoArchivado)
+admin.site.register(Recomendacion)
+admin.site.register(CompatibilidadAccesorio)
+admin.site.register(CodigoPostal)
+admin.site.register(HistorialEstadoPedido)
 
 # Volver a realizar las migraciones (Solo si Django lo requiere, si no, sólo 'migrate' es suficiente)
 # python manage.py makemigrations 
@@ -1,6 +1,20 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
 
 
 class AppIphoneConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app_Iphone'
+
+    def ready(self):
+        # Registra las señales que invalidan el catálogo y los reportes en caché
+        # y la que mantiene el índice de compatibilidad de accesorios
+        from . import catalogo, compatibilidad, reportes  # noqa: F401
+
+        if getattr(settings, 'PRECALENTAR_AL_INICIAR', False):
+            from .arranque import precalentar
+            logger.info('Precalentamiento: %s', precalentar())
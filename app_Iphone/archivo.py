@@ -0,0 +1,81 @@
+"""
+Archivo de pedidos viejos. Los pedidos entregados antes de una fecha de corte
+pasan de Pedido/DetallePedido a PedidoArchivado (una fila por pedido, con la
+dirección, las líneas y el historial de estados en JSON), para que las tablas
+calientes se mantengan chicas. El historial de la tienda lee de ambas.
+"""
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .borrado import borrar_pedidos
+from .models import HistorialEstadoPedido, Pedido, PedidoArchivado
+
+
+def _empacar(pedido):
+    direccion = pedido.direccion_envio
+    return PedidoArchivado(
+        id=pedido.id,
+        usuario_id=pedido.usuario_id,
+        fecha_pedido=pedido.fecha_pedido,
+        total=pedido.total,
+        estado=pedido.estado,
+        direccion_envio={
+            'calle': direccion.calle, 'codigo_postal': direccion.codigo_postal,
+            'colonia': direccion.colonia, 'ciudad': direccion.ciudad, 'pais': direccion.pais,
+        } if direccion else None,
+        lineas=[
+            {
+                'producto_nombre': d.producto_nombre, 'categoria': d.categoria, 'sku': d.sku,
+                'cantidad': d.cantidad, 'precio_unitario': str(d.precio_unitario),
+            }
+            for d in pedido.detallepedido_set.all()
+        ],
+        historial_estados=[
+            {
+                'estado_anterior': h.estado_anterior, 'estado_nuevo': h.estado_nuevo,
+                'fecha': h.fecha.isoformat(),
+            }
+            for h in pedido.historial_estados.all()
+        ],
+    )
+
+
+def pedidos_archivables(antes_de, estado='Entregado'):
+    return Pedido.objects.filter(estado=estado, fecha_pedido__lt=antes_de)
+
+
+def archivar_lote(antes_de, estado='Entregado', lote=500):
+    """
+    Mueve hasta `lote` pedidos al archivo en una sola transacción (copiar y
+    borrar van juntos: un pedido nunca queda en ambas tablas ni en ninguna).
+    Devuelve cuántos movió; 0 significa que ya no queda nada por archivar.
+    """
+    with transaction.atomic():
+        pedidos = list(
+            pedidos_archivables(antes_de, estado)
+            .select_related('direccion_envio')
+            .prefetch_related(
+                'detallepedido_set',
+                Prefetch('historial_estados', queryset=HistorialEstadoPedido.objects.order_by('fecha', 'id')),
+            )
+            .order_by('id')[:lote]
+        )
+        if not pedidos:
+            return 0
+        PedidoArchivado.objects.bulk_create([_empacar(p) for p in pedidos])
+        borrar_pedidos([p.id for p in pedidos])
+    return len(pedidos)
+
+
+def historial_pedidos(usuario):
+    """Pedidos del usuario (activos y archivados), del más reciente al más antiguo."""
+    activos = list(
+        Pedido.objects.filter(usuario=usuario)
+        .select_related('direccion_envio')
+        .prefetch_related('detallepedido_set')
+        .order_by('-fecha_pedido')
+    )
+    archivados = list(PedidoArchivado.objects.filter(usuario=usuario).order_by('-fecha_pedido'))
+    if not archivados:
+        return activos
+    return sorted(activos + archivados, key=lambda p: p.fecha_pedido, reverse=True)
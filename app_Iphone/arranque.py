@@ -0,0 +1,65 @@
+"""
+Precalentamiento del proceso: deja compiladas las plantillas de la app,
+resueltas las URLs (lo que importa views.py y sus dependencias), cargado el
+catálogo en caché, armado el índice del autocompletado y abierta la conexión
+a la BD, para que la primera petición de cada trabajador no pague esos costos.
+"""
+import logging
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_PLANTILLAS = Path(__file__).resolve().parent / 'templates'
+
+
+def compilar_plantillas():
+    """Compila todas las plantillas de app_Iphone/templates. Devuelve cuántas."""
+    compiladas = 0
+    for ruta in sorted(DIRECTORIO_PLANTILLAS.rglob('*.html')):
+        # El loader en caché conserva la plantilla compilada en el motor
+        get_template(ruta.relative_to(DIRECTORIO_PLANTILLAS).as_posix())
+        compiladas += 1
+    return compiladas
+
+
+def resolver_urls():
+    """Carga el URLconf completo (importa las vistas). Devuelve cuántos patrones hay."""
+    return len(get_resolver().url_patterns)
+
+
+def abrir_conexiones():
+    """Abre la conexión al primario y a las réplicas activas en el hilo actual."""
+    for alias in ['default', *getattr(settings, 'REPLICAS_LECTURA', [])]:
+        connections[alias].ensure_connection()
+
+
+def precalentar(bd=True):
+    """
+    Ejecuta todos los pasos y devuelve {paso: milisegundos}. Con bd=False no
+    toca la base de datos (ni catálogo ni conexión), p. ej. antes de un fork.
+    """
+    from . import autocompletar, catalogo
+
+    pasos = [('plantillas', compilar_plantillas), ('urls', resolver_urls)]
+    if bd:
+        pasos += [
+            ('conexion_bd', abrir_conexiones), ('catalogo', catalogo.precargar),
+            ('autocompletar', autocompletar.indice),
+        ]
+
+    tiempos = {}
+    for nombre, paso in pasos:
+        inicio = time.perf_counter()
+        try:
+            paso()
+        except DatabaseError as error:
+            # Sin migraciones aplicadas todavía, por ejemplo: no impide arrancar
+            logger.warning('Precalentamiento: se omitió %s (%s)', nombre, error)
+        tiempos[nombre] = round((time.perf_counter() - inicio) * 1000, 2)
+    return tiempos
@@ -0,0 +1,160 @@
+"""
+Autocompletado de la búsqueda de productos con un índice de prefijos (trie)
+en la memoria del proceso.
+
+Cada producto se inserta por cada palabra de su nombre ('iphone 15 pro',
+'15 pro', 'pro'), hasta AUTOCOMPLETAR_PROFUNDIDAD caracteres. Cada nodo guarda
+ya ordenadas sus mejores sugerencias (por piezas vendidas: el contador
+`vendidos` de cada producto, que el checkout suma en el mismo UPDATE que
+descuenta las existencias), así que responder es recorrer tantos nodos como
+letras escritas, sin consultas.
+
+El índice se reconstruye solo cuando cambia la versión del catálogo (alta,
+edición o baja de un producto). Los productos y su popularidad salen del
+catálogo en caché (catalogo.productos): reconstruir no agrega consultas.
+El número de nodos tiene un tope (AUTOCOMPLETAR_MAX_NODOS) y el tamaño
+aproximado en bytes se mide al construirlo (ver estadisticas()).
+"""
+import logging
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.urls import reverse
+
+from . import catalogo
+from .compatibilidad import normalizar
+
+logger = logging.getLogger(__name__)
+
+# Páginas de categoría a las que lleva cada sugerencia
+URL_CATEGORIA = {
+    'celular': 'tienda_celulares',
+    'laptop': 'tienda_laptops',
+    'tablet': 'tienda_tablets',
+    'airpod': 'tienda_airpods',
+    'accesorio': 'tienda_accesorios',
+}
+
+
+class _Nodo:
+    __slots__ = ('hijos', 'mejores')
+
+    def __init__(self):
+        self.hijos = {}
+        self.mejores = ()  # Índices en Indice.productos, de mayor a menor peso
+
+
+class Indice:
+    def __init__(self, version, productos, profundidad, sugerencias, max_nodos):
+        self.version = version
+        self.profundidad = profundidad
+        # (peso, nombre, tipo, id), ordenados de mayor a menor peso
+        self.productos = sorted(productos, key=lambda p: (-p[0], p[1]))
+        self.raiz = _Nodo()
+        self.nodos = 1
+        self.completo = True
+        self._construir(profundidad, sugerencias, max_nodos)
+        self.bytes = self._medir()
+
+    def _construir(self, profundidad, sugerencias, max_nodos):
+        # Como los productos se insertan de mayor a menor peso, basta con
+        # agregar al final hasta llenar las `sugerencias` de cada nodo
+        for posicion, (_, nombre, _, _) in enumerate(self.productos):
+            palabras = normalizar(nombre).split()
+            for inicio in range(len(palabras)):
+                clave = ' '.join(palabras[inicio:])[:profundidad]
+                nodo = self.raiz
+                for letra in clave:
+                    hijo = nodo.hijos.get(letra)
+                    if hijo is None:
+                        if self.nodos >= max_nodos:
+                            self.completo = False
+                            break
+                        hijo = nodo.hijos[letra] = _Nodo()
+                        self.nodos += 1
+                    nodo = hijo
+                    if len(nodo.mejores) < sugerencias and posicion not in nodo.mejores:
+                        nodo.mejores += (posicion,)
+        if not self.completo:
+            logger.warning('Autocompletado: se alcanzó el tope de %s nodos', max_nodos)
+
+    def _medir(self):
+        """Tamaño aproximado en bytes de los nodos y de la lista de productos."""
+        total = sum(sys.getsizeof(p) + sys.getsizeof(p[1]) for p in self.productos)
+        pendientes = [self.raiz]
+        while pendientes:
+            nodo = pendientes.pop()
+            total += sys.getsizeof(nodo) + sys.getsizeof(nodo.hijos) + sys.getsizeof(nodo.mejores)
+            pendientes.extend(nodo.hijos.values())
+        return total
+
+    def buscar(self, texto, limite):
+        nodo = self.raiz
+        for letra in normalizar(texto)[:self.profundidad]:
+            nodo = nodo.hijos.get(letra)
+            if nodo is None:
+                return []
+        return [self.productos[i] for i in nodo.mejores[:limite]]
+
+
+_indice = None
+_candado = threading.Lock()
+
+
+def construir(version=None):
+    """Arma un índice nuevo con el catálogo vigente."""
+    if version is None:
+        version = catalogo.version()
+    productos = [
+        (producto.vendidos, str(producto), tipo, producto.pk)
+        for tipo in catalogo.MODELOS
+        for producto in catalogo.productos(tipo)
+    ]
+    inicio = time.perf_counter()
+    indice = Indice(
+        version, productos,
+        profundidad=getattr(settings, 'AUTOCOMPLETAR_PROFUNDIDAD', 20),
+        sugerencias=getattr(settings, 'AUTOCOMPLETAR_SUGERENCIAS', 8),
+        max_nodos=getattr(settings, 'AUTOCOMPLETAR_MAX_NODOS', 200_000),
+    )
+    indice.construido_ms = round((time.perf_counter() - inicio) * 1000, 2)
+    return indice
+
+
+def indice():
+    """El índice del proceso; se reconstruye (un hilo a la vez) si cambió la versión del catálogo."""
+    global _indice
+    version = catalogo.version()
+    actual = _indice
+    if actual is not None and actual.version == version:
+        return actual
+    with _candado:
+        if _indice is None or _indice.version != version:
+            _indice = construir(version)
+        return _indice
+
+
+def sugerir(texto, limite=8):
+    """Sugerencias para lo que el usuario lleva escrito: [{'nombre', 'type', 'id', 'url'}, ...]."""
+    if not normalizar(texto):
+        return []
+    return [
+        {'nombre': nombre, 'type': tipo, 'id': pk, 'url': reverse(URL_CATEGORIA[tipo])}
+        for _, nombre, tipo, pk in indice().buscar(texto, limite)
+    ]
+
+
+def estadisticas():
+    """Tamaño del índice cargado en este proceso (None si todavía no se construye)."""
+    actual = _indice
+    if actual is None:
+        return None
+    return {
+        'productos': len(actual.productos),
+        'nodos': actual.nodos,
+        'bytes': actual.bytes,
+        'completo': actual.completo,
+        'construido_ms': actual.construido_ms,
+    }
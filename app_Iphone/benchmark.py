@@ -0,0 +1,346 @@
+"""
+Suite de benchmark de la tienda: genera datos de prueba y recorre los flujos
+reales (categorías, carrito, checkout, historial) con el cliente de pruebas de
+Django, midiendo latencia y número de consultas por paso.
+"""
+import http.client
+import random
+import re
+import threading
+import time
+from decimal import Decimal
+
+from django.db import connection
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from . import catalogo as catalogo_cache
+from . import compatibilidad, recomendaciones, reportes
+from .middleware import LimitePeticionesMiddleware, limitador
+from .models import (
+    Usuario, Direccion, MetodoPago, Celular, Laptop, Tablet, Airpod, Accesorio,
+    Pedido, DetallePedido
+)
+
+# Tipo de producto -> (modelo, nombre de la ruta de su categoría)
+CATEGORIAS = {
+    'celular': (Celular, 'tienda_celulares'),
+    'laptop': (Laptop, 'tienda_laptops'),
+    'tablet': (Tablet, 'tienda_tablets'),
+    'airpod': (Airpod, 'tienda_airpods'),
+    'accesorio': (Accesorio, 'tienda_accesorios'),
+}
+
+CONTRASENA_PRUEBA = 'benchmark'
+
+
+# ==========================================================
+# GENERADOR DE DATOS
+# ==========================================================
+
+def _producto(tipo, i, rnd):
+    datos = {
+        'descripcion': f'Producto de prueba {i}',
+        'precio': Decimal(rnd.randint(99, 2999)),
+        'imagen_url': f'https://example.com/{tipo}/{i}.png',
+        'stock': 1000,
+    }
+    if tipo == 'accesorio':
+        datos.update(tipo=f'Funda {i}', modelo_compatible=f'iPhone {i % 16}')
+    else:
+        datos['modelo'] = f'{tipo.capitalize()} {i}'
+    if tipo == 'airpod':
+        datos['generacion'] = f'{i % 4 + 1}a'
+    return datos
+
+
+def generar_datos(productos_por_categoria=20, usuarios=10, pedidos=50, semilla=1):
+    """Crea N productos por categoría, M usuarios (con dirección y pago) y K pedidos."""
+    rnd = random.Random(semilla)
+    catalogo = {}
+    nombres = {}
+    for tipo, (Model, _) in CATEGORIAS.items():
+        Model.objects.bulk_create(
+            [Model(**_producto(tipo, i, rnd)) for i in range(productos_por_categoria)]
+        )
+        catalogo[tipo] = list(Model.objects.values_list('id', 'precio'))
+        campo_nombre = 'tipo' if tipo == 'accesorio' else 'modelo'
+        nombres[tipo] = dict(Model.objects.values_list('id', campo_nombre))
+    # bulk_create no emite post_save: el índice de compatibilidad se arma y el
+    # catálogo en caché se descarta a mano
+    compatibilidad.reindexar()
+    catalogo_cache.invalidar()
+
+    # bulk_create no pasa por save(): la huella se calcula aquí, y una
+    # dirección que ya existe (otra corrida) se reutiliza
+    nuevas = [
+        Direccion(calle=f'Calle {i}', codigo_postal='44100', colonia='Centro',
+                  ciudad='Guadalajara', pais='México')
+        for i in range(usuarios)
+    ]
+    for direccion in nuevas:
+        direccion.huella = Direccion.calcular_huella(vars(direccion))
+    Direccion.objects.bulk_create(nuevas, ignore_conflicts=True)
+    por_huella = Direccion.objects.in_bulk([d.huella for d in nuevas], field_name='huella')
+    direcciones = [por_huella[d.huella] for d in nuevas]
+    pagos = MetodoPago.objects.bulk_create([
+        MetodoPago(titular=f'Usuario {i}', numero_tarjeta=f'{4000000000000000 + i}',
+                   fecha_vencimiento='12/30', cvv='123')
+        for i in range(usuarios)
+    ])
+    lista_usuarios = Usuario.objects.bulk_create([
+        Usuario(nombre=f'Usuario {i}', email=f'usuario{semilla}_{i}@benchmark.test',
+                telefono='3300000000', contraseña=CONTRASENA_PRUEBA,
+                direccion=direcciones[i], metodo_pago=pagos[i])
+        for i in range(usuarios)
+    ])
+
+    nuevos_pedidos = Pedido.objects.bulk_create([
+        Pedido(usuario=u, direccion_envio=u.direccion, metodo_pago=u.metodo_pago,
+               total=Decimal('0.00'), estado=rnd.choice(['Pendiente', 'Enviado', 'Entregado']))
+        for u in (rnd.choice(lista_usuarios) for _ in range(pedidos))
+    ])
+    detalles = []
+    for pedido in nuevos_pedidos:
+        for _ in range(rnd.randint(1, 3)):
+            tipo = rnd.choice(list(CATEGORIAS))
+            producto_id, precio = rnd.choice(catalogo[tipo])
+            detalles.append(DetallePedido(
+                pedido=pedido, cantidad=1, precio_unitario=precio,
+                producto_nombre=nombres[tipo][producto_id], categoria=tipo,
+                sku=DetallePedido.sku_para(tipo, producto_id),
+                **{f'{tipo}_id': producto_id}
+            ))
+    DetallePedido.objects.bulk_create(detalles)
+    # bulk_create no pasa por el checkout: se calculan los contadores al final
+    Usuario.reconciliar_resumen_pedidos()
+    reportes.invalidar()
+    # Las sugerencias del carrito y las categorías salen de estos pedidos
+    recomendaciones.recalcular()
+
+    return {'usuarios': lista_usuarios, 'catalogo': catalogo}
+
+
+# ==========================================================
+# PASOS DEL FLUJO
+# ==========================================================
+
+def _pasos(client, usuario, catalogo, rnd):
+    """Genera (nombre_paso, función) en el orden en que navega un cliente real."""
+    for tipo, (_, nombre_ruta) in CATEGORIAS.items():
+        yield f'categoria_{tipo}', lambda r=nombre_ruta: client.get(reverse(r))
+
+    tipo = rnd.choice(list(CATEGORIAS))
+    producto_id, _ = rnd.choice(catalogo[tipo])
+    yield 'agregar_al_carrito', lambda: client.post(reverse('tienda_agregar_al_carrito'), {
+        'product_id': producto_id, 'product_type': tipo, 'cantidad': 1,
+    })
+    yield 'ver_carrito', lambda: client.get(reverse('tienda_ver_carrito'))
+    yield 'mostrar_direccion', lambda: client.get(reverse('tienda_mostrar_direccion'))
+    yield 'guardar_direccion', lambda: client.post(reverse('tienda_guardar_direccion'), {
+        'calle': usuario.direccion.calle, 'codigo_postal': '44100', 'colonia': 'Centro',
+        'ciudad': 'Guadalajara', 'pais': 'México',
+    })
+    yield 'pago', lambda: client.get(reverse('tienda_pago'))
+    yield 'guardar_pago', lambda: client.post(reverse('tienda_guardar_pago'), {
+        'titular': usuario.nombre, 'numero_tarjeta': '4111111111111111',
+        'fecha_vencimiento': '12/30', 'cvv': '123',
+    })
+    estado = {}
+
+    def resumen():
+        response = client.get(reverse('tienda_resumen_pedido'))
+        # La clave de idempotencia viaja en el formulario del resumen
+        encontrada = re.search(rb'name="clave_idempotencia" value="(\w+)"', response.content)
+        estado['clave'] = encontrada.group(1).decode() if encontrada else ''
+        encontrada = re.search(rb'name="version_carrito" value="(\w+)"', response.content)
+        estado['version'] = encontrada.group(1).decode() if encontrada else ''
+        return response
+
+    yield 'resumen_pedido', resumen
+    yield 'finalizar_compra', lambda: client.post(reverse('tienda_finalizar_compra'), {
+        'clave_idempotencia': estado['clave'], 'version_carrito': estado['version'],
+    })
+    yield 'mis_pedidos', lambda: client.get(reverse('tienda_mis_pedidos'))
+
+
+def _percentil(ordenados, q):
+    return ordenados[min(len(ordenados) - 1, int(round(q * (len(ordenados) - 1))))]
+
+
+def ejecutar_benchmark(datos, iteraciones=20, semilla=1):
+    """Recorre el flujo completo `iteraciones` veces y devuelve el reporte por paso."""
+    rnd = random.Random(semilla)
+    mediciones = {}
+
+    inicio_total = time.perf_counter()
+    for i in range(iteraciones):
+        usuario = rnd.choice(datos['usuarios'])
+        # Una IP por visitante, como en producción (el límite de peticiones
+        # sigue activo y su costo queda dentro de lo medido)
+        client = Client(REMOTE_ADDR=f'10.0.{i // 256 % 256}.{i % 256}')
+        client.post(reverse('tienda_login'), {'email': usuario.email, 'password': CONTRASENA_PRUEBA})
+
+        for nombre, paso in _pasos(client, usuario, datos['catalogo'], rnd):
+            with CaptureQueriesContext(connection) as consultas:
+                inicio = time.perf_counter()
+                response = paso()
+                duracion = time.perf_counter() - inicio
+            if response.status_code >= 400:
+                raise RuntimeError(f'El paso {nombre} respondió {response.status_code}')
+            mediciones.setdefault(nombre, []).append((duracion, len(consultas)))
+    duracion_total = time.perf_counter() - inicio_total
+
+    pasos = {}
+    for nombre, muestras in mediciones.items():
+        latencias = sorted(m[0] * 1000 for m in muestras)
+        conteos = [m[1] for m in muestras]
+        pasos[nombre] = {
+            'peticiones': len(muestras),
+            'rps': round(len(muestras) / (sum(latencias) / 1000), 2),
+            'p50_ms': round(_percentil(latencias, 0.50), 3),
+            'p95_ms': round(_percentil(latencias, 0.95), 3),
+            'p99_ms': round(_percentil(latencias, 0.99), 3),
+            'consultas_promedio': round(sum(conteos) / len(conteos), 2),
+            'consultas_max': max(conteos),
+        }
+
+    total_peticiones = sum(p['peticiones'] for p in pasos.values())
+    return {
+        'iteraciones': iteraciones,
+        'peticiones': total_peticiones,
+        'rps_total': round(total_peticiones / duracion_total, 2),
+        'pasos': pasos,
+    }
+
+
+def comparar_con_base(resultado, base, tolerancia=0.10):
+    """
+    Compara un reporte contra uno guardado. Devuelve la lista de regresiones:
+    más consultas que la base, o p95 peor que la base por encima de la tolerancia.
+    """
+    regresiones = []
+    for nombre, actual in resultado['pasos'].items():
+        anterior = base.get('pasos', {}).get(nombre)
+        if not anterior:
+            continue
+        if actual['consultas_max'] > anterior['consultas_max']:
+            regresiones.append(
+                f"{nombre}: consultas {anterior['consultas_max']} -> {actual['consultas_max']}"
+            )
+        if actual['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+            regresiones.append(
+                f"{nombre}: p95 {anterior['p95_ms']}ms -> {actual['p95_ms']}ms"
+            )
+    return regresiones
+
+
+# ==========================================================
+# CARGA HTTP CONTRA UN SERVIDOR EN EJECUCIÓN
+# ==========================================================
+
+def medir_http(host, puerto, rutas, concurrencia=8, peticiones=500):
+    """
+    Lanza `peticiones` GET repartidos entre `concurrencia` hilos contra un
+    servidor real y devuelve rps, percentiles de latencia y errores.
+    """
+    latencias = []
+    errores = [0]
+    lock = threading.Lock()
+    restantes = iter(range(peticiones))
+
+    def cliente():
+        while True:
+            with lock:
+                i = next(restantes, None)
+            if i is None:
+                return
+            inicio = time.perf_counter()
+            try:
+                conexion = http.client.HTTPConnection(host, puerto, timeout=30)
+                conexion.request('GET', rutas[i % len(rutas)])
+                respuesta = conexion.getresponse()
+                respuesta.read()
+                conexion.close()
+                ok = respuesta.status < 400
+            except OSError:
+                ok = False
+            duracion = (time.perf_counter() - inicio) * 1000
+            with lock:
+                if ok:
+                    latencias.append(duracion)
+                else:
+                    errores[0] += 1
+
+    inicio_total = time.perf_counter()
+    hilos = [threading.Thread(target=cliente) for _ in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion_total = time.perf_counter() - inicio_total
+
+    latencias.sort()
+    return {
+        'peticiones': peticiones,
+        'errores': errores[0],
+        'rps': round(len(latencias) / duracion_total, 2),
+        'p50_ms': round(_percentil(latencias, 0.50), 3) if latencias else None,
+        'p95_ms': round(_percentil(latencias, 0.95), 3) if latencias else None,
+        'p99_ms': round(_percentil(latencias, 0.99), 3) if latencias else None,
+    }
+
+
+# ==========================================================
+# SOBRECOSTO DEL LÍMITE DE PETICIONES
+# ==========================================================
+
+def medir_limite_peticiones(usuario, iteraciones=2000):
+    """
+    Compara lo que cuesta el middleware de límite de peticiones (petición
+    permitida y rechazada) contra un login completo del mismo usuario.
+    """
+    fabrica = RequestFactory()
+    ruta = reverse('tienda_login')
+
+    def peticion(ip):
+        request = fabrica.post(ruta, REMOTE_ADDR=ip)
+        request.resolver_match = resolve(ruta)
+        return request
+
+    def medir(middleware, ips):
+        latencias = []
+        for ip in ips:
+            request = peticion(ip)
+            inicio = time.perf_counter()
+            middleware.process_view(request, None, (), {})
+            latencias.append((time.perf_counter() - inicio) * 1_000_000)
+        return sorted(latencias)
+
+    limitador.limpiar()
+    # Una IP distinta por petición: siempre hay token (camino completo con la caché)
+    with override_settings(LIMITES_PETICIONES={'tienda_login': (5, 10)}):
+        permitidas = medir(LimitePeticionesMiddleware(None), [f'10.1.{i // 256 % 256}.{i % 256}' for i in range(iteraciones)])
+    # La misma IP sin tokens: rechazo desde la memoria del proceso
+    with override_settings(LIMITES_PETICIONES={'tienda_login': (1, 1)}):
+        rechazadas = medir(LimitePeticionesMiddleware(None), ['10.2.0.1'] * iteraciones)
+    limitador.limpiar()
+
+    logins = []
+    for i in range(min(iteraciones, 200)):
+        client = Client(REMOTE_ADDR=f'10.3.{i // 256 % 256}.{i % 256}')
+        inicio = time.perf_counter()
+        client.post(ruta, {'email': usuario.email, 'password': CONTRASENA_PRUEBA})
+        logins.append((time.perf_counter() - inicio) * 1000)
+    logins.sort()
+
+    permitida_us = _percentil(permitidas, 0.50)
+    login_ms = _percentil(logins, 0.50)
+    return {
+        'permitida_p50_us': round(permitida_us, 2),
+        'permitida_p99_us': round(_percentil(permitidas, 0.99), 2),
+        'rechazada_p50_us': round(_percentil(rechazadas, 0.50), 2),
+        'login_p50_ms': round(login_ms, 3),
+        'sobrecosto_pct': round(permitida_us / 1000 / login_ms * 100, 2),
+    }
@@ -0,0 +1,102 @@
+"""
+Borrado masivo de usuarios con DELETE por conjuntos. El borrado del ORM
+(`usuario.delete()`) carga cada Pedido, DetallePedido, Carrito y CarritoItem
+en memoria para resolver las cascadas; aquí cada tabla se vacía con un solo
+DELETE ... WHERE ... IN (subconsulta), de las hojas hacia la raíz.
+"""
+from django.db import connection, transaction
+
+from . import reportes
+from .models import (
+    Usuario, Direccion, MetodoPago, Carrito, CarritoItem, Pedido, DetallePedido,
+    ClaveIdempotencia, PedidoArchivado, HistorialEstadoPedido
+)
+
+
+def _tabla(Model):
+    return connection.ops.quote_name(Model._meta.db_table)
+
+
+def borrar_usuarios(usuario_ids):
+    """
+    Borra los usuarios indicados con todo lo que depende de ellos, en una sola
+    transacción. También borra las Direccion/MetodoPago que queden huérfanas.
+    Devuelve {nombre_tabla: filas_borradas}.
+    """
+    ids = list(usuario_ids)
+    if not ids:
+        return {}
+    en_ids = ', '.join(['%s'] * len(ids))
+    pedidos_de_usuarios = f'SELECT id FROM {_tabla(Pedido)} WHERE usuario_id IN ({en_ids})'
+    carritos_de_usuarios = f'SELECT id FROM {_tabla(Carrito)} WHERE usuario_id IN ({en_ids})'
+
+    # Hijos antes que padres: así ninguna FK queda apuntando a una fila borrada
+    pasos = [
+        (DetallePedido, f'pedido_id IN ({pedidos_de_usuarios})'),
+        (ClaveIdempotencia, f'usuario_id IN ({en_ids})'),
+        (HistorialEstadoPedido, f'pedido_id IN ({pedidos_de_usuarios})'),
+        (Pedido, f'usuario_id IN ({en_ids})'),
+        (PedidoArchivado, f'usuario_id IN ({en_ids})'),
+        (CarritoItem, f'carrito_id IN ({carritos_de_usuarios})'),
+        (Carrito, f'usuario_id IN ({en_ids})'),
+    ]
+
+    borradas = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Los DELETE directos no emiten señales: los reportes se invalidan a mano
+        transaction.on_commit(reportes.invalidar)
+        # Direcciones y tarjetas candidatas a quedar huérfanas (del perfil y de los pedidos)
+        cursor.execute(
+            f'SELECT direccion_id, metodo_pago_id FROM {_tabla(Usuario)} WHERE id IN ({en_ids}) '
+            f'UNION SELECT direccion_envio_id, metodo_pago_id FROM {_tabla(Pedido)} '
+            f'WHERE usuario_id IN ({en_ids})',
+            ids + ids,
+        )
+        filas = cursor.fetchall()
+        direcciones = sorted({d for d, _ in filas if d is not None})
+        pagos = sorted({p for _, p in filas if p is not None})
+
+        for Model, condicion in pasos:
+            cursor.execute(f'DELETE FROM {_tabla(Model)} WHERE {condicion}', ids)
+            borradas[Model._meta.db_table] = cursor.rowcount
+        cursor.execute(f'DELETE FROM {_tabla(Usuario)} WHERE id IN ({en_ids})', ids)
+        borradas[Usuario._meta.db_table] = cursor.rowcount
+
+        # Solo se borran si ningún otro usuario o pedido las sigue usando
+        for Model, candidatas, referencias in [
+            (Direccion, direcciones, [(Usuario, 'direccion_id'), (Pedido, 'direccion_envio_id')]),
+            (MetodoPago, pagos, [(Usuario, 'metodo_pago_id'), (Pedido, 'metodo_pago_id')]),
+        ]:
+            if not candidatas:
+                borradas[Model._meta.db_table] = 0
+                continue
+            en_candidatas = ', '.join(['%s'] * len(candidatas))
+            sin_uso = ' AND '.join(
+                f'NOT EXISTS (SELECT 1 FROM {_tabla(Ref)} r WHERE r.{columna} = {_tabla(Model)}.id)'
+                for Ref, columna in referencias
+            )
+            cursor.execute(
+                f'DELETE FROM {_tabla(Model)} WHERE id IN ({en_candidatas}) AND {sin_uso}',
+                candidatas,
+            )
+            borradas[Model._meta.db_table] = cursor.rowcount
+    return borradas
+
+
+def borrar_pedidos(pedido_ids):
+    """
+    Borra pedidos con sus detalles, historial de estados y claves de idempotencia usando DELETEs por
+    conjunto. Debe llamarse dentro de una transacción. No toca los contadores
+    del usuario (quien llama decide si corresponde).
+    """
+    ids = list(pedido_ids)
+    if not ids:
+        return 0
+    en_ids = ', '.join(['%s'] * len(ids))
+    transaction.on_commit(reportes.invalidar)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {_tabla(DetallePedido)} WHERE pedido_id IN ({en_ids})', ids)
+        cursor.execute(f'DELETE FROM {_tabla(ClaveIdempotencia)} WHERE pedido_id IN ({en_ids})', ids)
+        cursor.execute(f'DELETE FROM {_tabla(HistorialEstadoPedido)} WHERE pedido_id IN ({en_ids})', ids)
+        cursor.execute(f'DELETE FROM {_tabla(Pedido)} WHERE id IN ({en_ids})', ids)
+        return cursor.rowcount
@@ -0,0 +1,171 @@
+"""
+Operaciones sobre el carrito de la sesión y foto del carrito para el checkout.
+
+Las operaciones (agregar, actualizar, eliminar) solo modifican el diccionario
+de la sesión; los productos inexistentes se descartan después, al armar el
+carrito con una sola consulta (_get_cart_data).
+
+El resumen del pedido toma una foto de las
+líneas con sus precios y una versión (hash del contenido); la confirmación
+cobra exactamente esa foto después de comprobar, con una sola consulta, que
+los precios no cambiaron. Si algo cambió no se cobra: se regresa
+al resumen, que muestra qué cambió contra la foto anterior. Cualquier cambio
+que hace el usuario en el carrito descarta la foto (descartar_foto): lo que
+quitó o cambió él mismo no se avisa como cambio del catálogo.
+"""
+import hashlib
+import json
+from decimal import Decimal
+
+from django.db.models import CharField, Value
+
+from .catalogo import MODELOS
+
+# Clave de la sesión donde vive la foto del último resumen mostrado
+CLAVE_SESION = 'checkout_foto'
+
+# Máximo de operaciones aceptadas en una sola petición a la API del carrito
+MAX_OPERACIONES = 50
+
+
+class OperacionInvalida(ValueError):
+    """Operación de carrito mal formada (tipo, producto o cantidad inválidos)."""
+
+
+def _cantidad(valor, minimo):
+    try:
+        cantidad = int(valor)
+    except (TypeError, ValueError):
+        raise OperacionInvalida('cantidad inválida')
+    if cantidad < minimo:
+        raise OperacionInvalida('cantidad inválida')
+    return cantidad
+
+
+def aplicar_operacion(cart, operacion):
+    """
+    Aplica una operación al carrito (dict de la sesión) y devuelve la clave de
+    la línea afectada. `operacion` es un dict con 'op' y:
+      - agregar: 'type', 'id', 'cantidad' (opcional, 1 por defecto)
+      - actualizar: 'key', 'cantidad' (0 elimina la línea)
+      - eliminar: 'key'
+    """
+    op = operacion.get('op')
+    if op == 'agregar':
+        tipo = str(operacion.get('type', '')).lower()
+        if tipo not in MODELOS:
+            raise OperacionInvalida('tipo de producto inválido')
+        try:
+            product_id = int(operacion.get('id'))
+        except (TypeError, ValueError):
+            raise OperacionInvalida('producto inválido')
+        cantidad = _cantidad(operacion.get('cantidad', 1), 1)
+        key = f'{tipo}_{product_id}'
+        if key in cart:
+            cart[key]['qty'] += cantidad
+        else:
+            cart[key] = {'id': product_id, 'type': tipo, 'qty': cantidad}
+        return key
+
+    key = operacion.get('key')
+    if op == 'actualizar':
+        cantidad = _cantidad(operacion.get('cantidad'), 0)
+        if key in cart:
+            if cantidad == 0:
+                del cart[key]
+            else:
+                cart[key]['qty'] = cantidad
+        return key
+    if op == 'eliminar':
+        cart.pop(key, None)
+        return key
+    raise OperacionInvalida('operación desconocida')
+
+
+def _version(lineas):
+    contenido = json.dumps(lineas, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(contenido.encode()).hexdigest()[:16]
+
+
+def tomar_foto(cart_items):
+    """Foto serializable (cabe en la sesión) de las líneas de _get_cart_data."""
+    lineas = [
+        {
+            'key': item['key'],
+            'type': item['type'],
+            'id': item['id'],
+            'cantidad': item['cantidad'],
+            'precio': str(item['precio_unitario']),
+            'nombre': item['nombre'],
+        }
+        for item in cart_items
+    ]
+    total = sum((Decimal(l['precio']) * l['cantidad'] for l in lineas), Decimal('0.00'))
+    return {'lineas': lineas, 'total': str(total), 'version': _version(lineas)}
+
+
+def descartar_foto(session):
+    """Olvida la foto del último resumen; llamar cada vez que el usuario cambia el carrito."""
+    session.pop(CLAVE_SESION, None)
+
+
+def coincide_con_carrito(foto, cart):
+    """True si el carrito de la sesión tiene los mismos productos y cantidades que la foto."""
+    return {l['key']: l['cantidad'] for l in foto['lineas']} == {k: i['qty'] for k, i in cart.items()}
+
+
+def comparar(anterior, nueva):
+    """
+    Cambios de la foto `anterior` a la `nueva`: precios distintos y productos
+    que ya no están. Lista de {'nombre', 'antes', 'ahora'} ('ahora' es None si
+    el producto desapareció).
+
+    Entre las dos fotos el usuario no tocó el carrito (si lo hace se descarta
+    la foto), así que una línea que falta es un producto que se borró del
+    catálogo. Si la foto no corresponde al mismo carrito (líneas nuevas o con
+    otra cantidad), está vieja y no se compara.
+    """
+    if not anterior:
+        return []
+    cantidades = {l['key']: l['cantidad'] for l in anterior['lineas']}
+    actuales = {l['key']: l for l in nueva['lineas']}
+    if any(cantidades.get(key) != l['cantidad'] for key, l in actuales.items()):
+        return []
+    cambios = []
+    for linea in anterior['lineas']:
+        actual = actuales.get(linea['key'])
+        if actual is None:
+            cambios.append({'nombre': linea['nombre'], 'antes': Decimal(linea['precio']), 'ahora': None})
+        elif actual['precio'] != linea['precio']:
+            cambios.append({
+                'nombre': linea['nombre'],
+                'antes': Decimal(linea['precio']),
+                'ahora': Decimal(actual['precio']),
+            })
+    return cambios
+
+
+def precios_cambiados(foto):
+    """
+    Compara los precios de la foto contra la BD con una sola consulta (UNION
+    ALL de id y precio de cada tipo de producto). Devuelve True si alguno
+    cambió o ya no existe.
+    """
+    ids_por_tipo = {}
+    for linea in foto['lineas']:
+        ids_por_tipo.setdefault(linea['type'], set()).add(linea['id'])
+
+    consultas = [
+        MODELOS[tipo].objects.filter(pk__in=ids).order_by()
+        .annotate(tipo_producto=Value(tipo, output_field=CharField()))
+        .values_list('tipo_producto', 'pk', 'precio')
+        for tipo, ids in ids_por_tipo.items()
+    ]
+    precios = {}
+    if consultas:
+        filas = consultas[0].union(*consultas[1:], all=True) if len(consultas) > 1 else consultas[0]
+        precios = {(tipo, pk): precio for tipo, pk, precio in filas}
+
+    return any(
+        precios.get((l['type'], l['id'])) != Decimal(l['precio']) for l in foto['lineas']
+    )
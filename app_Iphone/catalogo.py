@@ -0,0 +1,59 @@
+"""
+Caché del catálogo por categoría. Las páginas de categoría leen la lista de
+productos de aquí en lugar de consultar la tabla en cada petición. Guardar o
+borrar un producto cambia la versión del catálogo (las entradas viejas dejan de
+estar vigentes); además cada entrada vence a los CATALOGO_CACHE_SEGUNDOS, que es
+el máximo que otro proceso puede tardar en ver un cambio. Al recalcular una
+categoría solo una petición consulta la BD; las demás reciben la lista
+anterior mientras tanto (ver vuelo_unico.py).
+
+Nota: las existencias (stock) de estos objetos pueden estar desfasadas; el
+carrito y el checkout siempre las leen de la BD.
+"""
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+
+from . import vuelo_unico
+from .models import Celular, Laptop, Tablet, Airpod, Accesorio
+from .replicas import usar_replica
+
+MODELOS = {
+    'celular': Celular,
+    'laptop': Laptop,
+    'tablet': Tablet,
+    'airpod': Airpod,
+    'accesorio': Accesorio,
+}
+
+
+def version():
+    """Versión vigente del catálogo; cambia con cada alta, edición o baja de producto."""
+    return vuelo_unico.version('catalogo')
+
+
+def productos(tipo):
+    """Lista de productos de la categoría `tipo`, desde la caché si está vigente."""
+    # Lo leído de una réplica se guarda aparte: quien acaba de escribir lee del
+    # primario y no debe recibir una copia atrasada
+    origen = 'replica' if usar_replica.get() else 'primario'
+    return vuelo_unico.obtener(
+        f'catalogo:{tipo}:{origen}',
+        lambda: list(MODELOS[tipo].objects.all()),
+        getattr(settings, 'CATALOGO_CACHE_SEGUNDOS', 60),
+        version=version(),
+    )
+
+
+def invalidar(**kwargs):
+    """Descarta todo el catálogo en caché (se llama al guardar o borrar productos)."""
+    vuelo_unico.nueva_version('catalogo')
+
+
+def precargar():
+    """Llena la caché de todas las categorías. Devuelve cuántos productos cargó."""
+    return sum(len(productos(tipo)) for tipo in MODELOS)
+
+
+for _modelo in MODELOS.values():
+    post_save.connect(invalidar, sender=_modelo, dispatch_uid=f'catalogo_{_modelo.__name__}_save')
+    post_delete.connect(invalidar, sender=_modelo, dispatch_uid=f'catalogo_{_modelo.__name__}_delete')
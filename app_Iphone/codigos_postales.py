@@ -0,0 +1,78 @@
+"""
+Consulta de códigos postales para autollenar la dirección del checkout.
+
+La tabla CodigoPostal se carga desde un CSV con el comando
+importar_codigos_postales. Cada código consultado se guarda en la caché
+(también los que no existen), así que el checkout solo toca la BD la primera
+vez que alguien escribe ese código; una nueva importación cambia la versión y
+descarta todo lo guardado.
+"""
+import re
+
+from django.conf import settings
+
+from . import vuelo_unico
+from .models import CodigoPostal
+
+_NO_ALFANUMERICO = re.compile(r'[^0-9A-Za-z]+')
+
+
+def normalizar(codigo):
+    """' 06-500 ' -> '06500'."""
+    return _NO_ALFANUMERICO.sub('', codigo or '').upper()[:10]
+
+
+def invalidar():
+    """Descarta las consultas guardadas (se llama al terminar una importación)."""
+    vuelo_unico.nueva_version('codigos_postales')
+
+
+def _consultar(codigo):
+    filas = list(
+        CodigoPostal.objects.filter(codigo=codigo).order_by('colonia')
+        .values_list('colonia', 'ciudad', 'estado', 'pais')
+    )
+    if not filas:
+        return {}  # También se guarda: un código inexistente no vuelve a consultar
+    _, ciudad, estado, pais = filas[0]
+    return {
+        'codigo': codigo,
+        'colonias': [colonia for colonia, _, _, _ in filas],
+        'ciudad': ciudad,
+        'estado': estado,
+        'pais': pais,
+    }
+
+
+def buscar(codigo):
+    """{'codigo', 'colonias', 'ciudad', 'estado', 'pais'} o None si el código no existe."""
+    codigo = normalizar(codigo)
+    if not codigo:
+        return None
+    datos = vuelo_unico.obtener(
+        f'codigo_postal:{codigo}',
+        lambda: _consultar(codigo),
+        getattr(settings, 'CODIGOS_POSTALES_CACHE_SEGUNDOS', 86400),
+        version=vuelo_unico.version('codigos_postales'),
+    )
+    return datos or None
+
+
+def normalizar_direccion(direccion):
+    """
+    Ajusta código, colonia, ciudad y país de una Direccion a como aparecen en
+    la tabla (mismo texto para la misma colonia). Si el código o la colonia no
+    están en la tabla se deja lo que escribió el usuario.
+    """
+    datos = buscar(direccion.codigo_postal)
+    if datos is None:
+        return direccion
+    direccion.codigo_postal = datos['codigo']
+    direccion.ciudad = datos['ciudad']
+    direccion.pais = datos['pais']
+    escrita = ' '.join((direccion.colonia or '').split()).casefold()
+    for colonia in datos['colonias']:
+        if colonia.casefold() == escrita:
+            direccion.colonia = colonia
+            break
+    return direccion
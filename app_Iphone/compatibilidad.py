@@ -0,0 +1,129 @@
+"""
+Índice de compatibilidad entre accesorios y dispositivos.
+
+Accesorio.modelo_compatible es texto libre ("iPhone 15, 15 Pro / AirPods
+Pro"). Al guardar un accesorio se separa en modelos, se normaliza cada uno
+(minúsculas, sin acentos ni signos) y se guarda un renglón por modelo en
+CompatibilidadAccesorio. Un dispositivo (Celular, Tablet, Laptop o Airpod) es
+compatible si su `modelo` normalizado coincide, así que los accesorios de una
+página completa de dispositivos salen de una sola consulta por el índice.
+"""
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from . import catalogo, vuelo_unico
+from .models import Accesorio, CompatibilidadAccesorio
+from .replicas import usar_replica
+
+# Separadores de la lista de modelos: "A, B", "A / B", "A y B", "A & B"...
+_SEPARADORES = re.compile(r'\s*(?:[,;/|&]|\by\b|\band\b)\s*', re.IGNORECASE)
+_NO_ALFANUMERICO = re.compile(r'[^a-z0-9]+')
+
+# Accesorios mostrados por dispositivo en las páginas de categoría
+MAX_POR_DISPOSITIVO = 3
+
+
+def normalizar(texto):
+    """'iPhone 15 Pro Máx' -> 'iphone 15 pro max'."""
+    sin_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return _NO_ALFANUMERICO.sub(' ', sin_acentos.lower()).strip()
+
+
+def modelos_compatibles(texto):
+    """
+    Modelos normalizados mencionados en `texto`. Un fragmento que empieza con
+    número hereda la marca del anterior: 'iPhone 15 / 15 Pro' ->
+    {'iphone 15', 'iphone 15 pro'}.
+    """
+    modelos = set()
+    marca = ''
+    for fragmento in _SEPARADORES.split(texto or ''):
+        nombre = normalizar(fragmento)
+        if not nombre:
+            continue
+        if nombre[0].isdigit() and marca:
+            nombre = f'{marca} {nombre}'
+        else:
+            marca = nombre.split()[0]
+        modelos.add(nombre[:100])
+    return modelos
+
+
+def indexar(accesorio):
+    """Reemplaza los renglones del índice de un accesorio."""
+    with transaction.atomic():
+        CompatibilidadAccesorio.objects.filter(accesorio=accesorio).delete()
+        CompatibilidadAccesorio.objects.bulk_create([
+            CompatibilidadAccesorio(accesorio=accesorio, modelo=modelo)
+            for modelo in modelos_compatibles(accesorio.modelo_compatible)
+        ])
+
+
+def reindexar(lote=1000):
+    """Reconstruye el índice completo (p. ej. después de un bulk_create). Devuelve cuántos renglones guardó."""
+    renglones = 0
+    with transaction.atomic():
+        CompatibilidadAccesorio.objects.all().delete()
+        accesorios = Accesorio.objects.values_list('pk', 'modelo_compatible').iterator(chunk_size=lote)
+        pendientes = []
+        for accesorio_id, texto in accesorios:
+            pendientes += [
+                CompatibilidadAccesorio(accesorio_id=accesorio_id, modelo=modelo)
+                for modelo in modelos_compatibles(texto)
+            ]
+            if len(pendientes) >= lote:
+                renglones += len(CompatibilidadAccesorio.objects.bulk_create(pendientes))
+                pendientes = []
+        renglones += len(CompatibilidadAccesorio.objects.bulk_create(pendientes))
+    catalogo.invalidar()
+    return renglones
+
+
+def accesorios_para(dispositivos, limite=MAX_POR_DISPOSITIVO):
+    """
+    {pk del dispositivo: [Accesorio, ...]} para una lista de dispositivos del
+    mismo tipo, con una sola consulta.
+    """
+    por_modelo = defaultdict(list)
+    for dispositivo in dispositivos:
+        por_modelo[normalizar(dispositivo.modelo)].append(dispositivo.pk)
+    if not por_modelo:
+        return {}
+
+    resultado = defaultdict(list)
+    renglones = (
+        CompatibilidadAccesorio.objects.filter(modelo__in=por_modelo)
+        .select_related('accesorio').order_by('modelo', 'accesorio_id')
+    )
+    for renglon in renglones:
+        for pk in por_modelo[renglon.modelo]:
+            if len(resultado[pk]) < limite:
+                resultado[pk].append(renglon.accesorio)
+    return dict(resultado)
+
+
+def por_categoria(tipo):
+    """accesorios_para() de todos los productos de la categoría, en caché con el catálogo."""
+    dispositivos = catalogo.productos(tipo)
+    origen = 'replica' if usar_replica.get() else 'primario'
+    return vuelo_unico.obtener(
+        f'compatibilidad:{tipo}:{origen}',
+        lambda: accesorios_para(dispositivos),
+        getattr(settings, 'CATALOGO_CACHE_SEGUNDOS', 60),
+        version=catalogo.version(),
+    )
+
+
+def _al_guardar_accesorio(sender, instance, **kwargs):
+    indexar(instance)
+    # La señal del catálogo ya cambió la versión antes de escribir el índice;
+    # se cambia otra vez para que nadie guarde en caché el índice anterior
+    catalogo.invalidar()
+
+
+post_save.connect(_al_guardar_accesorio, sender=Accesorio, dispatch_uid='compatibilidad_accesorio_save')
@@ -0,0 +1,76 @@
+"""
+Flujo de estados del pedido: Pendiente -> (Procesando) -> Enviado ->
+Entregado, con Cancelado posible antes de la entrega (Pedido.TRANSICIONES).
+
+Los cambios son por conjuntos: "marcar estos 500 pedidos como enviados" es
+una lectura de los estados actuales, un UPDATE condicional por estado de
+origen (solo cambia los pedidos que siguen en un estado desde el que el paso
+es válido) y un bulk_create del historial, en la misma transacción. Los
+pedidos que no admiten el paso se devuelven como rechazados, sin tocarlos.
+El historial es también el canal de los avisos en vivo (eventos_pedido).
+"""
+from django.db import transaction
+
+from .models import HistorialEstadoPedido, Pedido
+
+# Tamaño de los grupos de ids por sentencia (límite de parámetros de SQLite)
+LOTE = 500
+
+
+class TransicionInvalida(ValueError):
+    """Estado destino desconocido o no alcanzable desde el estado actual."""
+
+
+def origenes(nuevo):
+    """Estados desde los que se puede pasar a `nuevo`."""
+    if nuevo not in Pedido.TRANSICIONES:
+        raise TransicionInvalida(f'Estado desconocido: {nuevo}')
+    return [estado for estado, siguientes in Pedido.TRANSICIONES.items() if nuevo in siguientes]
+
+
+def transicionar(pedido_ids, nuevo):
+    """
+    Pasa los pedidos indicados a `nuevo`. Devuelve (ids actualizados, ids
+    rechazados); los rechazados no existen o su estado no admite el paso.
+    """
+    permitidos = origenes(nuevo)
+    ids = sorted({int(pk) for pk in pedido_ids})
+    actualizados = []
+    with transaction.atomic():
+        for inicio in range(0, len(ids), LOTE):
+            grupo = ids[inicio:inicio + LOTE]
+            por_estado = {}
+            filas = (
+                Pedido.objects.select_for_update()
+                .filter(pk__in=grupo, estado__in=permitidos).values_list('pk', 'estado')
+            )
+            for pk, estado in filas:
+                por_estado.setdefault(estado, []).append(pk)
+
+            historial = []
+            for estado, pks in por_estado.items():
+                # Condicional: si otro proceso ya lo movió, no se sobrescribe
+                cambiados = Pedido.objects.filter(pk__in=pks, estado=estado).update(estado=nuevo)
+                if cambiados != len(pks):
+                    # Sin select_for_update (SQLite) se relee cuáles cambiaron de verdad
+                    pks = list(Pedido.objects.filter(pk__in=pks, estado=nuevo).values_list('pk', flat=True))
+                historial += [
+                    HistorialEstadoPedido(pedido_id=pk, estado_anterior=estado, estado_nuevo=nuevo)
+                    for pk in pks
+                ]
+                actualizados += pks
+            HistorialEstadoPedido.objects.bulk_create(historial)
+
+    hechos = set(actualizados)
+    return sorted(hechos), [pk for pk in ids if pk not in hechos]
+
+
+def cola(estado, limite=200):
+    """Pedidos en `estado`, del más antiguo al más nuevo (usa el índice estado+fecha)."""
+    if estado not in Pedido.TRANSICIONES:
+        raise TransicionInvalida(f'Estado desconocido: {estado}')
+    return (
+        Pedido.objects.filter(estado=estado).select_related('usuario')
+        .only('id', 'fecha_pedido', 'total', 'estado', 'usuario__nombre')
+        .order_by('fecha_pedido', 'id')[:limite]
+    )
@@ -0,0 +1,197 @@
+"""
+Avisos en vivo del estado de los pedidos (Server-Sent Events).
+
+El canal compartido entre procesos es la tabla HistorialEstadoPedido: cada
+cambio de estado (estados_pedido.transicionar) deja ahí un renglón con id
+creciente, sin importar qué trabajador lo hizo. En cada proceso ASGI una sola
+tarea revisa la tabla cada PEDIDOS_EVENTOS_SONDEO_SEGUNDOS (una consulta por
+el índice del id, no una por conexión) y reparte los renglones nuevos a las
+asyncio.Queue de las conexiones del dueño del pedido. Las conexiones
+inactivas solo esperan en su cola y mandan un latido de vez en cuando para
+que los proxies no las cierren.
+
+Cada evento lleva como id el del historial (y el flujo arranca con el id
+vigente): al reconectarse, el navegador manda Last-Event-ID y recibe lo que
+cambió mientras estuvo desconectado. Un cliente que no lee y llena su cola
+(PEDIDOS_EVENTOS_MAX_PENDIENTES) no pierde avisos: se le cierra el flujo y
+al reconectarse los recupera del historial.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Max
+
+from .models import HistorialEstadoPedido
+
+logger = logging.getLogger(__name__)
+
+# Renglones del historial leídos por revisión y reenviados al reconectarse
+LOTE = 500
+
+# {usuario_id: {(loop, cola), ...}}
+_suscriptores = defaultdict(set)
+# {loop: tarea de sondeo}; una por event loop mientras haya conexiones
+_sondeos = {}
+_candado = threading.Lock()
+# Último id del historial ya repartido en este proceso
+_ultimo = None
+# Marca en la cola de una conexión desbordada: el flujo se cierra
+_DESBORDE = object()
+
+
+def suscribir(usuario_id):
+    """Registra una cola en el event loop actual; devuelve la suscripción para cancelar()."""
+    loop = asyncio.get_running_loop()
+    cola = asyncio.Queue(maxsize=getattr(settings, 'PEDIDOS_EVENTOS_MAX_PENDIENTES', 100))
+    suscripcion = (loop, cola)
+    with _candado:
+        _suscriptores[usuario_id].add(suscripcion)
+        if loop not in _sondeos:
+            _sondeos[loop] = loop.create_task(_sondear())
+    return suscripcion
+
+
+def cancelar(usuario_id, suscripcion):
+    loop, _ = suscripcion
+    with _candado:
+        colas = _suscriptores.get(usuario_id)
+        if colas is not None:
+            colas.discard(suscripcion)
+            if not colas:
+                del _suscriptores[usuario_id]
+        # Sin conexiones en este loop, la tarea de sondeo termina
+        if not any(l is loop for colas in _suscriptores.values() for l, _ in colas):
+            tarea = _sondeos.pop(loop, None)
+            if tarea is not None:
+                tarea.cancel()
+
+
+def conexiones():
+    """Conexiones abiertas en este proceso."""
+    with _candado:
+        return sum(len(colas) for colas in _suscriptores.values())
+
+
+def _entregar(cola, evento):
+    try:
+        cola.put_nowait(evento)
+    except asyncio.QueueFull:
+        # Cliente que no lee: en vez de descartar avisos se le cierra el flujo;
+        # EventSource se reconecta con Last-Event-ID y los lee del historial
+        logger.warning('Eventos de pedidos: cola llena, se cierra la conexión (evento %s)', evento['id'])
+        while not cola.empty():
+            cola.get_nowait()
+        cola.put_nowait(_DESBORDE)
+
+
+def publicar(cambios):
+    """
+    Avisa los cambios [(id, usuario_id, pedido_id, estado), ...] a las
+    conexiones de cada usuario en este proceso. Se puede llamar desde cualquier hilo.
+    """
+    with _candado:
+        destinos = [
+            (suscripcion, {'id': id_, 'pedido': pedido_id, 'estado': estado})
+            for id_, usuario_id, pedido_id, estado in cambios
+            for suscripcion in _suscriptores.get(usuario_id, ())
+        ]
+    for (loop, cola), evento in destinos:
+        try:
+            loop.call_soon_threadsafe(_entregar, cola, evento)
+        except RuntimeError:
+            pass  # El loop de esa conexión ya se cerró
+
+
+def _cambios(desde, usuario_id=None):
+    consulta = HistorialEstadoPedido.objects.filter(id__gt=desde)
+    if usuario_id is not None:
+        consulta = consulta.filter(pedido__usuario_id=usuario_id)
+    return list(
+        consulta.order_by('id')
+        .values_list('id', 'pedido__usuario_id', 'pedido_id', 'estado_nuevo')[:LOTE]
+    )
+
+
+def _ultimo_id():
+    return HistorialEstadoPedido.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+
+
+async def iniciar():
+    """Fija desde dónde se reparte (solo la primera vez en el proceso)."""
+    global _ultimo
+    if _ultimo is None:
+        ultimo = await sync_to_async(_ultimo_id)()
+        if _ultimo is None:
+            _ultimo = ultimo
+
+
+async def revisar():
+    """Una revisión del historial: reparte los cambios nuevos. Devuelve cuántos encontró."""
+    global _ultimo
+    await iniciar()
+    cambios = await sync_to_async(_cambios)(_ultimo)
+    if cambios:
+        _ultimo = max(_ultimo, cambios[-1][0])
+        publicar(cambios)
+    return len(cambios)
+
+
+async def _sondear():
+    segundos = getattr(settings, 'PEDIDOS_EVENTOS_SONDEO_SEGUNDOS', 1)
+    while True:
+        await asyncio.sleep(segundos)
+        try:
+            # Fuera de una petición nadie más cierra las conexiones viejas
+            await sync_to_async(close_old_connections)()
+            await revisar()
+        except Exception:
+            logger.exception('Eventos de pedidos: falló la revisión del historial')
+
+
+def _formato(evento):
+    datos = json.dumps({'pedido': evento['pedido'], 'estado': evento['estado']})
+    return f"id: {evento['id']}\nevent: estado\ndata: {datos}\n\n"
+
+
+async def flujo(usuario_id, ultimo_visto=None):
+    """
+    Cuerpo de la respuesta SSE: primero lo que cambió después de `ultimo_visto`
+    (Last-Event-ID al reconectarse), luego un evento 'estado' por cambio y
+    latidos mientras no haya cambios. Termina si la cola se desborda.
+    """
+    latido = getattr(settings, 'PEDIDOS_EVENTOS_LATIDO_SEGUNDOS', 25)
+    await iniciar()
+    suscripcion = suscribir(usuario_id)
+    _, cola = suscripcion
+    try:
+        # Si se corta la conexión, el navegador reintenta a los 5 s. El id
+        # inicial es desde dónde se pone al día si se reconecta sin haber
+        # recibido ningún evento.
+        enviado = _ultimo if ultimo_visto is None else ultimo_visto
+        yield f'retry: 5000\nid: {enviado}\n\n'
+        if ultimo_visto is not None:
+            while True:
+                cambios = await sync_to_async(_cambios)(enviado, usuario_id)
+                for id_, _, pedido_id, estado in cambios:
+                    enviado = id_
+                    yield _formato({'id': id_, 'pedido': pedido_id, 'estado': estado})
+                if len(cambios) < LOTE:
+                    break
+        while True:
+            try:
+                evento = await asyncio.wait_for(cola.get(), timeout=latido)
+            except asyncio.TimeoutError:
+                yield ': latido\n\n'
+                continue
+            if evento is _DESBORDE:
+                return
+            if evento['id'] > enviado:  # Ya enviado al ponerse al día
+                yield _formato(evento)
+    finally:
+        cancelar(usuario_id, suscripcion)
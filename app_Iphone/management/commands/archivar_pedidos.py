@@ -0,0 +1,41 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app_Iphone.archivo import archivar_lote, pedidos_archivables
+
+
+class Command(BaseCommand):
+    help = (
+        "Mueve los pedidos entregados más viejos que N días a la tabla de archivo "
+        "(PedidoArchivado), en transacciones cortas por lote."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=365, help='Antigüedad mínima del pedido.')
+        parser.add_argument('--estado', default='Entregado', help='Estado de los pedidos a archivar.')
+        parser.add_argument('--lote', type=int, default=500, help='Pedidos por transacción.')
+        parser.add_argument('--pausa', type=float, default=0.1,
+                            help='Segundos de espera entre lotes.')
+        parser.add_argument('--simular', action='store_true',
+                            help='Solo cuenta los pedidos que se archivarían.')
+
+    def handle(self, *args, **options):
+        antes_de = timezone.now() - timedelta(days=options['dias'])
+
+        if options['simular']:
+            total = pedidos_archivables(antes_de, options['estado']).count()
+            self.stdout.write(f'{total} pedidos por archivar (anteriores a {antes_de:%Y-%m-%d}).')
+            return
+
+        total = 0
+        while True:
+            movidos = archivar_lote(antes_de, options['estado'], options['lote'])
+            if not movidos:
+                break
+            total += movidos
+            self.stdout.write(f'{total} pedidos archivados...')
+            time.sleep(options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f'{total} pedidos archivados.'))
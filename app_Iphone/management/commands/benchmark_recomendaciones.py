@@ -0,0 +1,145 @@
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from app_Iphone.benchmark import CATEGORIAS, generar_datos
+from app_Iphone.models import DetallePedido, Pedido
+from app_Iphone.recomendaciones import contar_activos, recalcular
+
+# Filas por INSERT al generar los pedidos
+LOTE = 20000
+
+
+def _tabla(Model):
+    return connection.ops.quote_name(Model._meta.db_table)
+
+
+def _generar_lineas(usuario_id, catalogo, lineas, max_por_pedido, rnd):
+    """
+    Inserta pedidos con 1..max_por_pedido líneas hasta llegar a `lineas`. La
+    popularidad de los productos sigue una curva de Zipf (unos cuantos se
+    venden mucho), como en una tienda real. Devuelve cuántos pedidos creó.
+    """
+    productos = [
+        (tipo, producto_id, precio)
+        for tipo in CATEGORIAS for producto_id, precio in catalogo[tipo]
+    ]
+    rnd.shuffle(productos)
+    pesos = [1 / (posicion + 1) for posicion in range(len(productos))]
+    columnas_fk = [f'{tipo}_id' for tipo in CATEGORIAS]
+
+    insertar_pedido = (
+        f'INSERT INTO {_tabla(Pedido)} (id, usuario_id, fecha_pedido, total, estado) '
+        'VALUES (%s, %s, %s, %s, %s)'
+    )
+    insertar_linea = (
+        f'INSERT INTO {_tabla(DetallePedido)} (pedido_id, cantidad, precio_unitario, '
+        f'producto_nombre, categoria, sku, {", ".join(columnas_fk)}) '
+        f'VALUES ({", ".join(["%s"] * (6 + len(columnas_fk)))})'
+    )
+    ahora = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {_tabla(Pedido)}')
+        pedido_id = cursor.fetchone()[0]
+    creados = 0
+    pendientes = lineas
+    while pendientes > 0:
+        pedidos, filas = [], []
+        while len(filas) < LOTE and pendientes > 0:
+            pedido_id += 1
+            pedidos.append((pedido_id, usuario_id, ahora, 0, Pedido.ENTREGADO))
+            n = min(rnd.randint(1, max_por_pedido), pendientes)
+            for tipo, producto_id, precio in rnd.choices(productos, weights=pesos, k=n):
+                filas.append((
+                    pedido_id, 1, precio, f'{tipo} {producto_id}', tipo,
+                    DetallePedido.sku_para(tipo, producto_id),
+                    *[producto_id if columna == f'{tipo}_id' else None for columna in columnas_fk],
+                ))
+            pendientes -= n
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(insertar_pedido, pedidos)
+            cursor.executemany(insertar_linea, filas)
+        creados += len(pedidos)
+    return creados
+
+
+def _medir(funcion):
+    """(resultado, segundos, pico de memoria de Python en MB) de llamar a `funcion`."""
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = funcion()
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, round(segundos, 2), round(pico / 2 ** 20, 1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide la reconstrucción de recomendaciones con N líneas de pedido generadas en '
+        'una base temporal: tiempo del conteo en SQL y de la reconstrucción completa, '
+        'pares distintos y pico de memoria de Python.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lineas', type=int, default=1_000_000)
+        parser.add_argument('--productos', type=int, default=200, help='Productos por categoría.')
+        parser.add_argument('--max-por-pedido', type=int, default=6,
+                            help='Líneas máximas por pedido (cada pedido tiene de 1 a N).')
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--salida', help='Guarda el reporte JSON en este archivo.')
+
+    def handle(self, *args, **options):
+        # Nunca sobre db.sqlite3: una base temporal con datos generados
+        directorio = tempfile.TemporaryDirectory()
+        ruta_bd = os.path.join(directorio.name, 'recomendaciones.sqlite3')
+        connection.close()
+        settings.DATABASES['default']['NAME'] = ruta_bd
+        call_command('migrate', verbosity=0)
+        datos = generar_datos(
+            productos_por_categoria=options['productos'], usuarios=1, pedidos=0,
+            semilla=options['semilla'],
+        )
+
+        inicio = time.perf_counter()
+        pedidos = _generar_lineas(
+            datos['usuarios'][0].pk, datos['catalogo'], options['lineas'],
+            options['max_por_pedido'], random.Random(options['semilla']),
+        )
+        generacion = round(time.perf_counter() - inicio, 2)
+
+        (por_producto, juntos), conteo_s, conteo_mb = _medir(contar_activos)
+        pares = sum(len(vecinos) for vecinos in juntos.values()) // 2
+        del por_producto, juntos
+        filas, recalcular_s, recalcular_mb = _medir(recalcular)
+
+        connection.close()
+        reporte = {
+            'lineas': options['lineas'],
+            'pedidos': pedidos,
+            'productos': options['productos'] * len(CATEGORIAS),
+            'pares_distintos': pares,
+            'generacion_s': generacion,
+            'conteo_sql_s': conteo_s,
+            'conteo_memoria_mb': conteo_mb,
+            'recalcular_s': recalcular_s,
+            'recalcular_memoria_mb': recalcular_mb,
+            'recomendaciones': filas,
+            'tamano_bd_mb': round(os.path.getsize(ruta_bd) / 2 ** 20, 1),
+        }
+        directorio.cleanup()
+
+        texto = json.dumps(reporte, indent=2)
+        self.stdout.write(texto)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto)
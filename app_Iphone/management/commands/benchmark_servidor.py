@@ -0,0 +1,93 @@
+import importlib.util
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.urls import reverse
+
+from app_Iphone.benchmark import CATEGORIAS, generar_datos, medir_http
+
+
+def _esperar_puerto(puerto, limite=30):
+    fin = time.monotonic() + limite
+    while time.monotonic() < fin:
+        try:
+            socket.create_connection(('127.0.0.1', puerto), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f'El servidor no abrió el puerto {puerto}')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el rendimiento de `runserver` contra gunicorn (gunicorn.conf.py) "
+        "con peticiones GET reales a la portada y las categorías."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--puerto', type=int, default=8765)
+        parser.add_argument('--trabajadores', type=int, default=4)
+        parser.add_argument('--hilos', type=int, default=4)
+        parser.add_argument('--concurrencia', type=int, default=16)
+        parser.add_argument('--peticiones', type=int, default=1000)
+        parser.add_argument('--productos', type=int, default=20, help='Productos por categoría.')
+        parser.add_argument('--salida', help='Guarda el reporte JSON en este archivo.')
+
+    def handle(self, *args, **options):
+        if importlib.util.find_spec('gunicorn') is None:
+            raise CommandError('gunicorn no está instalado (pip install gunicorn).')
+        # Ambos servidores leen una base temporal con datos generados, nunca db.sqlite3
+        directorio = tempfile.TemporaryDirectory()
+        ruta_bd = os.path.join(directorio.name, 'benchmark.sqlite3')
+        settings.DATABASES['default']['NAME'] = ruta_bd
+        call_command('migrate', verbosity=0)
+        generar_datos(productos_por_categoria=options['productos'], usuarios=5, pedidos=20)
+        connections.close_all()
+        entorno = {
+            **os.environ, 'SQLITE_PATH': ruta_bd, 'GUNICORN_BIND': f'127.0.0.1:{options["puerto"]}',
+            'GUNICORN_WORKERS': str(options['trabajadores']), 'GUNICORN_THREADS': str(options['hilos']),
+        }
+
+        rutas = [reverse('tienda_index')] + [reverse(nombre) for _, nombre in CATEGORIAS.values()]
+        manage = str(settings.BASE_DIR / 'manage.py')
+        puerto = options['puerto']
+        servidores = {
+            'runserver': [sys.executable, manage, 'runserver', f'127.0.0.1:{puerto}', '--noreload'],
+            'gunicorn': [
+                sys.executable, '-m', 'gunicorn', '-c', str(settings.BASE_DIR / 'gunicorn.conf.py'),
+                '--chdir', str(settings.BASE_DIR),
+            ],
+        }
+
+        reporte = {}
+        for nombre, comando in servidores.items():
+            proceso = subprocess.Popen(
+                comando, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                _esperar_puerto(puerto)
+                medir_http('127.0.0.1', puerto, rutas, concurrencia=options['concurrencia'], peticiones=50)
+                reporte[nombre] = medir_http(
+                    '127.0.0.1', puerto, rutas,
+                    concurrencia=options['concurrencia'], peticiones=options['peticiones'],
+                )
+            finally:
+                proceso.terminate()
+                proceso.wait(timeout=60)
+        directorio.cleanup()
+        reporte['mejora_rps'] = round(reporte['gunicorn']['rps'] / reporte['runserver']['rps'], 2)
+
+        texto = json.dumps(reporte, indent=2)
+        self.stdout.write(texto)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto)
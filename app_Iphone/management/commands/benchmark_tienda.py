@@ -0,0 +1,69 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.utils import (
+    setup_databases, teardown_databases, setup_test_environment, teardown_test_environment
+)
+
+from app_Iphone.benchmark import (
+    generar_datos, ejecutar_benchmark, comparar_con_base, medir_limite_peticiones
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta el benchmark de la tienda sobre una base de datos temporal y "
+        "reporta rps, p50/p95/p99 y consultas por paso en JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=20, help='Productos por categoría.')
+        parser.add_argument('--usuarios', type=int, default=10)
+        parser.add_argument('--pedidos', type=int, default=50)
+        parser.add_argument('--iteraciones', type=int, default=20)
+        parser.add_argument('--semilla', type=int, default=1)
+        parser.add_argument('--salida', help='Guarda el reporte JSON en este archivo.')
+        parser.add_argument('--base', help='Reporte JSON previo contra el cual comparar.')
+        parser.add_argument('--tolerancia', type=float, default=0.10,
+                            help='Empeoramiento permitido del p95 respecto a la base (0.10 = 10%%).')
+        parser.add_argument('--limites', action='store_true',
+                            help='Agrega el sobrecosto del límite de peticiones al reporte.')
+
+    def handle(self, *args, **options):
+        # Nunca se toca la base de datos real: se crea una de pruebas desechable
+        setup_test_environment()
+        configuracion = setup_databases(verbosity=0, interactive=False)
+        # Las tareas posteriores al checkout quedan en la cola: no se mide su trabajo
+        tareas_externas = override_settings(TAREAS_EJECUCION='externa')
+        tareas_externas.enable()
+        try:
+            datos = generar_datos(
+                productos_por_categoria=options['productos'],
+                usuarios=options['usuarios'],
+                pedidos=options['pedidos'],
+                semilla=options['semilla'],
+            )
+            resultado = ejecutar_benchmark(
+                datos, iteraciones=options['iteraciones'], semilla=options['semilla']
+            )
+            if options['limites']:
+                resultado['limite_peticiones'] = medir_limite_peticiones(datos['usuarios'][0])
+        finally:
+            tareas_externas.disable()
+            teardown_databases(configuracion, verbosity=0)
+            teardown_test_environment()
+
+        reporte = json.dumps(resultado, indent=2, ensure_ascii=False)
+        self.stdout.write(reporte)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(reporte)
+
+        if options['base']:
+            with open(options['base'], encoding='utf-8') as archivo:
+                base = json.load(archivo)
+            regresiones = comparar_con_base(resultado, base, options['tolerancia'])
+            if regresiones:
+                raise CommandError('Regresiones contra la base:\n' + '\n'.join(regresiones))
+            self.stdout.write(self.style.SUCCESS('Sin regresiones contra la base.'))
@@ -0,0 +1,94 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from app_Iphone import codigos_postales
+from app_Iphone.models import CodigoPostal
+
+# Nombres de columna aceptados para cada campo (el propio y el de SEPOMEX)
+COLUMNAS = {
+    'codigo': ('codigo_postal', 'codigo', 'cp', 'd_codigo'),
+    'colonia': ('colonia', 'd_asenta'),
+    'ciudad': ('ciudad', 'd_ciudad'),
+    'municipio': ('municipio', 'd_mnpio'),
+    'estado': ('estado', 'd_estado'),
+    'pais': ('pais',),
+}
+
+
+def _posiciones(encabezado):
+    """{campo: índice de la columna} a partir del encabezado del CSV."""
+    normalizado = [columna.strip().lower() for columna in encabezado]
+    posiciones = {}
+    for campo, nombres in COLUMNAS.items():
+        for nombre in nombres:
+            if nombre in normalizado:
+                posiciones[campo] = normalizado.index(nombre)
+                break
+    faltantes = {'codigo', 'colonia'} - set(posiciones)
+    if not {'ciudad', 'municipio'} & set(posiciones):
+        faltantes.add('ciudad')
+    if faltantes:
+        raise CommandError(f"Faltan columnas en el CSV: {', '.join(sorted(faltantes))}")
+    return posiciones
+
+
+class Command(BaseCommand):
+    help = (
+        "Carga el catálogo de códigos postales desde un CSV local, leyéndolo "
+        "renglón por renglón e insertando por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del CSV (con encabezado).')
+        parser.add_argument('--delimitador', default=',', help="Separador de columnas (SEPOMEX usa '|').")
+        parser.add_argument('--codificacion', default='utf-8', help='Codificación del archivo (p. ej. latin-1).')
+        parser.add_argument('--pais', default='México', help='País si el CSV no trae la columna.')
+        parser.add_argument('--lote', type=int, default=5000, help='Renglones por inserción.')
+        parser.add_argument('--reemplazar', action='store_true',
+                            help='Borra la tabla antes de importar.')
+
+    def handle(self, *args, **options):
+        try:
+            archivo = open(options['archivo'], newline='', encoding=options['codificacion'])
+        except OSError as error:
+            raise CommandError(f'No se pudo abrir el archivo: {error}')
+
+        leidos = 0
+        with archivo, transaction.atomic():
+            lector = csv.reader(archivo, delimiter=options['delimitador'])
+            # SEPOMEX antepone un renglón de aviso: se busca el primero que parezca encabezado
+            for encabezado in lector:
+                if any(c.strip().lower() in COLUMNAS['codigo'] for c in encabezado):
+                    break
+            else:
+                raise CommandError('El CSV no tiene encabezado con la columna del código postal.')
+            posiciones = _posiciones(encabezado)
+
+            if options['reemplazar']:
+                CodigoPostal.objects.all().delete()
+
+            pendientes = []
+            for renglon in lector:
+                valores = {campo: renglon[i].strip() for campo, i in posiciones.items() if i < len(renglon)}
+                codigo = codigos_postales.normalizar(valores.get('codigo'))
+                if not codigo or not valores.get('colonia'):
+                    continue
+                pendientes.append(CodigoPostal(
+                    codigo=codigo, colonia=valores['colonia'][:100],
+                    # SEPOMEX deja la ciudad vacía fuera de zonas urbanas: se usa el municipio
+                    ciudad=(valores.get('ciudad') or valores.get('municipio', ''))[:100],
+                    estado=valores.get('estado', '')[:100],
+                    pais=valores.get('pais') or options['pais'],
+                ))
+                leidos += 1
+                if len(pendientes) >= options['lote']:
+                    CodigoPostal.objects.bulk_create(pendientes, ignore_conflicts=True)
+                    pendientes = []
+            CodigoPostal.objects.bulk_create(pendientes, ignore_conflicts=True)
+        codigos_postales.invalidar()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{leidos} renglones leídos; {CodigoPostal.objects.count()} colonias en la tabla.'
+        ))
@@ -0,0 +1,107 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Se ejecuta en un proceso nuevo (con -X importtime) para medir un arranque en frío
+_SCRIPT_ARRANQUE = '''
+import json, sys, time
+inicio = time.perf_counter()
+from backend_Iphone.wsgi import application
+listo = time.perf_counter()
+from wsgiref.util import setup_testing_defaults
+entorno = {'PATH_INFO': sys.argv[1], 'HTTP_HOST': 'localhost'}
+setup_testing_defaults(entorno)
+estado = []
+b''.join(application(entorno, lambda s, h, e=None: estado.append(s)))
+fin = time.perf_counter()
+print(json.dumps({
+    'arranque_ms': round((listo - inicio) * 1000, 2),
+    'primera_peticion_ms': round((fin - listo) * 1000, 2),
+    'estado': estado[0] if estado else None,
+}))
+'''
+
+# "import time: self [us] | cumulative | imported package"
+_LINEA_IMPORTTIME = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def _parsear_importtime(salida):
+    modulos = []
+    for linea in salida.splitlines():
+        encontrada = _LINEA_IMPORTTIME.match(linea)
+        if encontrada:
+            propio, acumulado, sangria, nombre = encontrada.groups()
+            modulos.append({
+                'modulo': nombre,
+                'propio_ms': int(propio) / 1000,
+                'acumulado_ms': int(acumulado) / 1000,
+                # La sangría indica quién lo importó; nivel 0 = importado directamente
+                'nivel': (len(sangria) - 1) // 2,
+            })
+    return modulos
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el arranque en frío de un trabajador: tiempo de importación por "
+        "módulo (-X importtime), tiempo hasta tener la app WSGI y la primera petición."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help='Módulos a mostrar.')
+        parser.add_argument('--ruta', default='/', help='Ruta de la primera petición.')
+        parser.add_argument('--precalentar', action='store_true',
+                            help='Mide con PRECALENTAR_AL_INICIAR=1.')
+        parser.add_argument('--json', action='store_true', help='Reporte en JSON.')
+
+    def handle(self, *args, **options):
+        entorno = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'backend_Iphone.settings')}
+        entorno['PRECALENTAR_AL_INICIAR'] = '1' if options['precalentar'] else '0'
+        proceso = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _SCRIPT_ARRANQUE, options['ruta']],
+            cwd=settings.BASE_DIR, env=entorno, capture_output=True, text=True,
+        )
+        if proceso.returncode != 0:
+            raise CommandError(proceso.stderr[-2000:])
+
+        tiempos = json.loads(proceso.stdout.strip().splitlines()[-1])
+        modulos = _parsear_importtime(proceso.stderr)
+        # El total de importación es la suma de los módulos de nivel superior
+        total_importacion = sum(m['acumulado_ms'] for m in modulos if m['nivel'] == 0)
+        por_paquete = {}
+        for m in modulos:
+            paquete = m['modulo'].split('.')[0]
+            por_paquete[paquete] = por_paquete.get(paquete, 0) + m['propio_ms']
+
+        reporte = {
+            **tiempos,
+            'importacion_total_ms': round(total_importacion, 2),
+            'modulos_importados': len(modulos),
+            'top_acumulado': sorted(modulos, key=lambda m: -m['acumulado_ms'])[:options['top']],
+            'top_propio': sorted(modulos, key=lambda m: -m['propio_ms'])[:options['top']],
+            'por_paquete_ms': dict(sorted(
+                ((p, round(ms, 2)) for p, ms in por_paquete.items()), key=lambda x: -x[1]
+            )[:options['top']]),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(reporte, indent=2, ensure_ascii=False))
+            return
+
+        self.stdout.write(
+            f"Arranque (hasta tener la app WSGI): {reporte['arranque_ms']} ms\n"
+            f"Primera petición {options['ruta']} ({reporte['estado']}): {reporte['primera_peticion_ms']} ms\n"
+            f"Importación: {reporte['importacion_total_ms']} ms en {reporte['modulos_importados']} módulos\n"
+        )
+        self.stdout.write('Módulos más costosos (acumulado):')
+        for m in reporte['top_acumulado']:
+            self.stdout.write(f"  {m['acumulado_ms']:>9.2f} ms  {'  ' * m['nivel']}{m['modulo']}")
+        self.stdout.write('Por paquete (tiempo propio):')
+        for paquete, ms in reporte['por_paquete_ms'].items():
+            self.stdout.write(f'  {ms:>9.2f} ms  {paquete}')
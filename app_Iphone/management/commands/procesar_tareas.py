@@ -0,0 +1,63 @@
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app_Iphone.tareas import Trabajador, procesar_pendientes
+
+
+def _ejecutar_trabajador(hilos, intervalo):
+    trabajador = Trabajador(hilos=hilos, intervalo=intervalo)
+    signal.signal(signal.SIGTERM, lambda *_: trabajador.detener.set())
+    try:
+        trabajador.ejecutar_para_siempre()
+    except KeyboardInterrupt:
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta las tareas en segundo plano (correos de confirmación, etc.) "
+        "con un pool de hilos y, opcionalmente, varios procesos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=2, help='Hilos por proceso.')
+        parser.add_argument('--procesos', type=int, default=1)
+        parser.add_argument('--intervalo', type=float, default=2.0,
+                            help='Segundos entre sondeos cuando no hay tareas.')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Procesa lo pendiente y termina.')
+
+    def handle(self, *args, **options):
+        if options['una_vez']:
+            procesadas = procesar_pendientes()
+            self.stdout.write(self.style.SUCCESS(f'{procesadas} tareas procesadas.'))
+            return
+
+        if options['procesos'] <= 1:
+            self.stdout.write(f"Procesando tareas con {options['hilos']} hilos (Ctrl+C para salir)...")
+            _ejecutar_trabajador(options['hilos'], options['intervalo'])
+            return
+
+        # Cada proceso abre sus propias conexiones; las heredadas no se comparten
+        connections.close_all()
+        procesos = [
+            multiprocessing.Process(
+                target=_ejecutar_trabajador, args=(options['hilos'], options['intervalo'])
+            )
+            for _ in range(options['procesos'])
+        ]
+        for proceso in procesos:
+            proceso.start()
+        self.stdout.write(
+            f"Procesando tareas con {options['procesos']} procesos x {options['hilos']} hilos..."
+        )
+        try:
+            for proceso in procesos:
+                proceso.join()
+        except KeyboardInterrupt:
+            for proceso in procesos:
+                proceso.terminate()
+                proceso.join()
@@ -0,0 +1,45 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from app_Iphone.borrado import borrar_usuarios
+from app_Iphone.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra las cuentas sin acceso ni pedidos en los últimos N días, en lotes "
+        "acotados (una transacción corta por lote) para no bloquear la tienda."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=730, help='Días sin actividad.')
+        parser.add_argument('--lote', type=int, default=200, help='Usuarios por transacción.')
+        parser.add_argument('--pausa', type=float, default=0.2,
+                            help='Segundos de espera entre lotes.')
+        parser.add_argument('--simular', action='store_true',
+                            help='Solo cuenta las cuentas que se borrarían.')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=options['dias'])
+        inactivos = Usuario.objects.filter(ultimo_acceso__lt=limite).filter(
+            Q(ultimo_pedido__isnull=True) | Q(ultimo_pedido__lt=limite)
+        )
+
+        if options['simular']:
+            self.stdout.write(f'{inactivos.count()} cuentas inactivas desde {limite:%Y-%m-%d}.')
+            return
+
+        total = 0
+        while True:
+            ids = list(inactivos.order_by('id').values_list('id', flat=True)[:options['lote']])
+            if not ids:
+                break
+            borrar_usuarios(ids)
+            total += len(ids)
+            self.stdout.write(f'{total} cuentas borradas...')
+            time.sleep(options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f'{total} cuentas inactivas borradas.'))
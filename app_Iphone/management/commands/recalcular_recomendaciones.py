@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from app_Iphone.recomendaciones import recalcular
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstruye las recomendaciones "Se compran juntos" a partir de los pedidos '
+        "activos y archivados (pensado para ejecutarse periódicamente, p. ej. desde cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=None,
+                            help='Vecinos por producto (por defecto RECOMENDACIONES_TOP).')
+        parser.add_argument('--lote', type=int, default=2000,
+                            help='Filas leídas y escritas por lote.')
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        filas = recalcular(top=options['top'], lote=options['lote'])
+        segundos = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(f'{filas} recomendaciones guardadas en {segundos:.1f} s.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from app_Iphone.models import Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula el resumen de pedidos de cada usuario (conteo, total gastado, "
+        "último pedido) desde la tabla Pedido y corrige los que estén desfasados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('usuarios', nargs='*', type=int, help='IDs a revisar (por defecto, todos).')
+        parser.add_argument('--solo-revisar', action='store_true',
+                            help='Reporta las diferencias sin corregirlas.')
+
+    def handle(self, *args, **options):
+        desfasados = Usuario.reconciliar_resumen_pedidos(
+            usuarios=options['usuarios'] or None, corregir=not options['solo_revisar']
+        )
+        for u in desfasados:
+            self.stdout.write(
+                f"Usuario #{u.id}: pedidos {u.pedidos_count} -> {u.real_count}, "
+                f"total {u.total_gastado} -> {u.real_total}, "
+                f"último {u.ultimo_pedido} -> {u.real_ultimo}"
+            )
+        accion = 'encontrados' if options['solo_revisar'] else 'corregidos'
+        self.stdout.write(self.style.SUCCESS(f'{len(desfasados)} usuarios desfasados {accion}.'))
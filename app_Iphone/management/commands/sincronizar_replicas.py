@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app_Iphone.replicas import alias_replicas, sincronizar_replicas
+
+
+class Command(BaseCommand):
+    help = "Copia db.sqlite3 sobre las réplicas de lectura (una vez o cada N segundos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cada', type=float, default=0,
+                            help='Repite la copia cada N segundos (0 = una sola vez).')
+
+    def handle(self, *args, **options):
+        if not alias_replicas():
+            raise CommandError('No hay réplicas declaradas en DATABASES (REPLICAS_ACTIVAS=1 y NUM_REPLICAS).')
+        while True:
+            inicio = time.perf_counter()
+            copiadas = sincronizar_replicas()
+            duracion_ms = (time.perf_counter() - inicio) * 1000
+            self.stdout.write(f"Réplicas sincronizadas: {', '.join(copiadas)} ({duracion_ms:.0f} ms)")
+            if not options['cada']:
+                return
+            time.sleep(options['cada'])
@@ -0,0 +1,426 @@
+import logging
+import math
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextlib import ExitStack
+from contextvars import ContextVar
+from urllib.parse import parse_qsl, urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+from django.urls import reverse
+
+from . import catalogo, vuelo_unico
+from .replicas import RUTAS_REPLICA, usar_replica
+
+logger = logging.getLogger(__name__)
+
+# ==========================================================
+# INSTRUMENTACIÓN DE PETICIONES (LATENCIA Y CONSULTAS)
+# ==========================================================
+
+# Métricas de la petición en curso (None fuera de una petición instrumentada)
+_metricas_actuales = ContextVar('metricas_actuales', default=None)
+
+
+class _MetricasPeticion:
+    """Acumula los tiempos y consultas de una sola petición."""
+    __slots__ = ('consultas', 'db_ms', 'plantilla_ms', 'profundidad_plantilla', 'sql')
+
+    def __init__(self):
+        self.consultas = 0
+        self.db_ms = 0.0
+        self.plantilla_ms = 0.0
+        self.profundidad_plantilla = 0
+        self.sql = Counter()
+
+
+class RegistroMetricas:
+    """Ventana deslizante de métricas por nombre de URL, compartida por el proceso."""
+
+    def __init__(self, ventana):
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self._muestras = defaultdict(lambda: deque(maxlen=self.ventana))
+        self._sospechas = defaultdict(dict)
+
+    def registrar(self, nombre_url, latencia_ms, metricas, sesion_escrita, sospechas):
+        with self._lock:
+            self._muestras[nombre_url].append(
+                (latencia_ms, metricas.consultas, metricas.db_ms, metricas.plantilla_ms, sesion_escrita)
+            )
+            for sql, repeticiones in sospechas.items():
+                previas = self._sospechas[nombre_url].get(sql, 0)
+                self._sospechas[nombre_url][sql] = max(previas, repeticiones)
+
+    def limpiar(self):
+        with self._lock:
+            self._muestras.clear()
+            self._sospechas.clear()
+
+    def resumen(self):
+        """Calcula percentiles p50/p95/p99 por ruta (solo cuando se consulta)."""
+        with self._lock:
+            copia = {nombre: list(muestras) for nombre, muestras in self._muestras.items()}
+            sospechas = {nombre: dict(sqls) for nombre, sqls in self._sospechas.items()}
+
+        resultado = {}
+        for nombre, muestras in sorted(copia.items()):
+            latencias = [m[0] for m in muestras]
+            consultas = [m[1] for m in muestras]
+            db = [m[2] for m in muestras]
+            plantillas = [m[3] for m in muestras]
+            resultado[nombre] = {
+                'peticiones': len(muestras),
+                'latencia_ms': _percentiles(latencias),
+                'consultas': _percentiles(consultas),
+                'db_ms': _percentiles(db),
+                'plantilla_ms': _percentiles(plantillas),
+                'escrituras_sesion': sum(1 for m in muestras if m[4]),
+                'sospechas_n_mas_1': [
+                    {'sql': sql, 'repeticiones': rep}
+                    for sql, rep in sorted(sospechas.get(nombre, {}).items(), key=lambda x: -x[1])
+                ],
+            }
+        return resultado
+
+
+def _percentiles(valores):
+    if not valores:
+        return {'p50': 0, 'p95': 0, 'p99': 0}
+    ordenados = sorted(valores)
+    ultimo = len(ordenados) - 1
+
+    def p(q):
+        return round(ordenados[min(ultimo, int(round(q * ultimo)))], 3)
+
+    return {'p50': p(0.50), 'p95': p(0.95), 'p99': p(0.99)}
+
+
+registro_metricas = RegistroMetricas(getattr(settings, 'INSTRUMENTACION_VENTANA', 1000))
+
+
+def _envoltura_sql(execute, sql, params, many, context):
+    """Cuenta y cronometra cada consulta ejecutada durante la petición."""
+    metricas = _metricas_actuales.get()
+    if metricas is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metricas.db_ms += (time.perf_counter() - inicio) * 1000
+        metricas.consultas += 1
+        # El SQL llega con marcadores (%s), así que consultas repetidas con
+        # distintos parámetros caen en el mismo patrón.
+        metricas.sql[sql] += 1
+
+
+_plantillas_instrumentadas = False
+
+
+def _instrumentar_plantillas():
+    """Envuelve el render del backend de plantillas para medir su duración."""
+    global _plantillas_instrumentadas
+    if _plantillas_instrumentadas:
+        return
+    from django.template.backends.django import Template
+
+    render_original = Template.render
+
+    def render_medido(self, context=None, request=None):
+        metricas = _metricas_actuales.get()
+        if metricas is None:
+            return render_original(self, context, request)
+        metricas.profundidad_plantilla += 1
+        inicio = time.perf_counter()
+        try:
+            return render_original(self, context, request)
+        finally:
+            metricas.profundidad_plantilla -= 1
+            # Solo se suma la plantilla más externa para no contar dos veces
+            if metricas.profundidad_plantilla == 0:
+                metricas.plantilla_ms += (time.perf_counter() - inicio) * 1000
+
+    Template.render = render_medido
+    _plantillas_instrumentadas = True
+
+
+class InstrumentacionMiddleware:
+    """
+    Mide latencia, consultas, tiempo de BD, tiempo de plantillas y escritura de
+    sesión por nombre de URL. Se activa con INSTRUMENTACION_ACTIVA = True.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'INSTRUMENTACION_ACTIVA', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.umbral_n_mas_1 = getattr(settings, 'INSTRUMENTACION_UMBRAL_N_MAS_1', 3)
+        _instrumentar_plantillas()
+
+    def __call__(self, request):
+        metricas = _MetricasPeticion()
+        token = _metricas_actuales.set(metricas)
+        inicio = time.perf_counter()
+        try:
+            with ExitStack() as pila:
+                for conexion in connections.all():
+                    pila.enter_context(conexion.execute_wrapper(_envoltura_sql))
+                response = self.get_response(request)
+        finally:
+            _metricas_actuales.reset(token)
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+
+        match = getattr(request, 'resolver_match', None)
+        nombre_url = (match.url_name if match else None) or '<sin_nombre>'
+        sesion = getattr(request, 'session', None)
+        sesion_escrita = bool(sesion is not None and sesion.modified)
+        sospechas = {sql: n for sql, n in metricas.sql.items() if n >= self.umbral_n_mas_1}
+        if sospechas:
+            logger.warning('Posible N+1 en %s: %s', nombre_url, sospechas)
+
+        registro_metricas.registrar(nombre_url, latencia_ms, metricas, sesion_escrita, sospechas)
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={metricas.db_ms:.2f};desc="{metricas.consultas} consultas"',
+            f'tpl;dur={metricas.plantilla_ms:.2f}',
+            f'total;dur={latencia_ms:.2f}',
+        ])
+        return response
+
+
+# ==========================================================
+# RÉPLICAS DE LECTURA
+# ==========================================================
+
+COOKIE_PRIMARIO = 'leer_primario_hasta'
+
+
+class ReplicaLecturaMiddleware:
+    """
+    Marca las peticiones GET de las vistas en RUTAS_REPLICA para que el router
+    lea de una réplica. Después de una escritura (POST, etc.) el navegador lee
+    del primario durante REPLICAS_PEGAJOSIDAD_SEGUNDOS para ver sus propios cambios.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REPLICAS_LECTURA', []):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pegajosidad = getattr(settings, 'REPLICAS_PEGAJOSIDAD_SEGUNDOS', 5)
+
+    def __call__(self, request):
+        token = usar_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            usar_replica.reset(token)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            hasta = time.time() + self.pegajosidad
+            response.set_cookie(
+                COOKIE_PRIMARIO, f'{hasta:.0f}', max_age=self.pegajosidad, httponly=True, samesite='Lax'
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None
+        if request.resolver_match.url_name not in RUTAS_REPLICA:
+            return None
+        try:
+            pegado = float(request.COOKIES.get(COOKIE_PRIMARIO, 0)) > time.time()
+        except ValueError:
+            pegado = False
+        if not pegado:
+            usar_replica.set(True)
+        return None
+
+
+# ==========================================================
+# LÍMITE DE PETICIONES (TOKEN BUCKET)
+# ==========================================================
+
+class LimitadorTokens:
+    """
+    Cubetas de tokens guardadas en la caché de Django (compartida entre
+    procesos si la caché lo es). Cada cubeta se guarda como el "momento
+    teórico de llegada" (GCRA): un solo número por clave, sin un proceso que
+    rellene tokens. Una clave sin tokens queda bloqueada también en memoria del
+    proceso hasta que le toque uno, y sus rechazos no consultan la caché.
+    Entre el get y el set de la caché puede colarse alguna petición de más con
+    concurrencia; para frenar abusos basta.
+    """
+
+    def __init__(self, max_bloqueados=10000):
+        self.max_bloqueados = max_bloqueados
+        self._bloqueados = {}  # clave -> momento hasta el que se rechaza
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'LIMITES_CACHE', 'default')]
+
+    def consumir(self, claves, capacidad, por_minuto):
+        """
+        Toma un token de cada cubeta de `claves`, solo si todas tienen: la que
+        rechaza no le gasta el token a las demás. Devuelve 0 si se tomaron, o
+        los segundos a esperar.
+        """
+        ahora = time.time()
+        for clave in claves:
+            hasta = self._bloqueados.get(clave)
+            if hasta is not None:
+                if ahora < hasta:
+                    return hasta - ahora
+                self._bloqueados.pop(clave, None)
+
+        intervalo = 60 / por_minuto
+        guardados = self.cache.get_many(claves)
+        siguientes, excesos = {}, {}
+        for clave in claves:
+            siguientes[clave] = max(guardados.get(clave, ahora), ahora) + intervalo
+            exceso = siguientes[clave] - ahora - capacidad * intervalo
+            if exceso > 0:
+                excesos[clave] = exceso
+        if excesos:
+            with self._lock:
+                if len(self._bloqueados) + len(excesos) > self.max_bloqueados:
+                    self._bloqueados.clear()
+                for clave, exceso in excesos.items():
+                    self._bloqueados[clave] = ahora + exceso
+            return max(excesos.values())
+        # Todas las cubetas vencen juntas a lo más en lo que tarda la más llena
+        self.cache.set_many(siguientes, math.ceil(max(siguientes.values()) - ahora) + 1)
+        return 0
+
+    def limpiar(self):
+        with self._lock:
+            self._bloqueados.clear()
+
+
+limitador = LimitadorTokens()
+
+
+class LimitePeticionesMiddleware:
+    """
+    Limita los POST de las vistas en LIMITES_PETICIONES
+    ({nombre de URL: (ráfaga, peticiones por minuto)}) con una cubeta por IP y
+    otra por cookie de sesión; la petición gasta un token de cada una solo si
+    ambas tienen. Responde 429 antes de cargar la sesión o tocar la BD.
+    """
+
+    def __init__(self, get_response):
+        self.limites = getattr(settings, 'LIMITES_PETICIONES', {})
+        if not self.limites:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method != 'POST':
+            return None
+        nombre = request.resolver_match.url_name
+        limite = self.limites.get(nombre)
+        if limite is None:
+            return None
+        capacidad, por_minuto = limite
+
+        # Solo se lee la cookie: la sesión no se carga de la BD
+        claves = [f"limite:{nombre}:ip:{request.META.get('REMOTE_ADDR', '')}"]
+        sesion = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if sesion:
+            claves.append(f'limite:{nombre}:sesion:{sesion}')
+        espera = limitador.consumir(claves, capacidad, por_minuto)
+        if espera:
+            response = HttpResponse(
+                'Demasiadas solicitudes. Intenta de nuevo en unos segundos.',
+                status=429, content_type='text/plain; charset=utf-8',
+            )
+            response['Retry-After'] = str(math.ceil(espera))
+            return response
+        return None
+
+
+# ==========================================================
+# CACHÉ DE PÁGINAS PARA VISITANTES ANÓNIMOS
+# ==========================================================
+
+# Páginas que no dependen de quién las ve, salvo el navbar y el token CSRF
+RUTAS_PAGINA_ANONIMA = (
+    'tienda_index', 'tienda_celulares', 'tienda_laptops', 'tienda_tablets',
+    'tienda_airpods', 'tienda_accesorios',
+)
+
+# Parámetros de campañas que no cambian el contenido
+_PARAMETROS_IGNORADOS = ('utm_', 'fbclid', 'gclid')
+
+
+def _clave_pagina(request):
+    parametros = sorted(
+        (k, v) for k, v in parse_qsl(request.META.get('QUERY_STRING', ''), keep_blank_values=True)
+        if not k.startswith(_PARAMETROS_IGNORADOS)
+    )
+    return f'pagina:{request.path}?{urlencode(parametros)}'
+
+
+class PaginaAnonimaCacheMiddleware:
+    """
+    Guarda la respuesta completa de RUTAS_PAGINA_ANONIMA para las peticiones
+    GET sin cookie de sesión y la sirve sin sesión, ORM ni plantillas. Esas
+    páginas se renderizan con request.pagina_publica = True: navbar sin sesión
+    y sin token CSRF; el navegador los completa con tienda_estado_sesion (JSON,
+    nunca en caché). La versión del catálogo invalida las páginas al cambiar un
+    producto; mientras una petición las vuelve a generar, las demás reciben la
+    copia anterior (vuelo_unico).
+    """
+
+    def __init__(self, get_response):
+        self.segundos = getattr(settings, 'PAGINAS_ANONIMAS_CACHE_SEGUNDOS', 0)
+        if not self.segundos:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self._rutas = None
+
+    @property
+    def rutas(self):
+        if self._rutas is None:
+            self._rutas = {reverse(nombre) for nombre in RUTAS_PAGINA_ANONIMA}
+        return self._rutas
+
+    def __call__(self, request):
+        if (
+            request.method not in ('GET', 'HEAD')
+            or settings.SESSION_COOKIE_NAME in request.COOKIES
+            or request.path not in self.rutas
+        ):
+            return self.get_response(request)
+
+        generada = {}
+
+        def generar():
+            request.pagina_publica = True
+            response = generada['response'] = self.get_response(request)
+            # Solo respuestas completas y sin cookies (nada propio de este visitante)
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                encabezados = {k: v for k, v in response.items() if k != 'Server-Timing'}
+                return (200, response.content, encabezados)
+            return None
+
+        guardada = vuelo_unico.obtener(
+            _clave_pagina(request), generar, self.segundos, version=catalogo.version()
+        )
+        if 'response' in generada:
+            response = generada['response']
+            response['X-Cache'] = 'MISS'
+            return response
+        estado, contenido, encabezados = guardada
+        response = HttpResponse(contenido, status=estado, headers=encabezados)
+        response['X-Cache'] = 'HIT'
+        return response
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:32
+
+from django.conf import settings
+from django.db import migrations, models
+
+MODELOS = ('Celular', 'Laptop', 'Tablet', 'Airpod', 'Accesorio')
+
+
+def existencias_iniciales(apps, schema_editor):
+    """
+    Los productos que ya estaban en el catálogo arrancan con
+    STOCK_INICIAL_MIGRACION existencias (0 por omisión: sin inventario previo
+    no se inventa un número). El administrador carga después las reales.
+    """
+    stock = getattr(settings, 'STOCK_INICIAL_MIGRACION', 0)
+    if not stock:
+        return
+    for nombre in MODELOS:
+        apps.get_model('app_Iphone', nombre).objects.update(stock=stock)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0002_metodopago_pedido_metodo_pago_usuario_metodo_pago'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accesorio',
+            name='stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='airpod',
+            name='stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='celular',
+            name='stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='laptop',
+            name='stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tablet',
+            name='stock',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(existencias_iniciales, migrations.RunPython.noop),
+    ]
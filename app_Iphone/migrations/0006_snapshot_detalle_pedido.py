@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+# Copia de DetallePedido.PREFIJOS_SKU: las migraciones no importan el modelo actual
+PREFIJOS_SKU = {
+    'celular': 'CEL', 'laptop': 'LAP', 'tablet': 'TAB', 'airpod': 'AIR', 'accesorio': 'ACC',
+}
+CAMPO_NOMBRE = {
+    'celular': 'modelo', 'laptop': 'modelo', 'tablet': 'modelo', 'airpod': 'modelo', 'accesorio': 'tipo',
+}
+
+
+def copiar_datos_producto(apps, schema_editor):
+    """Llena el snapshot de los detalles existentes, por tipo y en lotes."""
+    DetallePedido = apps.get_model('app_Iphone', 'DetallePedido')
+    for categoria, campo in CAMPO_NOMBRE.items():
+        Model = apps.get_model('app_Iphone', categoria.capitalize())
+        nombres = dict(Model.objects.values_list('id', campo))
+        pendientes = DetallePedido.objects.filter(**{f'{categoria}__isnull': False}).only('id', f'{categoria}_id')
+        lote = []
+        for detalle in pendientes.iterator(chunk_size=1000):
+            producto_id = getattr(detalle, f'{categoria}_id')
+            detalle.producto_nombre = nombres.get(producto_id, '')
+            detalle.categoria = categoria
+            detalle.sku = f'{PREFIJOS_SKU[categoria]}-{producto_id:06d}'
+            lote.append(detalle)
+            if len(lote) >= 1000:
+                DetallePedido.objects.bulk_update(lote, ['producto_nombre', 'categoria', 'sku'])
+                lote = []
+        if lote:
+            DetallePedido.objects.bulk_update(lote, ['producto_nombre', 'categoria', 'sku'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0005_tarea'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detallepedido',
+            name='categoria',
+            field=models.CharField(blank=True, choices=[('celular', 'Celular'), ('laptop', 'Laptop'), ('tablet', 'Tablet'), ('airpod', 'AirPod'), ('accesorio', 'Accesorio')], max_length=20),
+        ),
+        migrations.AddField(
+            model_name='detallepedido',
+            name='producto_nombre',
+            field=models.CharField(blank=True, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='detallepedido',
+            name='sku',
+            field=models.CharField(blank=True, max_length=30),
+        ),
+        migrations.RunPython(copiar_datos_producto, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:38
+
+from django.db import migrations, models
+from django.db.models import Count, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calcular_resumen(apps, schema_editor):
+    """Llena los contadores de los usuarios existentes con un solo UPDATE."""
+    Usuario = apps.get_model('app_Iphone', 'Usuario')
+    Pedido = apps.get_model('app_Iphone', 'Pedido')
+    pedidos = Pedido.objects.filter(usuario=OuterRef('pk')).order_by().values('usuario')
+    Usuario.objects.update(
+        pedidos_count=Coalesce(Subquery(pedidos.annotate(n=Count('id')).values('n')), Value(0)),
+        total_gastado=Coalesce(
+            Subquery(pedidos.annotate(s=Sum('total')).values('s')), Value(0),
+            output_field=models.DecimalField(max_digits=12, decimal_places=2),
+        ),
+        ultimo_pedido=Subquery(pedidos.annotate(u=Max('fecha_pedido')).values('u')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0006_snapshot_detalle_pedido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='pedidos_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='total_gastado',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='ultimo_pedido',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(calcular_resumen, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0007_resumen_pedidos_usuario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usuario',
+            name='ultimo_acceso',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
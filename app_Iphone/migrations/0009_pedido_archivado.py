@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0008_ultimo_acceso_usuario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PedidoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha_pedido', models.DateTimeField()),
+                ('total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('estado', models.CharField(max_length=20)),
+                ('direccion_envio', models.JSONField(blank=True, null=True)),
+                ('lineas', models.JSONField(default=list)),
+                ('fecha_archivado', models.DateTimeField(auto_now_add=True)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='app_Iphone.usuario')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario', '-fecha_pedido'], name='app_Iphone__usuario_c40fd5_idx')],
+            },
+        ),
+    ]
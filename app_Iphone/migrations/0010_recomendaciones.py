@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0009_pedido_archivado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recomendacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origen', models.CharField(max_length=40)),
+                ('categoria', models.CharField(choices=[('celular', 'Celular'), ('laptop', 'Laptop'), ('tablet', 'Tablet'), ('airpod', 'AirPod'), ('accesorio', 'Accesorio')], max_length=20)),
+                ('producto_id', models.PositiveIntegerField()),
+                ('nombre', models.CharField(max_length=150)),
+                ('imagen_url', models.URLField()),
+                ('puntuacion', models.FloatField()),
+                ('posicion', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['origen', 'posicion'], name='app_Iphone__origen_dabe8f_idx')],
+            },
+        ),
+    ]
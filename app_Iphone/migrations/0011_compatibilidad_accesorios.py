@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:01
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia de compatibilidad.modelos_compatibles: las migraciones no importan el código actual
+_SEPARADORES = re.compile(r'\s*(?:[,;/|&]|\by\b|\band\b)\s*', re.IGNORECASE)
+
+
+def _normalizar(texto):
+    sin_acentos = unicodedata.normalize('NFKD', texto or '').encode('ascii', 'ignore').decode()
+    return re.sub(r'[^a-z0-9]+', ' ', sin_acentos.lower()).strip()
+
+
+def _modelos_compatibles(texto):
+    modelos, marca = set(), ''
+    for fragmento in _SEPARADORES.split(texto or ''):
+        nombre = _normalizar(fragmento)
+        if not nombre:
+            continue
+        if nombre[0].isdigit() and marca:
+            nombre = f'{marca} {nombre}'
+        else:
+            marca = nombre.split()[0]
+        modelos.add(nombre[:100])
+    return modelos
+
+
+def indexar_accesorios(apps, schema_editor):
+    """Llena el índice con los accesorios existentes."""
+    Accesorio = apps.get_model('app_Iphone', 'Accesorio')
+    CompatibilidadAccesorio = apps.get_model('app_Iphone', 'CompatibilidadAccesorio')
+    CompatibilidadAccesorio.objects.bulk_create([
+        CompatibilidadAccesorio(accesorio_id=accesorio_id, modelo=modelo)
+        for accesorio_id, texto in Accesorio.objects.values_list('id', 'modelo_compatible').iterator()
+        for modelo in _modelos_compatibles(texto)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0010_recomendaciones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompatibilidadAccesorio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(db_index=True, max_length=100)),
+                ('accesorio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compatibilidades', to='app_Iphone.accesorio')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('accesorio', 'modelo'), name='compatibilidad_unica')],
+            },
+        ),
+        migrations.RunPython(indexar_accesorios, migrations.RunPython.noop),
+    ]
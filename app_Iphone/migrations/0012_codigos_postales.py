@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0011_compatibilidad_accesorios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CodigoPostal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(db_index=True, max_length=10)),
+                ('colonia', models.CharField(max_length=100)),
+                ('ciudad', models.CharField(max_length=100)),
+                ('estado', models.CharField(blank=True, max_length=100)),
+                ('pais', models.CharField(default='México', max_length=100)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('codigo', 'colonia'), name='codigo_postal_colonia_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+import hashlib
+
+from django.db import migrations, models
+
+# Copia de Direccion.calcular_huella: las migraciones no importan el modelo actual
+CAMPOS = ('calle', 'codigo_postal', 'colonia', 'ciudad', 'pais')
+
+
+def _huella(direccion):
+    contenido = '\x1f'.join(
+        ' '.join(str(getattr(direccion, c) or '').split()).casefold() for c in CAMPOS
+    )
+    return hashlib.sha256(contenido.encode()).hexdigest()
+
+
+def deduplicar_direcciones(apps, schema_editor):
+    """Calcula la huella de cada dirección y junta las repetidas en la más antigua."""
+    Direccion = apps.get_model('app_Iphone', 'Direccion')
+    Usuario = apps.get_model('app_Iphone', 'Usuario')
+    Pedido = apps.get_model('app_Iphone', 'Pedido')
+
+    conservada = {}  # huella -> id de la dirección que se queda
+    repetidas = {}   # id repetido -> id conservado
+    lote = []
+    for direccion in Direccion.objects.order_by('id').iterator(chunk_size=1000):
+        huella = _huella(direccion)
+        if huella in conservada:
+            repetidas[direccion.id] = conservada[huella]
+            continue
+        conservada[huella] = direccion.id
+        direccion.huella = huella
+        lote.append(direccion)
+        if len(lote) >= 1000:
+            Direccion.objects.bulk_update(lote, ['huella'])
+            lote = []
+    if lote:
+        Direccion.objects.bulk_update(lote, ['huella'])
+
+    for repetida, destino in repetidas.items():
+        Usuario.objects.filter(direccion_id=repetida).update(direccion_id=destino)
+        Pedido.objects.filter(direccion_envio_id=repetida).update(direccion_envio_id=destino)
+    ids = list(repetidas)
+    for inicio in range(0, len(ids), 500):
+        Direccion.objects.filter(id__in=ids[inicio:inicio + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0012_codigos_postales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='direccion',
+            name='huella',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(deduplicar_direcciones, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='direccion',
+            name='huella',
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:08
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia de Pedido.ESTADOS: las migraciones no importan el modelo actual
+ESTADOS = ('Pendiente', 'Procesando', 'Enviado', 'Entregado', 'Cancelado')
+
+# Antes el estado era texto libre (el formulario de edición guardaba lo que
+# llegara). Variantes conocidas, ya normalizadas, y el estado que les toca.
+EQUIVALENCIAS = {
+    'pending': 'Pendiente', 'nuevo': 'Pendiente', 'en espera': 'Pendiente',
+    'processing': 'Procesando', 'en proceso': 'Procesando', 'pagado': 'Procesando', 'paid': 'Procesando',
+    'shipped': 'Enviado', 'en camino': 'Enviado', 'en transito': 'Enviado',
+    'delivered': 'Entregado', 'completado': 'Entregado', 'completed': 'Entregado', 'recibido': 'Entregado',
+    'cancelled': 'Cancelado', 'canceled': 'Cancelado', 'cancelada': 'Cancelado', 'anulado': 'Cancelado',
+    'rechazado': 'Cancelado',
+}
+
+
+def _normalizar(valor):
+    """Sin espacios de más, mayúsculas ni acentos: 'ENVIADO ', 'Envíado' -> 'enviado'."""
+    sin_acentos = unicodedata.normalize('NFKD', valor or '').encode('ascii', 'ignore').decode()
+    return ' '.join(sin_acentos.split()).casefold()
+
+
+def mapear_estados_legados(apps, schema_editor):
+    """
+    Lleva cada estado fuera de ESTADOS al estado equivalente, para que la
+    máquina de estados pueda moverlo. Lo irreconocible queda en Pendiente,
+    de donde el administrador puede procesarlo, enviarlo o cancelarlo.
+    """
+    Pedido = apps.get_model('app_Iphone', 'Pedido')
+    destinos = {_normalizar(estado): estado for estado in ESTADOS}
+    destinos.update(EQUIVALENCIAS)
+    legados = Pedido.objects.exclude(estado__in=ESTADOS).values_list('estado', flat=True).distinct()
+    for valor in list(legados):
+        nuevo = destinos.get(_normalizar(valor), 'Pendiente')
+        Pedido.objects.filter(estado=valor).update(estado=nuevo)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0013_direccion_inmutable'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialEstadoPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(choices=[('Pendiente', 'Pendiente'), ('Procesando', 'Procesando'), ('Enviado', 'Enviado'), ('Entregado', 'Entregado'), ('Cancelado', 'Cancelado')], max_length=20)),
+                ('estado_nuevo', models.CharField(choices=[('Pendiente', 'Pendiente'), ('Procesando', 'Procesando'), ('Enviado', 'Enviado'), ('Entregado', 'Entregado'), ('Cancelado', 'Cancelado')], max_length=20)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='pedido',
+            name='estado',
+            field=models.CharField(choices=[('Pendiente', 'Pendiente'), ('Procesando', 'Procesando'), ('Enviado', 'Enviado'), ('Entregado', 'Entregado'), ('Cancelado', 'Cancelado')], default='Pendiente', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['estado', 'fecha_pedido'], name='app_Iphone__estado_e20727_idx'),
+        ),
+        migrations.AddField(
+            model_name='historialestadopedido',
+            name='pedido',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial_estados', to='app_Iphone.pedido'),
+        ),
+        migrations.AddIndex(
+            model_name='historialestadopedido',
+            index=models.Index(fields=['pedido', 'fecha'], name='app_Iphone__pedido__6bdfc5_idx'),
+        ),
+        migrations.RunPython(mapear_estados_legados, migrations.RunPython.noop),
+    ]
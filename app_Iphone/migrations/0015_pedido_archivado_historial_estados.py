@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0014_estados_pedido'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedidoarchivado',
+            name='historial_estados',
+            field=models.JSONField(default=list),
+        ),
+    ]
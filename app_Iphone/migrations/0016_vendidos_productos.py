@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:24
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+# Categoría de DetallePedido (= nombre del campo FK) -> modelo del producto
+MODELOS = {
+    'celular': 'Celular', 'laptop': 'Laptop', 'tablet': 'Tablet',
+    'airpod': 'Airpod', 'accesorio': 'Accesorio',
+}
+
+
+def contar_vendidos(apps, schema_editor):
+    """Piezas ya vendidas de cada producto, con un UPDATE por categoría."""
+    DetallePedido = apps.get_model('app_Iphone', 'DetallePedido')
+    for campo, nombre in MODELOS.items():
+        piezas = (
+            DetallePedido.objects.filter(**{campo: OuterRef('pk')}).order_by()
+            .values(campo).annotate(piezas=Sum('cantidad')).values('piezas')
+        )
+        apps.get_model('app_Iphone', nombre).objects.update(
+            vendidos=Coalesce(Subquery(piezas), Value(0))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0015_pedido_archivado_historial_estados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accesorio',
+            name='vendidos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='airpod',
+            name='vendidos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='celular',
+            name='vendidos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='laptop',
+            name='vendidos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tablet',
+            name='vendidos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(contar_vendidos, migrations.RunPython.noop),
+    ]
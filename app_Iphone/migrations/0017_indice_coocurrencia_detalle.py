@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app_Iphone', '0016_vendidos_productos'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='detallepedido',
+            index=models.Index(fields=['pedido', 'sku', 'categoria'], name='app_Iphone__pedido__2d487a_idx'),
+        ),
+    ]
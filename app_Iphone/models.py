@@ -1,18 +1,73 @@
+import hashlib
+
 from django.db import models
+from django.db.models import Count, F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 
 # ==========================================================
 # TABLA: Dirección
 # ==========================================================
 class Direccion(models.Model):
+    # Inmutable: editar una dirección crea (o reutiliza) otra fila con
+    # Direccion.obtener(); los pedidos conservan la dirección con la que se
+    # enviaron. La huella (hash del contenido) evita guardar duplicados.
+    CAMPOS = ('calle', 'codigo_postal', 'colonia', 'ciudad', 'pais')
+
     calle = models.CharField(max_length=255)
     codigo_postal = models.CharField(max_length=10)
     colonia = models.CharField(max_length=100)
     ciudad = models.CharField(max_length=100)
     pais = models.CharField(max_length=100)
+    huella = models.CharField(max_length=64, unique=True, editable=False)
+
+    @classmethod
+    def _limpiar(cls, campos):
+        return {c: ' '.join(str(campos.get(c) or '').split()) for c in cls.CAMPOS}
+
+    @classmethod
+    def calcular_huella(cls, campos):
+        # Sin distinguir mayúsculas ni espacios: 'Centro' y ' centro' son la misma
+        contenido = '\x1f'.join(cls._limpiar(campos)[c].casefold() for c in cls.CAMPOS)
+        return hashlib.sha256(contenido.encode()).hexdigest()
+
+    @classmethod
+    def obtener(cls, **campos):
+        """La dirección con estos datos: la que ya existe (misma huella) o una nueva."""
+        campos = cls._limpiar(campos)
+        direccion, _ = cls.objects.get_or_create(huella=cls.calcular_huella(campos), defaults=campos)
+        return direccion
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Las direcciones no se modifican; usa Direccion.obtener() con los datos nuevos.')
+        self.huella = self.calcular_huella(vars(self))
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.calle}, {self.colonia}, {self.ciudad}, {self.pais}"
 
+# ==========================================================
+# TABLA: Catálogo de Códigos Postales
+# ==========================================================
+class CodigoPostal(models.Model):
+    # Tabla de referencia (un renglón por colonia) que carga el comando
+    # importar_codigos_postales; el checkout la usa para autollenar y
+    # normalizar la dirección (ver codigos_postales.py).
+    codigo = models.CharField(max_length=10, db_index=True)
+    colonia = models.CharField(max_length=100)
+    ciudad = models.CharField(max_length=100)
+    estado = models.CharField(max_length=100, blank=True)
+    pais = models.CharField(max_length=100, default='México')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['codigo', 'colonia'], name='codigo_postal_colonia_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.codigo} {self.colonia}, {self.ciudad}"
+
 # ==========================================================
 # TABLA: Método de Pago (NUEVA)
 # ==========================================================
@@ -39,9 +94,82 @@ class Usuario(models.Model):
     direccion = models.ForeignKey(Direccion, on_delete=models.SET_NULL, null=True, blank=True)
     metodo_pago = models.ForeignKey(MetodoPago, on_delete=models.SET_NULL, null=True, blank=True)
 
+    # Resumen de pedidos mantenido al crear/borrar pedidos (ver registrar_pedido,
+    # descontar_pedido y el comando reconciliar_pedidos_usuario)
+    pedidos_count = models.PositiveIntegerField(default=0, db_index=True)
+    total_gastado = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_index=True)
+    ultimo_pedido = models.DateTimeField(null=True, blank=True, db_index=True)
+    # Se actualiza al iniciar sesión; lo usa el comando purgar_inactivos
+    ultimo_acceso = models.DateTimeField(default=timezone.now, db_index=True)
+
     def __str__(self):
         return self.nombre
 
+    @classmethod
+    def registrar_pedido(cls, pedido):
+        """Suma un pedido recién creado. Llamar dentro de la transacción del pedido."""
+        cls.objects.filter(pk=pedido.usuario_id).update(
+            pedidos_count=F('pedidos_count') + 1,
+            total_gastado=F('total_gastado') + pedido.total,
+            ultimo_pedido=pedido.fecha_pedido,
+        )
+
+    @classmethod
+    def descontar_pedido(cls, pedido):
+        """Resta un pedido ya borrado. La fecha del último se toma de los que quedan."""
+        _, _, ultimo = _resumen_pedidos()
+        cls.objects.filter(pk=pedido.usuario_id).update(
+            pedidos_count=F('pedidos_count') - 1,
+            total_gastado=F('total_gastado') - pedido.total,
+            ultimo_pedido=ultimo,
+        )
+
+    @classmethod
+    def reconciliar_resumen_pedidos(cls, usuarios=None, corregir=True):
+        """
+        Recalcula los contadores desde Pedido y PedidoArchivado con un solo UPDATE.
+        Devuelve los usuarios cuyo resumen estaba desfasado (antes de corregir).
+        """
+        conteo, suma, ultimo = _resumen_pedidos()
+
+        qs = cls.objects.all() if usuarios is None else cls.objects.filter(pk__in=usuarios)
+        calculado = qs.annotate(real_count=conteo, real_total=suma, real_ultimo=ultimo)
+        desfasados = [
+            u for u in calculado.only('id', 'pedidos_count', 'total_gastado', 'ultimo_pedido')
+            if (u.pedidos_count, u.total_gastado, u.ultimo_pedido)
+            != (u.real_count, u.real_total, u.real_ultimo)
+        ]
+        if desfasados and corregir:
+            cls.objects.filter(pk__in=[u.pk for u in desfasados]).update(
+                pedidos_count=conteo, total_gastado=suma, ultimo_pedido=ultimo,
+            )
+        return desfasados
+
+
+def _resumen_pedidos():
+    """(conteo, total, último pedido) por usuario, sumando pedidos activos y archivados."""
+    dinero = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def por_usuario(Model, agregado):
+        return Subquery(
+            Model.objects.filter(usuario=OuterRef('pk')).order_by().values('usuario')
+            .annotate(valor=agregado).values('valor')
+        )
+
+    conteo = (
+        Coalesce(por_usuario(Pedido, Count('id')), Value(0))
+        + Coalesce(por_usuario(PedidoArchivado, Count('id')), Value(0))
+    )
+    total = (
+        Coalesce(por_usuario(Pedido, Sum('total')), Value(0), output_field=dinero)
+        + Coalesce(por_usuario(PedidoArchivado, Sum('total')), Value(0), output_field=dinero)
+    )
+    activo = por_usuario(Pedido, Max('fecha_pedido'))
+    archivado = por_usuario(PedidoArchivado, Max('fecha_pedido'))
+    # GREATEST devuelve NULL si algún lado lo es; el Coalesce cruzado lo evita
+    ultimo = Greatest(Coalesce(activo, archivado), Coalesce(archivado, activo))
+    return conteo, total, ultimo
+
 # ==========================================================
 # TABLA: Celulares
 # ==========================================================
@@ -49,6 +177,8 @@ class Celular(models.Model):
     modelo = models.CharField(max_length=100)
     descripcion = models.TextField()
     precio = models.DecimalField(max_digits=10, decimal_places=2)
+    stock = models.PositiveIntegerField(default=0) # Existencias disponibles
+    vendidos = models.PositiveIntegerField(default=0, editable=False) # Piezas vendidas (popularidad)
     imagen_url = models.URLField()
 
     def __str__(self):
@@ -61,6 +191,8 @@ class Laptop(models.Model):
     modelo = models.CharField(max_length=100)
     descripcion = models.TextField()
     precio = models.DecimalField(max_digits=10, decimal_places=2)
+    stock = models.PositiveIntegerField(default=0) # Existencias disponibles
+    vendidos = models.PositiveIntegerField(default=0, editable=False) # Piezas vendidas (popularidad)
     imagen_url = models.URLField()
 
     def __str__(self):
@@ -73,6 +205,8 @@ class Tablet(models.Model):
     modelo = models.CharField(max_length=100)
     descripcion = models.TextField()
     precio = models.DecimalField(max_digits=10, decimal_places=2)
+    stock = models.PositiveIntegerField(default=0) # Existencias disponibles
+    vendidos = models.PositiveIntegerField(default=0, editable=False) # Piezas vendidas (popularidad)
     imagen_url = models.URLField()
 
     def __str__(self):
@@ -86,6 +220,8 @@ class Airpod(models.Model):
     modelo = models.CharField(max_length=100)
     descripcion = models.TextField()
     precio = models.DecimalField(max_digits=10, decimal_places=2)
+    stock = models.PositiveIntegerField(default=0) # Existencias disponibles
+    vendidos = models.PositiveIntegerField(default=0, editable=False) # Piezas vendidas (popularidad)
     imagen_url = models.URLField()
 
     def __str__(self):
@@ -99,11 +235,32 @@ class Accesorio(models.Model):
     modelo_compatible = models.CharField(max_length=100)
     descripcion = models.TextField()
     precio = models.DecimalField(max_digits=10, decimal_places=2)
+    stock = models.PositiveIntegerField(default=0) # Existencias disponibles
+    vendidos = models.PositiveIntegerField(default=0, editable=False) # Piezas vendidas (popularidad)
     imagen_url = models.URLField()
 
     def __str__(self):
         return f"{self.tipo} ({self.modelo_compatible})"
 
+# ==========================================================
+# TABLA: Índice de Compatibilidad de Accesorios
+# ==========================================================
+class CompatibilidadAccesorio(models.Model):
+    # Un renglón por modelo mencionado en Accesorio.modelo_compatible, con el
+    # nombre normalizado (ver compatibilidad.py). Los dispositivos se buscan
+    # por su propio nombre normalizado: agregar o renombrar un celular no
+    # requiere tocar este índice.
+    accesorio = models.ForeignKey(Accesorio, on_delete=models.CASCADE, related_name='compatibilidades')
+    modelo = models.CharField(max_length=100, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['accesorio', 'modelo'], name='compatibilidad_unica'),
+        ]
+
+    def __str__(self):
+        return f"{self.accesorio} -> {self.modelo}"
+
 # ==========================================================
 # TABLA: Carrito
 # ==========================================================
@@ -139,13 +296,60 @@ class Pedido(models.Model):
     # Aquí conectamos el pedido con el método de pago usado
     metodo_pago = models.ForeignKey(MetodoPago, on_delete=models.SET_NULL, null=True, blank=True)
     
+    # Flujo de estados (ver estados_pedido.py): solo se permiten estos pasos
+    PENDIENTE = 'Pendiente'
+    PROCESANDO = 'Procesando'
+    ENVIADO = 'Enviado'
+    ENTREGADO = 'Entregado'
+    CANCELADO = 'Cancelado'
+    ESTADOS = [
+        (PENDIENTE, 'Pendiente'), (PROCESANDO, 'Procesando'), (ENVIADO, 'Enviado'),
+        (ENTREGADO, 'Entregado'), (CANCELADO, 'Cancelado'),
+    ]
+    TRANSICIONES = {
+        PENDIENTE: (PROCESANDO, ENVIADO, CANCELADO),
+        PROCESANDO: (ENVIADO, CANCELADO),
+        ENVIADO: (ENTREGADO, CANCELADO),
+        ENTREGADO: (),
+        CANCELADO: (),
+    }
+
     fecha_pedido = models.DateTimeField(auto_now_add=True)
     total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    estado = models.CharField(max_length=20, default="Pendiente")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default=PENDIENTE)
+
+    class Meta:
+        # Colas de surtido: pedidos de un estado, del más antiguo al más nuevo
+        indexes = [models.Index(fields=['estado', 'fecha_pedido'])]
+
+    @property
+    def detalles(self):
+        # Misma interfaz que PedidoArchivado.detalles para el historial
+        return self.detallepedido_set.all()
+
+    @property
+    def siguientes_estados(self):
+        return self.TRANSICIONES.get(self.estado, ())
 
     def __str__(self):
         return f"Pedido #{self.id} de {self.usuario.nombre}"
 
+# ==========================================================
+# TABLA: Historial de Estados del Pedido
+# ==========================================================
+class HistorialEstadoPedido(models.Model):
+    # Un renglón por cambio de estado; se escribe junto con el UPDATE del pedido
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, related_name='historial_estados')
+    estado_anterior = models.CharField(max_length=20, choices=Pedido.ESTADOS)
+    estado_nuevo = models.CharField(max_length=20, choices=Pedido.ESTADOS)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['pedido', 'fecha'])]
+
+    def __str__(self):
+        return f"Pedido #{self.pedido_id}: {self.estado_anterior} -> {self.estado_nuevo}"
+
 # ==========================================================
 # TABLA: Detalle del Pedido
 # ==========================================================
@@ -161,5 +365,115 @@ class DetallePedido(models.Model):
     cantidad = models.PositiveIntegerField(default=1)
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
 
+    # Copia del producto al momento de la compra: el historial se muestra sin
+    # JOIN a los catálogos y sigue intacto si el producto se borra después.
+    CATEGORIAS = [
+        ('celular', 'Celular'), ('laptop', 'Laptop'), ('tablet', 'Tablet'),
+        ('airpod', 'AirPod'), ('accesorio', 'Accesorio'),
+    ]
+    PREFIJOS_SKU = {
+        'celular': 'CEL', 'laptop': 'LAP', 'tablet': 'TAB', 'airpod': 'AIR', 'accesorio': 'ACC',
+    }
+    producto_nombre = models.CharField(max_length=150, blank=True)
+    categoria = models.CharField(max_length=20, choices=CATEGORIAS, blank=True)
+    sku = models.CharField(max_length=30, blank=True)
+
+    class Meta:
+        # Cubre la co-ocurrencia de recomendaciones.py: los productos
+        # distintos de cada pedido se leen solo del índice
+        indexes = [models.Index(fields=['pedido', 'sku', 'categoria'])]
+
+    @classmethod
+    def sku_para(cls, categoria, producto_id):
+        # Los catálogos no tienen SKU propio: se deriva de la categoría y el ID
+        return f"{cls.PREFIJOS_SKU[categoria]}-{producto_id:06d}"
+
+    def __str__(self):
+        return f"Detalle del pedido #{self.pedido.id}"
+
+# ==========================================================
+# TABLA: Claves de Idempotencia del Checkout
+# ==========================================================
+class ClaveIdempotencia(models.Model):
+    # La emite el resumen del pedido; el índice único impide que dos envíos
+    # del mismo formulario (doble clic, reintentos) creen dos pedidos.
+    clave = models.CharField(max_length=64, unique=True)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE, null=True, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Clave {self.clave} (pedido #{self.pedido_id})"
+
+# ==========================================================
+# TABLA: Cola de Tareas en Segundo Plano
+# ==========================================================
+class Tarea(models.Model):
+    PENDIENTE = 'Pendiente'
+    EN_PROCESO = 'En proceso'
+    COMPLETADA = 'Completada'
+    FALLIDA = 'Fallida'
+
+    nombre = models.CharField(max_length=100)
+    argumentos = models.JSONField(default=dict)
+    estado = models.CharField(max_length=20, default=PENDIENTE)
+    intentos = models.PositiveIntegerField(default=0)
+    max_intentos = models.PositiveIntegerField(default=3)
+    ejecutar_despues = models.DateTimeField(default=timezone.now)
+    ultimo_error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        # El trabajador busca siempre "pendientes cuya hora ya llegó"
+        indexes = [models.Index(fields=['estado', 'ejecutar_despues'])]
+
+    def __str__(self):
+        return f"{self.nombre} #{self.id} ({self.estado})"
+
+# ==========================================================
+# TABLA: Pedidos Archivados (historial frío)
+# ==========================================================
+class PedidoArchivado(models.Model):
+    # Conserva el número del pedido original. Dirección y líneas van empacadas
+    # en JSON para que el historial viejo ocupe una sola fila por pedido.
+    id = models.BigIntegerField(primary_key=True)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    fecha_pedido = models.DateTimeField()
+    total = models.DecimalField(max_digits=12, decimal_places=2)
+    estado = models.CharField(max_length=20)
+    direccion_envio = models.JSONField(null=True, blank=True)
+    lineas = models.JSONField(default=list)
+    # Cambios de estado del pedido (HistorialEstadoPedido), del más antiguo al más nuevo
+    historial_estados = models.JSONField(default=list)
+    fecha_archivado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['usuario', '-fecha_pedido'])]
+
+    @property
+    def detalles(self):
+        return self.lineas
+
+    def __str__(self):
+        return f"Pedido archivado #{self.id}"
+
+# ==========================================================
+# TABLA: Recomendaciones "Se compran juntos"
+# ==========================================================
+class Recomendacion(models.Model):
+    # Vecinos más frecuentes de cada producto en los mismos pedidos. La
+    # calcula el comando recalcular_recomendaciones; servirla es una sola
+    # consulta por el índice (origen, posicion).
+    origen = models.CharField(max_length=40)  # Clave de carrito: 'celular_12'
+    categoria = models.CharField(max_length=20, choices=DetallePedido.CATEGORIAS)
+    producto_id = models.PositiveIntegerField()
+    nombre = models.CharField(max_length=150)
+    imagen_url = models.URLField()
+    puntuacion = models.FloatField()
+    posicion = models.PositiveSmallIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['origen', 'posicion'])]
+
     def __str__(self):
-        return f"Detalle del pedido #{self.pedido.id}"
\ No newline at end of file
+        return f"{self.origen} -> {self.categoria}_{self.producto_id} ({self.puntuacion:.3f})"
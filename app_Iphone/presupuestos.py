@@ -0,0 +1,307 @@
+"""
+Presupuestos de consultas por vista. Recorre las rutas con nombre de
+app_Iphone/urls.py con la sesión que cada vista espera (anónima, usuario o
+administrador) y compara el número de consultas contra su presupuesto. Las
+vistas del carrito y del checkout que solo aceptan POST se miden además
+recorriendo el flujo de compra como un cliente real (medir_flujo_post).
+"""
+import json
+import uuid
+
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from . import codigos_postales, urls as app_urls
+from .models import Usuario
+
+# Máximo de consultas por nombre de URL (incluye la carga de la sesión cuando
+# la vista se visita con sesión de usuario o administrador). Lo que una
+# función nueva agregue a una vista no se suma aquí: va en AUMENTOS con su razón.
+PRESUPUESTOS_CONSULTAS = {
+    # Tienda (anónimo): el badge del carrito sale de la sesión, sin consultas
+    'tienda_index': 0,
+    'tienda_login': 0,
+    'tienda_registro': 0,
+    # Categorías: solo el catálogo de la categoría (en caché)
+    'tienda_celulares': 1,
+    'tienda_laptops': 1,
+    'tienda_tablets': 1,
+    'tienda_airpods': 1,
+    'tienda_accesorios': 1,
+    # El índice se arma del catálogo en caché, popularidad incluida
+    'tienda_autocompletar': 0,
+    # Carrito y checkout (usuario con un producto de cada tipo en el carrito):
+    # la sesión y todos los productos del carrito en una consulta (UNION ALL)
+    # más las recomendaciones del carrito
+    'tienda_ver_carrito': 3,
+    'tienda_carrito_api': 2,
+    'tienda_mostrar_direccion': 2,
+    'tienda_pago': 3,
+    # + el usuario con dirección y tarjeta, y guardar la foto del carrito en la sesión
+    'tienda_resumen_pedido': 6,
+    'tienda_mis_pedidos': 5,
+    # Sin ASGI responde 204 sin leer la sesión; con ASGI solo lee la sesión
+    'tienda_eventos_pedidos': 0,
+    'tienda_logout': 3,
+    'tienda_estado_sesion': 1,
+    # Un código no visto antes: una consulta por el índice (después, caché)
+    'tienda_codigo_postal': 1,
+    # Vistas que solo aceptan POST: un GET redirige sin tocar la BD
+    'tienda_agregar_al_carrito': 0,
+    'tienda_eliminar_del_carrito': 0,
+    'tienda_actualizar_item_carrito': 0,
+    'tienda_guardar_direccion': 0,
+    'tienda_guardar_pago': 0,
+    'tienda_finalizar_compra': 0,
+    # Administración
+    'inicio_crud': 1,
+    'metricas_rendimiento': 1,
+    'agregar_usuario': 0,
+    'ver_usuario': 2,
+    'actualizar_usuario': 2,
+    'realizar_actualizacion_usuario': 0,
+    'borrar_usuario': 1,
+    'actualizar_pedido': 3,
+    # Sesión y la página de la cola (los pedidos con su usuario, limitados)
+    'cola_pedidos': 2,
+    'agregar_celular': 0, 'ver_celular': 1, 'actualizar_celular': 1,
+    'realizar_actualizacion_celular': 0, 'borrar_celular': 1,
+    'agregar_laptop': 0, 'ver_laptop': 1, 'actualizar_laptop': 1,
+    'realizar_actualizacion_laptop': 0, 'borrar_laptop': 1,
+    'agregar_airpod': 0, 'ver_airpod': 1, 'actualizar_airpod': 1,
+    'realizar_actualizacion_airpod': 0, 'borrar_airpod': 1,
+    'agregar_tablet': 0, 'ver_tablet': 1, 'actualizar_tablet': 1,
+    'realizar_actualizacion_tablet': 0, 'borrar_tablet': 1,
+    'agregar_accesorio': 0, 'ver_accesorio': 1, 'actualizar_accesorio': 1,
+    'realizar_actualizacion_accesorio': 0, 'borrar_accesorio': 1,
+}
+
+# Las mismas vistas con POST, medidas en el orden del flujo de compra (el
+# carrito con un producto de cada tipo). Cuentan también BEGIN y COMMIT, que
+# con SQLite son sentencias aparte; guardar la sesión son tres (BEGIN,
+# UPDATE, COMMIT).
+PRESUPUESTOS_POST = {
+    # Existe el producto + cargar y guardar la sesión
+    'tienda_agregar_al_carrito': 5,
+    'tienda_actualizar_item_carrito': 4,
+    'tienda_eliminar_del_carrito': 4,
+    # + productos del carrito (una consulta)
+    'tienda_carrito_api': 5,
+    # Sesión, usuario, código postal, dirección existente; si es nueva,
+    # INSERT en su transacción y asignarla al usuario
+    'tienda_guardar_direccion': 8,
+    'tienda_guardar_pago': 4,
+    # Sesión, usuario, clave de idempotencia, precios (una consulta); en la
+    # transacción: clave, existencias (un UPDATE por tipo), pedido, detalles
+    # en un INSERT, clave con su pedido, resumen del usuario y tarea de correo;
+    # guardar la sesión
+    'tienda_finalizar_compra': 20,
+}
+
+SUFIJO_POST = ' (POST)'
+
+# Consultas que una función agregó a una vista, cada una con su justificación.
+# El presupuesto efectivo es el de arriba más una consulta por aumento.
+AUMENTOS = {
+    **{
+        nombre: {
+            'recomendaciones': (
+                'Sugerencias de otras categorías; en caché con la versión de '
+                'recomendaciones, solo se consulta al cambiar esa versión.'
+            ),
+        }
+        for nombre in ('tienda_celulares', 'tienda_laptops', 'tienda_tablets',
+                       'tienda_airpods', 'tienda_accesorios')
+    },
+}
+for _nombre in ('tienda_celulares', 'tienda_laptops', 'tienda_tablets', 'tienda_airpods'):
+    AUMENTOS[_nombre]['compatibilidad'] = (
+        'Accesorios compatibles de toda la categoría en una consulta por el índice '
+        'de CompatibilidadAccesorio; en caché con la versión del catálogo.'
+    )
+
+
+def presupuesto(nombre):
+    """Presupuesto efectivo de la vista (None si no tiene); 'nombre (POST)' para las de POST."""
+    if nombre.endswith(SUFIJO_POST):
+        return PRESUPUESTOS_POST.get(nombre[:-len(SUFIJO_POST)])
+    base = PRESUPUESTOS_CONSULTAS.get(nombre)
+    if base is None:
+        return None
+    return base + len(AUMENTOS.get(nombre, {}))
+
+
+# Vistas públicas: se visitan sin cookie de sesión
+RUTAS_ANONIMAS = {
+    'tienda_index', 'tienda_login', 'tienda_registro', 'tienda_celulares',
+    'tienda_laptops', 'tienda_tablets', 'tienda_airpods', 'tienda_accesorios',
+    'tienda_autocompletar', 'tienda_codigo_postal',
+}
+
+TIPOS_PRODUCTO = ('celular', 'laptop', 'tablet', 'airpod', 'accesorio')
+
+
+def preparar_contexto(catalogo):
+    """
+    Elige los objetos con los que se llenan los parámetros de las rutas: el
+    usuario con más pedidos, uno de sus pedidos y un producto de cada tipo.
+    """
+    usuario = (
+        Usuario.objects.annotate(n=Count('pedido')).order_by('-n', 'id').first()
+    )
+    pedido = usuario.pedido_set.order_by('id').first()
+    productos = {tipo: catalogo[tipo][0][0] for tipo in TIPOS_PRODUCTO}
+    carrito = {
+        f'{tipo}_{producto_id}': {'id': producto_id, 'type': tipo, 'qty': 1}
+        for tipo, producto_id in productos.items()
+    }
+    return {
+        'usuario': usuario,
+        'carrito': carrito,
+        'kwargs': {
+            'usuario_id': usuario.id,
+            'pedido_id': pedido.id if pedido else 0,
+            'item_key': next(iter(carrito)),
+            **{f'{tipo}_id': producto_id for tipo, producto_id in productos.items()},
+        },
+    }
+
+
+def _cliente_para(nombre, ruta, contexto):
+    """Crea un cliente con la sesión que la vista espera (fuera de la medición)."""
+    client = Client()
+    if nombre in RUTAS_ANONIMAS:
+        return client
+    session = client.session
+    if ruta.startswith('admin/'):
+        session['es_admin'] = True
+        session['usuario_id'] = 0
+    else:
+        usuario = contexto['usuario']
+        session['es_admin'] = False
+        session['usuario_id'] = usuario.id
+        session['usuario_nombre'] = usuario.nombre
+        session['cart'] = dict(contexto['carrito'])
+        session['cart_item_count'] = len(contexto['carrito'])
+    session.save()
+    return client
+
+
+def rutas_con_nombre():
+    """(nombre, ruta, parámetros) de cada ruta con nombre de la app."""
+    for patron in app_urls.urlpatterns:
+        if isinstance(patron, URLPattern) and patron.name:
+            yield patron.name, str(patron.pattern), list(patron.pattern.converters)
+
+
+def medir_rutas(contexto):
+    """Visita cada ruta con GET y devuelve {nombre: [sql, ...]} con las consultas hechas."""
+    mediciones = {}
+    for nombre, ruta, parametros in rutas_con_nombre():
+        url = reverse(nombre, kwargs={p: contexto['kwargs'][p] for p in parametros})
+        client = _cliente_para(nombre, ruta, contexto)
+        with CaptureQueriesContext(connection) as consultas:
+            client.get(url)
+        # Los SAVEPOINT vienen de la transacción que envuelve cada prueba, no de la vista
+        mediciones[nombre] = [
+            q['sql'] for q in consultas.captured_queries
+            if 'SAVEPOINT' not in q['sql']
+        ]
+    return mediciones
+
+
+def medir_flujo_post(contexto):
+    """
+    Recorre con POST las vistas del carrito y del checkout en el orden de una
+    compra (como benchmark._pasos) y devuelve {'nombre (POST)': [sql, ...]}.
+    El resumen del pedido se abre sin medir para obtener su clave y versión.
+    Se mide el peor caso: dirección nueva y código postal sin caché.
+    """
+    codigos_postales.invalidar()
+    client = _cliente_para('tienda_ver_carrito', '', contexto)
+    usuario = contexto['usuario']
+    item_key = contexto['kwargs']['item_key']
+    tipo, producto_id = item_key.rsplit('_', 1)
+    estado = {}
+
+    def finalizar():
+        return client.post(reverse('tienda_finalizar_compra'), estado)
+
+    pasos = [
+        ('tienda_agregar_al_carrito', lambda: client.post(reverse('tienda_agregar_al_carrito'), {
+            'product_id': producto_id, 'product_type': tipo, 'cantidad': 1,
+        })),
+        ('tienda_actualizar_item_carrito', lambda: client.post(
+            reverse('tienda_actualizar_item_carrito', args=[item_key]), {'cantidad': 3}
+        )),
+        ('tienda_eliminar_del_carrito', lambda: client.post(
+            reverse('tienda_eliminar_del_carrito', args=[item_key])
+        )),
+        ('tienda_carrito_api', lambda: client.post(
+            reverse('tienda_carrito_api'),
+            json.dumps({'operaciones': [{'op': 'agregar', 'type': tipo, 'id': int(producto_id)}]}),
+            content_type='application/json',
+        )),
+        ('tienda_guardar_direccion', lambda: client.post(reverse('tienda_guardar_direccion'), {
+            'calle': f'Av. Vallarta {uuid.uuid4().hex[:8]}', 'codigo_postal': '44100', 'colonia': 'Centro',
+            'ciudad': 'Guadalajara', 'pais': 'México',
+        })),
+        ('tienda_guardar_pago', lambda: client.post(reverse('tienda_guardar_pago'), {
+            'titular': usuario.nombre, 'numero_tarjeta': '4111111111111111',
+            'fecha_vencimiento': '12/30', 'cvv': '123',
+        })),
+        ('tienda_finalizar_compra', finalizar),
+    ]
+    pedidos = usuario.pedido_set.count()
+    mediciones = {}
+    for nombre, paso in pasos:
+        if nombre == 'tienda_finalizar_compra':
+            resumen = client.get(reverse('tienda_resumen_pedido')).context
+            estado.update(
+                clave_idempotencia=resumen['clave_idempotencia'],
+                version_carrito=resumen['version_carrito'],
+            )
+        with CaptureQueriesContext(connection) as consultas:
+            response = paso()
+        if response.status_code >= 400:
+            raise RuntimeError(f'{nombre} (POST) respondió {response.status_code}')
+        mediciones[nombre + SUFIJO_POST] = [
+            q['sql'] for q in consultas.captured_queries if 'SAVEPOINT' not in q['sql']
+        ]
+    # La compra tiene que haberse registrado, no regresado al resumen
+    if usuario.pedido_set.count() != pedidos + 1:
+        raise RuntimeError('tienda_finalizar_compra (POST) no registró el pedido')
+    return mediciones
+
+
+def verificar_presupuestos(*mediciones_por_escala):
+    """
+    Devuelve los errores encontrados: rutas sin presupuesto, rutas que lo
+    exceden en alguna escala y rutas cuyo conteo cambia con el tamaño de los datos.
+    Cada error incluye el SQL ejecutado.
+    """
+    errores = []
+    primera = mediciones_por_escala[0]
+    for nombre in primera:
+        limite = presupuesto(nombre)
+        if limite is None:
+            errores.append(f'{nombre}: no tiene presupuesto de consultas declarado')
+            continue
+        conteos = [len(m[nombre]) for m in mediciones_por_escala]
+        peor = max(mediciones_por_escala, key=lambda m: len(m[nombre]))[nombre]
+        if max(conteos) > limite:
+            aumentos = ', '.join(AUMENTOS.get(nombre, {}))
+            errores.append(
+                f'{nombre}: {max(conteos)} consultas (presupuesto {limite}'
+                + (f', con aumentos: {aumentos}' if aumentos else '') + ')\n    '
+                + '\n    '.join(peor)
+            )
+        elif len(set(conteos)) > 1:
+            errores.append(
+                f'{nombre}: las consultas crecen con los datos {conteos}\n    '
+                + '\n    '.join(peor)
+            )
+    return errores
@@ -0,0 +1,218 @@
+"""
+Recomendaciones "Se compran juntos" a partir de la co-ocurrencia de productos
+en los mismos pedidos (activos y archivados).
+
+Los pedidos activos se cuentan en la BD: un self-join de DetallePedido por
+pedido agrupado por par de productos devuelve ya las veces que cada par se
+compró junto, y Python solo recibe una fila por par distinto. Los archivados
+guardan sus líneas en JSON y se recorren en lotes (iterator). En ambos casos
+la memoria depende del número de pares de productos distintos, no del número
+de líneas. Para cada producto se guardan sus K vecinos con mayor puntuación
+(coseno: veces juntos / raíz(pedidos de A × pedidos de B)) en la tabla
+Recomendacion. Servirlas es una consulta por el índice (origen, posicion).
+
+La tabla se reconstruye completa con el comando recalcular_recomendaciones
+(p. ej. cada noche desde cron); entre reconstrucciones las sugerencias no
+cambian, lo cual es aceptable para este tipo de datos.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from . import vuelo_unico
+from .catalogo import MODELOS
+from .models import DetallePedido, PedidoArchivado, Recomendacion
+
+# Un pedido con más productos distintos que esto (compras de mayoreo) no se
+# cuenta: sus pares crecen con el cuadrado y aportan poca señal
+MAX_PRODUCTOS_POR_PEDIDO = 50
+
+# Productos distintos de cada pedido activo que no es de mayoreo. El SKU ya
+# distingue la categoría (prefijo), así que basta para ordenar los pares. Ambas
+# lecturas salen del índice (pedido, sku, categoria) de DetallePedido, y en el
+# self-join la CTE se calcula una sola vez.
+_LINEAS = '''
+    WITH lineas AS (SELECT DISTINCT pedido_id, categoria, sku FROM {tabla}
+    WHERE sku <> '' AND pedido_id IN (
+        SELECT pedido_id FROM {tabla} WHERE sku <> ''
+        GROUP BY pedido_id HAVING COUNT(DISTINCT sku) <= %s
+    ))
+'''
+
+
+def _producto(categoria, sku):
+    """Clave de carrito ('celular_12') a partir de la copia guardada en la línea."""
+    try:
+        return f'{categoria}_{int(sku.rsplit("-", 1)[1])}'
+    except (IndexError, ValueError):
+        return None
+
+
+def _canastas_archivadas(lote):
+    """Genera el conjunto de productos de cada pedido archivado."""
+    for lineas in PedidoArchivado.objects.values_list('lineas', flat=True).iterator(chunk_size=lote):
+        canasta = {
+            producto for producto in (
+                _producto(l.get('categoria', ''), l.get('sku', '')) for l in lineas or []
+            ) if producto
+        }
+        if canasta:
+            yield canasta
+
+
+def contar(canastas):
+    """(pedidos por producto, veces juntos por par). Cada par se cuenta en ambos sentidos."""
+    por_producto = Counter()
+    juntos = defaultdict(Counter)
+    for canasta in canastas:
+        if len(canasta) > MAX_PRODUCTOS_POR_PEDIDO:
+            continue
+        productos = sorted(canasta)
+        por_producto.update(productos)
+        for i, a in enumerate(productos):
+            for b in productos[i + 1:]:
+                juntos[a][b] += 1
+                juntos[b][a] += 1
+    return por_producto, juntos
+
+
+def contar_activos(por_producto=None, juntos=None):
+    """
+    Como contar(), pero para los pedidos activos y en la BD: una consulta
+    agregada por producto y un self-join agrupado por par. Suma sobre
+    `por_producto` y `juntos` si se pasan.
+    """
+    por_producto = Counter() if por_producto is None else por_producto
+    juntos = defaultdict(Counter) if juntos is None else juntos
+    lineas = _LINEAS.format(tabla=connection.ops.quote_name(DetallePedido._meta.db_table))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'{lineas} SELECT categoria, sku, COUNT(*) FROM lineas GROUP BY categoria, sku',
+            [MAX_PRODUCTOS_POR_PEDIDO],
+        )
+        for categoria, sku, pedidos in cursor.fetchall():
+            producto = _producto(categoria, sku)
+            if producto:
+                por_producto[producto] += pedidos
+
+        cursor.execute(
+            f'{lineas} SELECT a.categoria, a.sku, b.categoria, b.sku, COUNT(*) '
+            f'FROM lineas a JOIN lineas b ON a.pedido_id = b.pedido_id AND a.sku < b.sku '
+            f'GROUP BY a.categoria, a.sku, b.categoria, b.sku',
+            [MAX_PRODUCTOS_POR_PEDIDO],
+        )
+        for categoria_a, sku_a, categoria_b, sku_b, veces in cursor:
+            a, b = _producto(categoria_a, sku_a), _producto(categoria_b, sku_b)
+            if a and b:
+                juntos[a][b] += veces
+                juntos[b][a] += veces
+    return por_producto, juntos
+
+
+def vecinos(por_producto, juntos, top):
+    """{producto: [(vecino, puntuación), ...]} con los `top` vecinos de mayor puntuación."""
+    resultado = {}
+    for a, conteos in juntos.items():
+        puntuados = (
+            (b, c / math.sqrt(por_producto[a] * por_producto[b])) for b, c in conteos.items()
+        )
+        resultado[a] = heapq.nlargest(top, puntuados, key=lambda par: (par[1], par[0]))
+    return resultado
+
+
+def _productos_vigentes(claves):
+    """{clave: objeto} de los productos que siguen en el catálogo (una consulta por tipo)."""
+    ids_por_tipo = defaultdict(set)
+    for clave in claves:
+        tipo, pk = clave.rsplit('_', 1)
+        ids_por_tipo[tipo].add(int(pk))
+    return {
+        f'{tipo}_{obj.pk}': obj
+        for tipo, ids in ids_por_tipo.items() if tipo in MODELOS
+        for obj in MODELOS[tipo].objects.filter(pk__in=ids)
+    }
+
+
+def recalcular(top=None, lote=2000):
+    """Reconstruye la tabla Recomendacion. Devuelve cuántas filas guardó."""
+    if top is None:
+        top = getattr(settings, 'RECOMENDACIONES_TOP', 8)
+    por_producto, juntos = contar_activos(*contar(_canastas_archivadas(lote)))
+    listas = vecinos(por_producto, juntos, top)
+    del juntos
+
+    vigentes = _productos_vigentes(
+        {a for a in listas} | {b for lista in listas.values() for b, _ in lista}
+    )
+    filas = []
+    for origen, lista in listas.items():
+        if origen not in vigentes:
+            continue
+        posicion = 0
+        for destino, puntuacion in lista:
+            producto = vigentes.get(destino)
+            if producto is None:
+                continue
+            categoria = destino.rsplit('_', 1)[0]
+            filas.append(Recomendacion(
+                origen=origen, categoria=categoria, producto_id=producto.pk,
+                nombre=str(producto)[:150], imagen_url=producto.imagen_url,
+                puntuacion=puntuacion, posicion=posicion,
+            ))
+            posicion += 1
+
+    with transaction.atomic():
+        Recomendacion.objects.all().delete()
+        Recomendacion.objects.bulk_create(filas, batch_size=lote)
+    invalidar()
+    return len(filas)
+
+
+def invalidar():
+    """Descarta las sugerencias por categoría en caché."""
+    vuelo_unico.nueva_version('recomendaciones')
+
+
+def _sumar(consulta, excluir, limite):
+    """Agrupa filas de Recomendacion por producto sugerido y devuelve las de mayor puntuación."""
+    sugeridos = (
+        consulta.values('categoria', 'producto_id', 'nombre', 'imagen_url')
+        .annotate(total=Sum('puntuacion')).order_by('-total', 'categoria', 'producto_id')
+    )[:limite + len(excluir)]
+    resultado = []
+    for fila in sugeridos:
+        key = f"{fila['categoria']}_{fila['producto_id']}"
+        if key in excluir:
+            continue
+        resultado.append({
+            'key': key, 'type': fila['categoria'], 'id': fila['producto_id'],
+            'nombre': fila['nombre'], 'imagen_url': fila['imagen_url'],
+        })
+        if len(resultado) == limite:
+            break
+    return resultado
+
+
+def para_carrito(claves, limite=4):
+    """Sugerencias para las líneas del carrito (una consulta), sin repetir lo que ya tiene."""
+    claves = set(claves)
+    if not claves:
+        return []
+    return _sumar(Recomendacion.objects.filter(origen__in=claves), claves, limite)
+
+
+def para_categoria(tipo, limite=4):
+    """Productos de otras categorías que suelen comprarse con los de `tipo` (en caché)."""
+    return vuelo_unico.obtener(
+        f'recomendaciones:{tipo}',
+        lambda: _sumar(
+            Recomendacion.objects.filter(origen__startswith=f'{tipo}_').exclude(categoria=tipo),
+            set(), limite,
+        ),
+        getattr(settings, 'CATALOGO_CACHE_SEGUNDOS', 60),
+        version=vuelo_unico.version('recomendaciones'),
+    )
@@ -0,0 +1,70 @@
+"""
+Réplicas de lectura. El router manda a una réplica solo las lecturas de las
+vistas de consulta (catálogo, historial, listados del admin) marcadas por
+ReplicaLecturaMiddleware; todo lo demás (carrito, checkout, CRUD, sesiones,
+tareas) va al primario. En local las réplicas son copias SQLite que se
+actualizan con sincronizar_replicas().
+"""
+import random
+import sqlite3
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+# Vistas de solo lectura que pueden leer de una réplica (nombres de URL)
+RUTAS_REPLICA = {
+    'tienda_celulares', 'tienda_laptops', 'tienda_tablets', 'tienda_airpods',
+    'tienda_accesorios', 'tienda_mis_pedidos',
+    'ver_usuario', 'ver_celular', 'ver_laptop', 'ver_tablet', 'ver_airpod', 'ver_accesorio',
+}
+
+# True mientras se atiende una petición marcada para leer de réplica
+usar_replica = ContextVar('usar_replica', default=False)
+
+
+class RouterReplicas:
+    """Lecturas de app_Iphone a réplica cuando la petición lo permite; el resto al primario."""
+
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, 'REPLICAS_LECTURA', [])
+        if replicas and usar_replica.get() and model._meta.app_label == 'app_Iphone':
+            return random.choice(replicas)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas y primario tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas se copian completas del primario (sincronizar_replicas),
+        # nunca se migran por su cuenta
+        return not db.startswith('replica_')
+
+
+def sincronizar_replicas(origen='default'):
+    """
+    Copia la base primaria sobre cada réplica con la API de respaldo de
+    SQLite (copia consistente aunque haya escrituras en curso).
+    """
+    conexion_origen = connections[origen]
+    conexion_origen.ensure_connection()
+    copiadas = []
+    for alias in alias_replicas():
+        # La conexión de Django a la réplica se cierra para que no lea páginas viejas
+        connections[alias].close()
+        destino = sqlite3.connect(str(connections[alias].settings_dict['NAME']))
+        try:
+            conexion_origen.connection.backup(destino)
+        finally:
+            destino.close()
+        copiadas.append(alias)
+    return copiadas
+
+
+def alias_replicas():
+    """Réplicas declaradas en DATABASES (estén o no activas en el router)."""
+    return [alias for alias in settings.DATABASES if alias.startswith('replica_')]
@@ -0,0 +1,52 @@
+"""
+Reportes del administrador en caché. La lista de usuarios con su resumen de
+pedidos (ver_usuario) se calcula una sola vez por combinación de orden y
+filtros (ver vuelo_unico.py). Dar de alta, editar o borrar un usuario o un
+pedido cambia la versión de los reportes; los contadores que se actualizan sin
+guardar el modelo (F()) se ven a más tardar en REPORTES_CACHE_SEGUNDOS.
+"""
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+
+from . import vuelo_unico
+from .models import Usuario, Pedido
+from .replicas import usar_replica
+
+ORDEN_USUARIOS = {
+    'id': [F('id').asc()],
+    'pedidos': [F('pedidos_count').desc(), F('id').asc()],
+    'gastado': [F('total_gastado').desc(), F('id').asc()],
+    'reciente': [F('ultimo_pedido').desc(nulls_last=True), F('id').asc()],
+}
+
+
+def usuarios(orden='id', min_pedidos=None, min_gastado=None):
+    """Usuarios (con dirección y método de pago) ordenados y filtrados por su resumen de pedidos."""
+    def consultar():
+        consulta = Usuario.objects.select_related('direccion', 'metodo_pago').order_by(*ORDEN_USUARIOS[orden])
+        if min_pedidos is not None:
+            consulta = consulta.filter(pedidos_count__gte=min_pedidos)
+        if min_gastado is not None:
+            consulta = consulta.filter(total_gastado__gte=min_gastado)
+        return list(consulta)
+
+    # Como en catalogo.py: lo leído de una réplica se guarda aparte, para que
+    # el administrador que acaba de escribir (lee del primario) vea su cambio
+    origen = 'replica' if usar_replica.get() else 'primario'
+    return vuelo_unico.obtener(
+        f'reportes:usuarios:{origen}:{orden}:{min_pedidos}:{min_gastado}',
+        consultar,
+        getattr(settings, 'REPORTES_CACHE_SEGUNDOS', 30),
+        version=vuelo_unico.version('reportes'),
+    )
+
+
+def invalidar(**kwargs):
+    """Los reportes dejan de estar vigentes (se llama al cambiar usuarios o pedidos)."""
+    vuelo_unico.nueva_version('reportes')
+
+
+for _modelo in (Usuario, Pedido):
+    post_save.connect(invalidar, sender=_modelo, dispatch_uid=f'reportes_{_modelo.__name__}_save')
+    post_delete.connect(invalidar, sender=_modelo, dispatch_uid=f'reportes_{_modelo.__name__}_delete')
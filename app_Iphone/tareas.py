@@ -0,0 +1,193 @@
+"""
+Cola de tareas en segundo plano respaldada por la base de datos. El checkout
+inserta la Tarea dentro de su misma transacción (si el pedido se deshace, la
+tarea también) y, al confirmarse, despierta al trabajador. No requiere broker:
+el trabajador es un hilo del propio proceso o el comando `procesar_tareas`.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Pedido, Tarea
+
+logger = logging.getLogger(__name__)
+
+# Nombre de la tarea -> función que la ejecuta
+_REGISTRO = {}
+
+
+def tarea(nombre=None, max_intentos=3):
+    """Registra una función como tarea: @tarea() o @tarea('nombre', max_intentos=5)."""
+    def decorador(funcion):
+        funcion.nombre_tarea = nombre or funcion.__name__
+        funcion.max_intentos = max_intentos
+        _REGISTRO[funcion.nombre_tarea] = funcion
+        return funcion
+    return decorador
+
+
+def encolar(funcion, **argumentos):
+    """
+    Inserta la tarea en la transacción actual. Solo se vuelve visible (y se
+    avisa al trabajador) cuando la transacción se confirma.
+    """
+    registro = Tarea.objects.create(
+        nombre=funcion.nombre_tarea, argumentos=argumentos, max_intentos=funcion.max_intentos
+    )
+    transaction.on_commit(_despertar_trabajador)
+    return registro
+
+
+# ==========================================================
+# EJECUCIÓN
+# ==========================================================
+
+def _reclamar(limite):
+    """
+    Marca hasta `limite` tareas vencidas como 'En proceso' y las devuelve. Una
+    tarea 'En proceso' cuyo plazo venció (trabajador caído) se vuelve a reclamar.
+    """
+    ahora = timezone.now()
+    candidatas = list(
+        Tarea.objects.filter(
+            estado__in=[Tarea.PENDIENTE, Tarea.EN_PROCESO], ejecutar_despues__lte=ahora
+        )
+        .order_by('ejecutar_despues', 'id')
+        .values_list('id', 'estado', 'ejecutar_despues')[:limite]
+    )
+    plazo = ahora + timedelta(seconds=getattr(settings, 'TAREAS_PLAZO_SEGUNDOS', 300))
+    reclamadas = []
+    for tarea_id, estado, ejecutar_despues in candidatas:
+        # UPDATE condicional: si otro trabajador la tomó primero no afecta filas
+        tomada = Tarea.objects.filter(
+            pk=tarea_id, estado=estado, ejecutar_despues=ejecutar_despues
+        ).update(estado=Tarea.EN_PROCESO, ejecutar_despues=plazo)
+        if tomada:
+            reclamadas.append(tarea_id)
+    return list(Tarea.objects.filter(pk__in=reclamadas).order_by('id'))
+
+
+def _ejecutar(registro):
+    """Corre una tarea reclamada y guarda el resultado (o programa el reintento)."""
+    funcion = _REGISTRO.get(registro.nombre)
+    registro.intentos += 1
+    try:
+        if funcion is None:
+            raise LookupError(f'Tarea no registrada: {registro.nombre}')
+        funcion(**registro.argumentos)
+    except Exception as error:
+        registro.ultimo_error = f'{type(error).__name__}: {error}'
+        if registro.intentos < registro.max_intentos:
+            # Espera exponencial: 2, 4, 8... segundos
+            registro.estado = Tarea.PENDIENTE
+            registro.ejecutar_despues = timezone.now() + timedelta(seconds=2 ** registro.intentos)
+        else:
+            registro.estado = Tarea.FALLIDA
+            logger.exception('La tarea %s falló definitivamente', registro)
+    else:
+        registro.estado = Tarea.COMPLETADA
+        registro.ultimo_error = ''
+    registro.save(update_fields=['estado', 'intentos', 'ejecutar_despues', 'ultimo_error'])
+    return registro.estado
+
+
+def procesar_pendientes(limite=50):
+    """Ejecuta en este hilo todas las tareas vencidas. Devuelve cuántas procesó."""
+    procesadas = 0
+    while True:
+        lote = _reclamar(limite)
+        if not lote:
+            return procesadas
+        for registro in lote:
+            _ejecutar(registro)
+        procesadas += len(lote)
+
+
+class Trabajador:
+    """Reclama tareas en lotes y las reparte en un pool de hilos."""
+
+    def __init__(self, hilos=2, intervalo=5.0):
+        self.hilos = hilos
+        self.intervalo = intervalo
+        self.aviso = threading.Event()
+        self.detener = threading.Event()
+
+    def _ejecutar_en_hilo(self, registro):
+        try:
+            return _ejecutar(registro)
+        finally:
+            close_old_connections()
+
+    def ejecutar_para_siempre(self):
+        with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='tarea') as pool:
+            while not self.detener.is_set():
+                try:
+                    lote = _reclamar(self.hilos * 4)
+                except Exception:
+                    logger.exception('No se pudieron reclamar tareas')
+                    lote = []
+                finally:
+                    close_old_connections()
+                if lote:
+                    list(pool.map(self._ejecutar_en_hilo, lote))
+                    continue
+                # Sin trabajo: dormir hasta el próximo aviso o el intervalo de sondeo
+                self.aviso.wait(self.intervalo)
+                self.aviso.clear()
+
+
+# Trabajador dentro del proceso web (TAREAS_EJECUCION = 'local')
+_trabajador_local = None
+_pid_trabajador = None
+_lock_trabajador = threading.Lock()
+
+
+def _despertar_trabajador():
+    modo = getattr(settings, 'TAREAS_EJECUCION', 'local')
+    if modo == 'inmediata':
+        procesar_pendientes()
+    elif modo == 'local':
+        _obtener_trabajador_local().aviso.set()
+    # 'externa': el comando procesar_tareas sondea la tabla por su cuenta
+
+
+def _obtener_trabajador_local():
+    global _trabajador_local, _pid_trabajador
+    with _lock_trabajador:
+        # Tras un fork el hilo del padre no existe en el hijo: se arranca uno nuevo
+        if _trabajador_local is None or _pid_trabajador != os.getpid():
+            _trabajador_local = Trabajador(hilos=getattr(settings, 'TAREAS_HILOS', 2))
+            _pid_trabajador = os.getpid()
+            threading.Thread(
+                target=_trabajador_local.ejecutar_para_siempre, name='trabajador-tareas', daemon=True
+            ).start()
+        return _trabajador_local
+
+
+# ==========================================================
+# TAREAS DE LA TIENDA
+# ==========================================================
+
+@tarea(max_intentos=5)
+def enviar_confirmacion_pedido(pedido_id):
+    """Correo de confirmación con el resumen del pedido."""
+    pedido = Pedido.objects.select_related('usuario').filter(pk=pedido_id).first()
+    if pedido is None:
+        return  # El pedido (o su usuario) se borró antes de enviar el correo
+    send_mail(
+        subject=f'Confirmación de tu pedido #{pedido.id}',
+        message=(
+            f'Hola {pedido.usuario.nombre},\n\n'
+            f'Recibimos tu pedido #{pedido.id} por ${pedido.total}. '
+            f'Te avisaremos cuando sea enviado.'
+        ),
+        from_email=None,
+        recipient_list=[pedido.usuario.email],
+    )
@@ -1,3 +1,1226 @@
-from django.test import TestCase
+from concurrent import futures
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import skipUnless
+from django.http import HttpResponse
+import asyncio
+import gc
+import runpy
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import (
+    TestCase, TransactionTestCase, AsyncClient, Client, RequestFactory, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    autocompletar, catalogo, compatibilidad, estados_pedido, eventos_pedido, recomendaciones, reportes,
+    vuelo_unico
+)
+from .archivo import archivar_lote
+from .arranque import precalentar
+from .benchmark import generar_datos, ejecutar_benchmark, comparar_con_base
+from .middleware import InstrumentacionMiddleware, limitador, registro_metricas
+from .replicas import sincronizar_replicas, usar_replica
+from .presupuestos import (
+    AUMENTOS, PRESUPUESTOS_CONSULTAS, PRESUPUESTOS_POST, preparar_contexto, medir_flujo_post,
+    medir_rutas, verificar_presupuestos
+)
+from .tareas import encolar, procesar_pendientes, tarea
+from .models import (
+    Celular, Usuario, Direccion, MetodoPago, Carrito, CarritoItem, Pedido, DetallePedido,
+    ClaveIdempotencia, Tarea, PedidoArchivado, Recomendacion, Accesorio, HistorialEstadoPedido
+)
+
+
+def _crear_celular(**kwargs):
+    datos = {
+        'modelo': 'iPhone 15', 'descripcion': 'Prueba',
+        'precio': Decimal('999.00'), 'imagen_url': 'https://example.com/a.png',
+    }
+    datos.update(kwargs)
+    return Celular.objects.create(**datos)
+
+
+def _crear_usuario(i=0):
+    return Usuario.objects.create(
+        nombre=f'Cliente {i}', email=f'cliente{i}@example.com', telefono='3300000000',
+        contraseña='secreta',
+        direccion=Direccion.obtener(
+            calle='Av. Juárez 1', codigo_postal='44100', colonia='Centro',
+            ciudad='Guadalajara', pais='México'
+        ),
+        metodo_pago=MetodoPago.objects.create(
+            titular=f'Cliente {i}', numero_tarjeta='4111111111111111',
+            fecha_vencimiento='12/30', cvv='123'
+        ),
+    )
+
+
+def _cliente_con_carrito(usuario, cart):
+    """Cliente con sesión de usuario y un carrito ya armado."""
+    client = Client()
+    session = client.session
+    session['es_admin'] = False
+    session['usuario_id'] = usuario.id
+    session['usuario_nombre'] = usuario.nombre
+    session['cart'] = cart
+    session.save()
+    return client
+
+
+def _version_resumen(client):
+    """Abre el resumen del pedido (toma la foto del carrito) y devuelve su versión."""
+    return client.get(reverse('tienda_resumen_pedido')).context['version_carrito']
+
+
+def _confirmar_compra(client, clave='a1', version=None):
+    """Resumen y confirmación, como lo recorre el navegador."""
+    return client.post(reverse('tienda_finalizar_compra'), {
+        'clave_idempotencia': clave, 'version_carrito': version or _version_resumen(client),
+    })
+
+
+def _cliente_admin():
+    client = Client()
+    session = client.session
+    session['es_admin'] = True
+    session['usuario_id'] = 0
+    session.save()
+    return client
+
+
+# ==========================================================
+# INSTRUMENTACIÓN
+# ==========================================================
+
+@override_settings(INSTRUMENTACION_ACTIVA=True)
+class InstrumentacionTests(TestCase):
+    def setUp(self):
+        registro_metricas.limpiar()
+
+    def test_server_timing_y_metricas_por_ruta(self):
+        _crear_celular()
+        response = Client().get(reverse('tienda_celulares'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+
+        datos = _cliente_admin().get(reverse('metricas_rendimiento')).json()
+        ruta = datos['rutas']['tienda_celulares']
+        self.assertEqual(ruta['peticiones'], 1)
+        self.assertGreaterEqual(ruta['consultas']['p50'], 1)
+
+    def test_detecta_consultas_repetidas(self):
+        ids = [_crear_celular(modelo=f'iPhone {i}').id for i in range(3)]
+
+        def vista_n_mas_1(request):
+            for pk in ids:
+                Celular.objects.get(pk=pk)
+            return HttpResponse('ok')
+
+        InstrumentacionMiddleware(vista_n_mas_1)(RequestFactory().get('/'))
+        ruta = registro_metricas.resumen()['<sin_nombre>']
+        self.assertEqual(ruta['sospechas_n_mas_1'][0]['repeticiones'], 3)
+
+    def test_metricas_solo_admin(self):
+        response = Client().get(reverse('metricas_rendimiento'))
+        self.assertRedirects(response, reverse('tienda_login'), fetch_redirect_response=False)
+
+
+# ==========================================================
+# CÁLCULO ÚNICO (SINGLE FLIGHT)
+# ==========================================================
+
+class VueloUnicoTests(TestCase):
+    def test_peticiones_simultaneas_calculan_una_sola_vez(self):
+        clave = f'prueba:{uuid.uuid4().hex}'
+        calculos = []
+
+        def calcular():
+            calculos.append(1)
+            time.sleep(0.1)
+            return 'resultado'
+
+        resultados = []
+        hilos = [
+            threading.Thread(target=lambda: resultados.append(vuelo_unico.obtener(clave, calcular, 60)))
+            for _ in range(8)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+        self.assertEqual(len(calculos), 1)
+        self.assertEqual(resultados, ['resultado'] * 8)
+
+    def test_copia_obsoleta_mientras_otro_recalcula(self):
+        clave = f'prueba:{uuid.uuid4().hex}'
+        vuelo_unico.obtener(clave, lambda: 'viejo', 60, version=1)
+        # Otro proceso tiene el candado de la clave
+        cache.add(f'{clave}:calculando', 'otro', 30)
+        self.assertEqual(vuelo_unico.obtener(clave, lambda: 'nuevo', 60, version=2), 'viejo')
+        cache.delete(f'{clave}:calculando')
+        self.assertEqual(vuelo_unico.obtener(clave, lambda: 'nuevo', 60, version=2), 'nuevo')
+
+    def test_calculo_anidado_con_el_mismo_candado_local(self):
+        # Como la página anónima que pide el catálogo: dos claves en el mismo candado
+        externa = f'prueba:{uuid.uuid4().hex}'
+        candado = vuelo_unico._candado_local(externa)
+        interna = next(
+            clave for clave in (f'prueba:{uuid.uuid4().hex}' for _ in range(10000))
+            if vuelo_unico._candado_local(clave) is candado
+        )
+
+        inicio = time.monotonic()
+        valor = vuelo_unico.obtener(
+            externa, lambda: vuelo_unico.obtener(interna, lambda: 'interno', 60, espera=1) + '+externo',
+            60, espera=1,
+        )
+        self.assertEqual(valor, 'interno+externo')
+        # Sin esperar el tiempo límite y con la clave interna guardada en caché
+        self.assertLess(time.monotonic() - inicio, 0.5)
+        self.assertEqual(cache.get(interna)[2], 'interno')
+
+
+# ==========================================================
+# CACHÉ DE PÁGINAS ANÓNIMAS
+# ==========================================================
+
+class PaginaAnonimaCacheTests(TestCase):
+    def setUp(self):
+        limitador.cache.clear()
+
+    def test_anonimo_recibe_la_pagina_de_cache_sin_consultas(self):
+        celular = _crear_celular(modelo='iPhone 15')
+        primera = Client().get(reverse('tienda_celulares'))
+        self.assertEqual(primera['X-Cache'], 'MISS')
+        self.assertFalse(primera.cookies)
+        self.assertContains(primera, 'name="csrfmiddlewaretoken" value=""')
+
+        with self.assertNumQueries(0):
+            segunda = Client().get(reverse('tienda_celulares') + '?utm_source=correo')
+        self.assertEqual(segunda['X-Cache'], 'HIT')
+        self.assertEqual(segunda.content, primera.content)
+
+        # Cambiar un producto cambia la versión del catálogo: la página se regenera
+        celular.precio = Decimal('1099.00')
+        celular.save()
+        self.assertContains(Client().get(reverse('tienda_celulares')), '$1099.00')
+
+    def test_con_sesion_no_usa_la_cache_y_el_estado_viene_aparte(self):
+        celular = _crear_celular()
+        client = _cliente_con_carrito(_crear_usuario(), {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 3},
+        })
+        response = client.get(reverse('tienda_celulares'))
+        self.assertNotIn('X-Cache', response)
+        self.assertContains(response, 'Cliente 0')
+
+        estado = client.get(reverse('tienda_estado_sesion')).json()
+        self.assertEqual((estado['autenticado'], estado['nombre'], estado['cart_item_count']), (True, 'Cliente 0', 3))
+        self.assertTrue(estado['csrf_token'])
+
+
+# ==========================================================
+# LÍMITE DE PETICIONES
+# ==========================================================
+
+@override_settings(LIMITES_PETICIONES={'tienda_login': (2, 1)})
+class LimitePeticionesTests(TestCase):
+    def setUp(self):
+        limitador.limpiar()
+        limitador.cache.clear()
+
+    def test_rafaga_agotada_responde_429_sin_tocar_la_bd(self):
+        client = Client(REMOTE_ADDR='10.9.0.1')
+        datos = {'email': 'nadie@example.com', 'password': 'x'}
+        for _ in range(2):
+            self.assertEqual(client.post(reverse('tienda_login'), datos).status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = client.post(reverse('tienda_login'), datos)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # Los GET y otras IPs no se limitan
+        self.assertEqual(client.get(reverse('tienda_login')).status_code, 200)
+        self.assertEqual(Client(REMOTE_ADDR='10.9.0.2').post(reverse('tienda_login'), datos).status_code, 200)
+
+    def test_la_sesion_se_limita_aunque_cambie_la_ip(self):
+        client = _cliente_con_carrito(_crear_usuario(), {})
+        datos = {'email': 'nadie@example.com', 'password': 'x'}
+        for i in range(2):
+            client.post(reverse('tienda_login'), datos, REMOTE_ADDR=f'10.9.1.{i}')
+        response = client.post(reverse('tienda_login'), datos, REMOTE_ADDR='10.9.1.99')
+        self.assertEqual(response.status_code, 429)
+
+    def test_la_sesion_agotada_no_gasta_la_cubeta_de_la_ip(self):
+        datos = {'email': 'nadie@example.com', 'password': 'x'}
+        abusivo = _cliente_con_carrito(_crear_usuario(), {})
+        for _ in range(2):
+            abusivo.post(reverse('tienda_login'), datos, REMOTE_ADDR='10.9.2.1')
+        for _ in range(3):
+            response = abusivo.post(reverse('tienda_login'), datos, REMOTE_ADDR='10.9.2.2')
+            self.assertEqual(response.status_code, 429)
+        # Los rechazos de esa sesión no agotaron la ráfaga de la IP (NAT compartido)
+        vecino = Client(REMOTE_ADDR='10.9.2.2')
+        for _ in range(2):
+            self.assertEqual(vecino.post(reverse('tienda_login'), datos).status_code, 200)
+
+
+# ==========================================================
+# CATÁLOGO EN CACHÉ Y PRECALENTAMIENTO
+# ==========================================================
+
+class CatalogoCacheTests(TestCase):
+    def test_categoria_sin_consultas_con_cache_y_se_invalida_al_guardar(self):
+        celular = _crear_celular(modelo='iPhone 13')
+        Client().get(reverse('tienda_celulares'))
+        with self.assertNumQueries(0):
+            Client().get(reverse('tienda_celulares'))
+
+        celular.modelo = 'iPhone 13 mini'
+        celular.save()
+        self.assertContains(Client().get(reverse('tienda_celulares')), 'iPhone 13 mini')
+
+    def test_precalentar_compila_plantillas_y_carga_catalogo(self):
+        _crear_celular()
+        tiempos = precalentar()
+        self.assertEqual(set(tiempos), {'plantillas', 'urls', 'conexion_bd', 'catalogo', 'autocompletar'})
+        with self.assertNumQueries(0):
+            self.assertEqual(len(catalogo.productos('celular')), 1)
+
+
+class AutocompletarTests(TestCase):
+    def test_sugiere_por_prefijo_de_cualquier_palabra_ordenado_por_ventas(self):
+        pro = _crear_celular(modelo='iPhone 15 Pro', stock=5)
+        base = _crear_celular(modelo='iPhone 15')
+        _confirmar_compra(_cliente_con_carrito(_crear_usuario(), {
+            f'celular_{pro.id}': {'id': pro.id, 'type': 'celular', 'qty': 3},
+        }))
+        pro.refresh_from_db()
+        self.assertEqual((pro.stock, pro.vendidos), (2, 3))
+
+        # La popularidad viene del contador: reconstruir no recorre DetallePedido
+        with CaptureQueriesContext(connection) as consultas:
+            Client().get(reverse('tienda_autocompletar'), {'q': 'x'})  # Construye el índice
+        self.assertFalse([q for q in consultas.captured_queries if 'detallepedido' in q['sql']])
+        with self.assertNumQueries(0):
+            response = Client().get(reverse('tienda_autocompletar'), {'q': 'IPHONE 15'})
+        self.assertEqual([s['id'] for s in response.json()['sugerencias']], [pro.id, base.id])
+        self.assertEqual(
+            [s['nombre'] for s in autocompletar.sugerir('pr')], ['iPhone 15 Pro']
+        )
+        self.assertEqual(autocompletar.sugerir('galaxy'), [])
+
+        # Un cambio en el catálogo cambia la versión y el índice se reconstruye
+        base.modelo = 'iPhone 15 Plus'
+        base.save()
+        self.assertEqual([s['nombre'] for s in autocompletar.sugerir('plus')], ['iPhone 15 Plus'])
+        self.assertGreater(autocompletar.estadisticas()['bytes'], 0)
+
+    def test_respeta_el_tope_de_nodos(self):
+        _crear_celular(modelo='iPhone 15 Pro Max')
+        with self.settings(AUTOCOMPLETAR_MAX_NODOS=10):
+            indice = autocompletar.construir()
+        self.assertEqual(indice.nodos, 10)
+        self.assertFalse(indice.completo)
+
+
+# ==========================================================
+# BENCHMARK
+# ==========================================================
+
+class BenchmarkTests(TestCase):
+    def test_recorre_flujo_completo(self):
+        datos = generar_datos(productos_por_categoria=3, usuarios=2, pedidos=4)
+        resultado = ejecutar_benchmark(datos, iteraciones=2)
+        self.assertIn('finalizar_compra', resultado['pasos'])
+        self.assertEqual(resultado['pasos']['mis_pedidos']['peticiones'], 2)
+        self.assertEqual(comparar_con_base(resultado, resultado), [])
+
+    def test_detecta_regresion_de_consultas(self):
+        base = {'pasos': {'ver_carrito': {'consultas_max': 2, 'p95_ms': 5.0}}}
+        actual = {'pasos': {'ver_carrito': {'consultas_max': 4, 'p95_ms': 5.0}}}
+        self.assertEqual(len(comparar_con_base(actual, base)), 1)
+
+
+# ==========================================================
+# PRESUPUESTOS DE CONSULTAS
+# ==========================================================
+
+class PresupuestoConsultasTests(TestCase):
+    def test_consultas_dentro_del_presupuesto_y_constantes(self):
+        mediciones = []
+        for escala in [
+            dict(productos_por_categoria=2, usuarios=2, pedidos=3, semilla=1),
+            dict(productos_por_categoria=10, usuarios=8, pedidos=40, semilla=2),
+        ]:
+            contexto = preparar_contexto(generar_datos(**escala)['catalogo'])
+            mediciones.append({**medir_rutas(contexto), **medir_flujo_post(contexto)})
+
+        errores = verificar_presupuestos(*mediciones)
+        # El checkout completo se midió con POST
+        self.assertIn('tienda_finalizar_compra (POST)', mediciones[0])
+        self.assertEqual(
+            {n for n in mediciones[0] if n.endswith(' (POST)')},
+            {f'{n} (POST)' for n in PRESUPUESTOS_POST},
+        )
+        self.assertFalse(errores, '\n'.join(errores))
+        # Cada aumento es sobre una vista con presupuesto propio
+        self.assertLessEqual(set(AUMENTOS), set(PRESUPUESTOS_CONSULTAS))
+
+
+# ==========================================================
+# EXISTENCIAS
+# ==========================================================
+
+class StockTests(TestCase):
+    def test_sin_existencias_regresa_al_carrito(self):
+        celular = _crear_celular(stock=1)
+        usuario = _crear_usuario()
+        client = _cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 2},
+        })
+        response = _confirmar_compra(client)
+        self.assertRedirects(response, reverse('tienda_ver_carrito'), fetch_redirect_response=False)
+        self.assertFalse(Pedido.objects.exists())
+        celular.refresh_from_db()
+        self.assertEqual(celular.stock, 1)
+
+        response = client.get(reverse('tienda_ver_carrito'))
+        self.assertContains(response, 'Solo quedan 1 disponibles')
+        self.assertTrue(response.context['hay_sin_stock'])
+
+    def test_descuenta_existencias(self):
+        celular = _crear_celular(stock=5)
+        usuario = _crear_usuario()
+        client = _cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 2},
+        })
+        _confirmar_compra(client)
+        celular.refresh_from_db()
+        self.assertEqual(celular.stock, 3)
+        self.assertEqual(Pedido.objects.get().detallepedido_set.get().celular, celular)
+
+
+@override_settings(TAREAS_EJECUCION='externa')
+class StockConcurrenteTests(TransactionTestCase):
+    def test_checkouts_simultaneos_no_sobrevenden(self):
+        celular = _crear_celular(stock=5)
+        clientes = [
+            _cliente_con_carrito(_crear_usuario(i), {
+                f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+            })
+            for i in range(12)
+        ]
+        versiones = [_version_resumen(c) for c in clientes]
+        barrera = threading.Barrier(len(clientes))
+
+        def comprar(client, version):
+            try:
+                barrera.wait()
+                _confirmar_compra(client, uuid.uuid4().hex, version)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=comprar, args=(c, v)) for c, v in zip(clientes, versiones)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        celular.refresh_from_db()
+        self.assertEqual(celular.stock, 0)
+        self.assertEqual(Pedido.objects.count(), 5)
+
+
+# ==========================================================
+# API JSON DEL CARRITO
+# ==========================================================
+
+class CarritoApiTests(TestCase):
+    def _operaciones(self, client, *operaciones):
+        return client.post(
+            reverse('tienda_carrito_api'), {'operaciones': list(operaciones)}, content_type='application/json'
+        )
+
+    def test_varias_operaciones_en_una_peticion(self):
+        uno, dos = _crear_celular(modelo='iPhone 15'), _crear_celular(modelo='iPhone 14', precio=Decimal('799.00'))
+        client = _cliente_con_carrito(_crear_usuario(), {
+            f'celular_{dos.id}': {'id': dos.id, 'type': 'celular', 'qty': 1},
+        })
+        with CaptureQueriesContext(connection) as consultas:
+            response = self._operaciones(
+                client,
+                {'op': 'agregar', 'type': 'celular', 'id': uno.id, 'cantidad': 2},
+                {'op': 'eliminar', 'key': f'celular_{dos.id}'},
+                {'op': 'agregar', 'type': 'celular', 'id': 999999},
+            )
+        datos = response.json()
+        self.assertEqual([l['key'] for l in datos['lineas']], [f'celular_{uno.id}'])
+        self.assertEqual(datos['lineas'][0]['subtotal'], '1998.00')
+        self.assertEqual(set(datos['eliminadas']), {'celular_999999', f'celular_{dos.id}'})
+        self.assertEqual((datos['total_general'], datos['item_count']), ('1998.00', 2))
+        # Todo el carrito se arma con una sola consulta de productos
+        self.assertEqual(len([q for q in consultas.captured_queries if 'celular' in q['sql'].lower()]), 1)
+        self.assertEqual(list(client.session['cart']), [f'celular_{uno.id}'])
+
+    def test_operacion_invalida_no_aplica_ninguna(self):
+        celular = _crear_celular()
+        client = _cliente_con_carrito(_crear_usuario(), {})
+        response = self._operaciones(
+            client,
+            {'op': 'agregar', 'type': 'celular', 'id': celular.id},
+            {'op': 'actualizar', 'key': f'celular_{celular.id}', 'cantidad': -1},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.session['cart'], {})
+
+
+# ==========================================================
+# FOTO DEL CARRITO EN EL CHECKOUT
+# ==========================================================
+
+class FotoCarritoTests(TestCase):
+    def test_cobra_la_foto_con_una_lectura_de_precios_por_tipo(self):
+        celular = _crear_celular(stock=5)
+        client = _cliente_con_carrito(_crear_usuario(), {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 2},
+        })
+        version = _version_resumen(client)
+        with CaptureQueriesContext(connection) as consultas:
+            _confirmar_compra(client, version=version)
+        lecturas = [
+            q for q in consultas.captured_queries
+            if q['sql'].startswith('SELECT') and 'app_iphone_celular' in q['sql'].lower()
+        ]
+        self.assertEqual(len(lecturas), 1)
+        self.assertEqual(Pedido.objects.get().total, Decimal('1998.00'))
+
+    def test_cambio_de_precio_se_muestra_en_vez_de_cobrarse(self):
+        celular = _crear_celular(modelo='iPhone 15', stock=5)
+        client = _cliente_con_carrito(_crear_usuario(), {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+        })
+        version = _version_resumen(client)
+        Celular.objects.filter(pk=celular.pk).update(precio=Decimal('1099.00'))
+
+        response = _confirmar_compra(client, version=version)
+        self.assertRedirects(response, reverse('tienda_resumen_pedido'), fetch_redirect_response=False)
+        self.assertFalse(Pedido.objects.exists())
+
+        response = client.get(reverse('tienda_resumen_pedido'))
+        self.assertContains(response, 'antes $999.00, ahora $1099.00')
+        _confirmar_compra(client, version=response.context['version_carrito'])
+        self.assertEqual(Pedido.objects.get().total, Decimal('1099.00'))
+
+    def test_quitar_un_producto_no_se_avisa_como_retirado(self):
+        a, b = _crear_celular(modelo='iPhone 15', stock=5), _crear_celular(modelo='iPhone 14', stock=5)
+        client = _cliente_con_carrito(_crear_usuario(), {
+            f'celular_{a.id}': {'id': a.id, 'type': 'celular', 'qty': 1},
+            f'celular_{b.id}': {'id': b.id, 'type': 'celular', 'qty': 1},
+        })
+        _version_resumen(client)
+        client.post(reverse('tienda_eliminar_del_carrito', args=[f'celular_{b.id}']))
+        client.post(reverse('tienda_actualizar_item_carrito', args=[f'celular_{a.id}']), {'cantidad': 2})
+
+        response = client.get(reverse('tienda_resumen_pedido'))
+        self.assertEqual(response.context['cambios_precio'], [])
+        self.assertNotContains(response, 'ya no está disponible')
+
+        # Un producto borrado del catálogo sí se avisa
+        a.delete()
+        self.assertContains(
+            client.get(reverse('tienda_resumen_pedido')), 'iPhone 15 ya no está disponible'
+        )
+
+    def test_carrito_modificado_despues_del_resumen(self):
+        celular = _crear_celular(stock=5)
+        client = _cliente_con_carrito(_crear_usuario(), {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+        })
+        version = _version_resumen(client)
+        client.post(reverse('tienda_actualizar_item_carrito', args=[f'celular_{celular.id}']), {'cantidad': 3})
+
+        response = _confirmar_compra(client, version=version)
+        self.assertRedirects(response, reverse('tienda_resumen_pedido'), fetch_redirect_response=False)
+        self.assertFalse(Pedido.objects.exists())
+
+
+# ==========================================================
+# HISTORIAL DE PEDIDOS
+# ==========================================================
+
+class HistorialPedidosTests(TestCase):
+    def test_historial_sobrevive_al_borrado_del_producto(self):
+        celular = _crear_celular(modelo='iPhone 15 Pro', stock=5)
+        usuario = _crear_usuario()
+        client = _cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+        })
+        _confirmar_compra(client)
+        detalle = Pedido.objects.get().detallepedido_set.get()
+        self.assertEqual((detalle.categoria, detalle.sku), ('celular', f'CEL-{celular.id:06d}'))
+
+        celular.delete()
+        with CaptureQueriesContext(connection) as consultas:
+            response = client.get(reverse('tienda_mis_pedidos'))
+        self.assertContains(response, 'iPhone 15 Pro')
+        self.assertFalse([q for q in consultas.captured_queries if 'app_iphone_celular' in q['sql']])
+
+    def test_pedido_en_proceso_no_se_pinta_como_cancelado(self):
+        usuario = _crear_usuario()
+        Pedido.objects.create(usuario=usuario, estado=Pedido.PROCESANDO)
+        response = _cliente_con_carrito(usuario, {}).get(reverse('tienda_mis_pedidos'))
+        self.assertRegex(response.content.decode(), r'data-estado-pedido="\d+" class="status-badge\s+status-procesando')
+        # El mismo color al llegar el aviso en vivo
+        self.assertContains(response, "'Procesando': 'status-procesando'")
+
+
+class ArchivoPedidosTests(TestCase):
+    def test_archiva_entregados_viejos_y_el_historial_los_sigue_mostrando(self):
+        celular = _crear_celular(modelo='iPhone 12 mini', stock=5)
+        usuario = _crear_usuario()
+        client = _cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+        })
+        _confirmar_compra(client)
+        pedido = Pedido.objects.get()
+        Pedido.objects.filter(pk=pedido.pk).update(
+            estado='Entregado', fecha_pedido=timezone.now() - timedelta(days=400)
+        )
+        Usuario.reconciliar_resumen_pedidos()
+
+        call_command('archivar_pedidos', '--dias', '365', '--pausa', '0', stdout=StringIO())
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(DetallePedido.objects.exists())
+        archivado = PedidoArchivado.objects.get(pk=pedido.pk)
+        self.assertEqual(archivado.lineas[0]['producto_nombre'], 'iPhone 12 mini')
+        self.assertEqual(archivado.historial_estados, [])
+
+        response = client.get(reverse('tienda_mis_pedidos'))
+        self.assertContains(response, f'PEDIDO #{pedido.id}')
+        self.assertContains(response, 'iPhone 12 mini')
+        # Los contadores del usuario siguen contando el pedido archivado
+        self.assertEqual(Usuario.reconciliar_resumen_pedidos(), [])
+
+    def test_conserva_el_historial_de_estados(self):
+        pedido = Pedido.objects.create(usuario=_crear_usuario())
+        estados_pedido.transicionar([pedido.pk], Pedido.ENVIADO)
+        estados_pedido.transicionar([pedido.pk], Pedido.ENTREGADO)
+        Pedido.objects.filter(pk=pedido.pk).update(fecha_pedido=timezone.now() - timedelta(days=400))
+
+        self.assertEqual(archivar_lote(timezone.now() - timedelta(days=365)), 1)
+        self.assertFalse(HistorialEstadoPedido.objects.exists())
+        historial = PedidoArchivado.objects.get(pk=pedido.pk).historial_estados
+        self.assertEqual(
+            [(h['estado_anterior'], h['estado_nuevo']) for h in historial],
+            [(Pedido.PENDIENTE, Pedido.ENVIADO), (Pedido.ENVIADO, Pedido.ENTREGADO)],
+        )
+
+
+# ==========================================================
+# COMPATIBILIDAD DE ACCESORIOS
+# ==========================================================
+
+class CompatibilidadAccesoriosTests(TestCase):
+    def _accesorio(self, tipo, modelo_compatible):
+        return Accesorio.objects.create(
+            tipo=tipo, modelo_compatible=modelo_compatible, descripcion='Prueba',
+            precio=Decimal('49.00'), imagen_url='https://example.com/f.png',
+        )
+
+    def test_separa_y_normaliza_modelos(self):
+        self.assertEqual(
+            compatibilidad.modelos_compatibles('iPhone 15 / 15 Pro Máx, AirPods Pro'),
+            {'iphone 15', 'iphone 15 pro max', 'airpods pro'},
+        )
+
+    def test_pagina_de_celulares_con_una_consulta_al_indice(self):
+        pro = _crear_celular(modelo='iPhone 15 Pro')
+        mini = _crear_celular(modelo='iPhone 13 mini')
+        funda = self._accesorio('Funda', 'iPhone 14, 15 Pro')
+        mica = self._accesorio('Mica', 'iPhone 13 Mini')
+
+        with CaptureQueriesContext(connection) as consultas:
+            response = Client().get(reverse('tienda_celulares'))
+        self.assertEqual(
+            len([q for q in consultas.captured_queries if 'compatibilidadaccesorio' in q['sql'].lower()]), 1
+        )
+        compatibles = {c.pk: [a.pk for a in c.accesorios_compatibles] for c in response.context['productos_celulares']}
+        self.assertEqual(compatibles, {pro.pk: [funda.pk], mini.pk: [mica.pk]})
+
+        # Editar el accesorio actualiza el índice y la página
+        funda.modelo_compatible = 'iPhone 13 mini'
+        funda.save()
+        response = Client().get(reverse('tienda_celulares'))
+        compatibles = {c.pk: [a.pk for a in c.accesorios_compatibles] for c in response.context['productos_celulares']}
+        self.assertEqual(compatibles, {pro.pk: [], mini.pk: [funda.pk, mica.pk]})
+        self.assertContains(response, 'Accesorios: Funda, Mica')
+
+
+# ==========================================================
+# RECOMENDACIONES "SE COMPRAN JUNTOS"
+# ==========================================================
+
+class RecomendacionesTests(TestCase):
+    def _pedido(self, usuario, *celulares):
+        pedido = Pedido.objects.create(usuario=usuario)
+        DetallePedido.objects.bulk_create([
+            DetallePedido(
+                pedido=pedido, celular=c, precio_unitario=c.precio, producto_nombre=c.modelo,
+                categoria='celular', sku=DetallePedido.sku_para('celular', c.id),
+            ) for c in celulares
+        ])
+
+    def test_vecinos_por_coocurrencia_y_consulta_unica_en_el_carrito(self):
+        a, b, c = (_crear_celular(modelo=m, stock=5) for m in ['A', 'B', 'C'])
+        usuario = _crear_usuario()
+        self._pedido(usuario, a, b)
+        self._pedido(usuario, a, b)
+        self._pedido(usuario, a, c)
+
+        call_command('recalcular_recomendaciones', stdout=StringIO())
+        vecinos = list(Recomendacion.objects.filter(origen=f'celular_{a.id}').order_by('posicion'))
+        self.assertEqual([r.producto_id for r in vecinos], [b.id, c.id])
+        self.assertGreater(vecinos[0].puntuacion, vecinos[1].puntuacion)
+
+        # Un producto borrado deja de sugerirse en la siguiente reconstrucción
+        c.delete()
+        recomendaciones.recalcular()
+        self.assertFalse(Recomendacion.objects.filter(producto_id=c.id).exists())
+
+        client = _cliente_con_carrito(usuario, {
+            f'celular_{b.id}': {'id': b.id, 'type': 'celular', 'qty': 1},
+        })
+        with CaptureQueriesContext(connection) as consultas:
+            response = client.get(reverse('tienda_ver_carrito'))
+        self.assertEqual([r['id'] for r in response.context['recomendaciones']], [a.id])
+        self.assertEqual(
+            len([q for q in consultas.captured_queries if 'recomendacion' in q['sql'].lower()]), 1
+        )
+
+    def test_el_conteo_en_sql_coincide_con_el_de_las_canastas(self):
+        a, b, c, d = (_crear_celular(modelo=m) for m in ['A', 'B', 'C', 'D'])
+        usuario = _crear_usuario()
+        self._pedido(usuario, a, b, c)
+        self._pedido(usuario, a, b, b)  # Líneas repetidas cuentan una vez por pedido
+        self._pedido(usuario, c, d)
+        self._pedido(usuario, d)
+
+        canastas = [
+            {f'celular_{x.id}' for x in pedido} for pedido in [(a, b, c), (a, b), (c, d), (d,)]
+        ]
+        with self.assertNumQueries(2):
+            por_producto, juntos = recomendaciones.contar_activos()
+        self.assertEqual((por_producto, juntos), recomendaciones.contar(canastas))
+        self.assertEqual(juntos[f'celular_{a.id}'][f'celular_{b.id}'], 2)
+
+
+# ==========================================================
+# CÓDIGOS POSTALES
+# ==========================================================
+
+class CodigosPostalesTests(TestCase):
+    def setUp(self):
+        # Formato de SEPOMEX: aviso, encabezado, '|' y ciudad vacía (se usa el municipio)
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = Path(carpeta) / 'cp.txt'
+            ruta.write_text(
+                'El Catálogo Nacional de Códigos Postales...\n'
+                'd_codigo|d_asenta|d_mnpio|d_estado|d_ciudad\n'
+                '44100|Centro|Guadalajara|Jalisco|Guadalajara\n'
+                '44100|Americana|Guadalajara|Jalisco|Guadalajara\n'
+                '45010|El Palomar|Tlajomulco de Zúñiga|Jalisco|\n',
+                encoding='latin-1',
+            )
+            call_command('importar_codigos_postales', str(ruta), '--delimitador', '|',
+                         '--codificacion', 'latin-1', stdout=StringIO())
+
+    def test_consulta_desde_cache_despues_de_la_primera(self):
+        url = reverse('tienda_codigo_postal')
+        datos = Client().get(url, {'cp': '44-100'}).json()
+        self.assertEqual(datos['colonias'], ['Americana', 'Centro'])
+        self.assertEqual((datos['ciudad'], datos['pais']), ('Guadalajara', 'México'))
+        self.assertEqual(Client().get(url, {'cp': '45010'}).json()['ciudad'], 'Tlajomulco de Zúñiga')
+        with self.assertNumQueries(0):
+            Client().get(url, {'cp': '44100'})
+        self.assertEqual(Client().get(url, {'cp': '99999'}).status_code, 404)
+
+    def test_guardar_direccion_usa_la_escritura_del_catalogo(self):
+        usuario = _crear_usuario()
+        client = _cliente_con_carrito(usuario, {})
+        client.post(reverse('tienda_guardar_direccion'), {
+            'calle': 'Av. Juárez 1', 'codigo_postal': ' 44100', 'colonia': 'centro ',
+            'ciudad': 'gdl', 'pais': 'Mexico',
+        })
+        direccion = Usuario.objects.get(pk=usuario.pk).direccion
+        self.assertEqual(
+            (direccion.codigo_postal, direccion.colonia, direccion.ciudad, direccion.pais),
+            ('44100', 'Centro', 'Guadalajara', 'México'),
+        )
+
+
+# ==========================================================
+# DIRECCIONES INMUTABLES
+# ==========================================================
+
+class DireccionInmutableTests(TestCase):
+    def test_editar_la_direccion_no_cambia_la_de_pedidos_anteriores(self):
+        celular = _crear_celular(stock=5)
+        usuario = _crear_usuario()
+        client = _cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+        })
+        _confirmar_compra(client)
+        pedido = Pedido.objects.get()
+
+        client.post(reverse('tienda_guardar_direccion'), {
+            'calle': 'Av. Vallarta 500', 'codigo_postal': '44100', 'colonia': 'Centro',
+            'ciudad': 'Guadalajara', 'pais': 'México',
+        })
+        usuario.refresh_from_db()
+        pedido.refresh_from_db()
+        self.assertEqual(usuario.direccion.calle, 'Av. Vallarta 500')
+        self.assertEqual(pedido.direccion_envio.calle, 'Av. Juárez 1')
+        with self.assertRaises(ValueError):
+            pedido.direccion_envio.save()
+
+    def test_datos_iguales_reutilizan_la_misma_fila(self):
+        a = Direccion.obtener(calle='Av. Juárez 1', codigo_postal='44100', colonia='Centro',
+                              ciudad='Guadalajara', pais='México')
+        b = Direccion.obtener(calle='av. juárez  1 ', codigo_postal='44100', colonia='CENTRO',
+                              ciudad='Guadalajara', pais='México')
+        self.assertEqual(a.pk, b.pk)
+        self.assertEqual(Direccion.objects.count(), 1)
+
+    def test_el_admin_de_django_solo_las_muestra(self):
+        direccion = Direccion.obtener(calle='Av. Juárez 1', codigo_postal='44100', colonia='Centro',
+                                      ciudad='Guadalajara', pais='México')
+        client = Client()
+        client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secreta'))
+        url = reverse('admin:app_Iphone_direccion_change', args=[direccion.pk])
+
+        self.assertEqual(client.get(url).status_code, 200)
+        response = client.post(url, {
+            'calle': 'Otra 2', 'codigo_postal': '44100', 'colonia': 'Centro',
+            'ciudad': 'Guadalajara', 'pais': 'México',
+        })
+        self.assertEqual(response.status_code, 403)
+        direccion.refresh_from_db()
+        self.assertEqual(direccion.calle, 'Av. Juárez 1')
+        self.assertEqual(client.get(reverse('admin:app_Iphone_direccion_add')).status_code, 403)
+
+
+# ==========================================================
+# FLUJO DE ESTADOS DEL PEDIDO
+# ==========================================================
+
+class EstadosPedidoTests(TestCase):
+    def _pedidos(self, n, estado=Pedido.PENDIENTE):
+        usuario = _crear_usuario(Usuario.objects.count())
+        return [Pedido.objects.create(usuario=usuario, estado=estado).pk for _ in range(n)]
+
+    def test_transicion_masiva_con_consultas_fijas(self):
+        pendientes = self._pedidos(30)
+        entregado = self._pedidos(1, Pedido.ENTREGADO)
+
+        with CaptureQueriesContext(connection) as consultas:
+            actualizados, rechazados = estados_pedido.transicionar(pendientes + entregado, Pedido.ENVIADO)
+        self.assertEqual(actualizados, sorted(pendientes))
+        self.assertEqual(rechazados, entregado)
+        # Lectura, UPDATE y bulk_create (más SAVEPOINT/RELEASE), sin importar cuántos pedidos
+        self.assertLessEqual(len(consultas), 5)
+        self.assertEqual(Pedido.objects.filter(estado=Pedido.ENVIADO).count(), 30)
+        self.assertEqual(
+            HistorialEstadoPedido.objects.filter(estado_anterior=Pedido.PENDIENTE, estado_nuevo=Pedido.ENVIADO).count(), 30
+        )
+
+        with self.assertRaises(estados_pedido.TransicionInvalida):
+            estados_pedido.transicionar(pendientes, 'Perdido')
+
+    def test_vista_rechaza_transicion_invalida(self):
+        pedido_id, = self._pedidos(1, Pedido.ENTREGADO)
+        response = _cliente_admin().post(
+            reverse('actualizar_pedido', args=[pedido_id]), {'estado': Pedido.PENDIENTE}
+        )
+        self.assertContains(response, 'No se puede pasar el pedido')
+        self.assertEqual(Pedido.objects.get(pk=pedido_id).estado, Pedido.ENTREGADO)
+
+        client = _cliente_admin()
+        pendientes = self._pedidos(3)
+        client.post(
+            reverse('cola_pedidos') + '?estado=Pendiente',
+            {'pedidos': pendientes, 'nuevo_estado': Pedido.CANCELADO},
+        )
+        self.assertEqual(Pedido.objects.filter(estado=Pedido.CANCELADO).count(), 3)
+        self.assertNotContains(client.get(reverse('cola_pedidos')), f'value="{pendientes[0]}"')
+
+
+class EventosPedidoTests(TestCase):
+    def setUp(self):
+        self.usuario = _crear_usuario()
+        self.pedido = Pedido.objects.create(usuario=self.usuario)
+        self.client = _cliente_con_carrito(self.usuario, {})
+        eventos_pedido._ultimo = None
+
+    async def _conectar(self, **headers):
+        client = AsyncClient()
+        client.cookies[settings.SESSION_COOKIE_NAME] = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        response = await client.get(reverse('tienda_eventos_pedidos'), headers=headers)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        flujo = response.streaming_content.__aiter__()
+        inicio = await anext(flujo)
+        self.assertIn(b'retry:', inicio)
+        self.ultimo_id = re.search(rb'id: (\d+)', inicio).group(1).decode()
+        return flujo
+
+    async def _desconectar(self, flujo):
+        # Al desconectarse el cliente, el servidor ASGI cancela la espera
+        espera = asyncio.ensure_future(anext(flujo))
+        await asyncio.sleep(0)
+        espera.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await espera
+
+    def test_sin_asgi_responde_204(self):
+        self.assertEqual(self.client.get(reverse('tienda_eventos_pedidos')).status_code, 204)
+
+    @override_settings(PEDIDOS_EVENTOS_SONDEO_SEGUNDOS=3600)
+    async def test_avisa_el_cambio_hecho_en_cualquier_proceso(self):
+        flujo = await self._conectar()
+        self.assertEqual(eventos_pedido.conexiones(), 1)
+
+        # El cambio solo queda en el historial (como si lo hiciera otro trabajador);
+        # la revisión periódica del proceso lo encuentra y lo reparte
+        await sync_to_async(estados_pedido.transicionar)([self.pedido.pk], Pedido.ENVIADO)
+        self.assertEqual(await eventos_pedido.revisar(), 1)
+        aviso = await anext(flujo)
+        self.assertIn(b'event: estado', aviso)
+        self.assertIn(f'"pedido": {self.pedido.pk}, "estado": "Enviado"'.encode(), aviso)
+
+        # Un navegador que se reconecta recibe lo que cambió mientras no estaba
+        otro = await self._conectar(**{'Last-Event-ID': '0'})
+        self.assertIn(b'"estado": "Enviado"', await anext(otro))
+        self.assertEqual(eventos_pedido.conexiones(), 2)
+
+        await self._desconectar(otro)
+        await self._desconectar(flujo)
+        self.assertEqual(eventos_pedido.conexiones(), 0)
+
+    @override_settings(PEDIDOS_EVENTOS_SONDEO_SEGUNDOS=3600, PEDIDOS_EVENTOS_MAX_PENDIENTES=1)
+    async def test_cola_llena_cierra_el_flujo_y_al_reconectar_no_se_pierde_nada(self):
+        otro_pedido = await Pedido.objects.acreate(usuario=self.usuario)
+        flujo = await self._conectar()
+        desde = self.ultimo_id
+
+        # Dos cambios con lugar para uno: en vez de descartar, se cierra el flujo
+        await sync_to_async(estados_pedido.transicionar)([self.pedido.pk, otro_pedido.pk], Pedido.ENVIADO)
+        self.assertEqual(await eventos_pedido.revisar(), 2)
+        with self.assertRaises(StopAsyncIteration):
+            await anext(flujo)
+        self.assertEqual(eventos_pedido.conexiones(), 0)
+
+        # EventSource se reconecta con el id inicial y recibe los dos avisos
+        otro = await self._conectar(**{'Last-Event-ID': desde})
+        avisos = await anext(otro) + await anext(otro)
+        self.assertIn(f'"pedido": {self.pedido.pk}, "estado": "Enviado"'.encode(), avisos)
+        self.assertIn(f'"pedido": {otro_pedido.pk}, "estado": "Enviado"'.encode(), avisos)
+        await self._desconectar(otro)
+
+
+# ==========================================================
+# RESUMEN DE PEDIDOS POR USUARIO
+# ==========================================================
+
+class ResumenPedidosUsuarioTests(TestCase):
+    def test_checkout_y_borrado_mantienen_contadores(self):
+        celular = _crear_celular(stock=5)
+        usuario = _crear_usuario()
+        client = _cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 2},
+        })
+        _confirmar_compra(client)
+        pedido = Pedido.objects.get()
+        usuario.refresh_from_db()
+        self.assertEqual(usuario.pedidos_count, 1)
+        self.assertEqual(usuario.total_gastado, Decimal('1998.00'))
+        self.assertEqual(usuario.ultimo_pedido, pedido.fecha_pedido)
+
+        pedido.delete()
+        Usuario.descontar_pedido(pedido)
+        usuario.refresh_from_db()
+        self.assertEqual((usuario.pedidos_count, usuario.total_gastado, usuario.ultimo_pedido), (0, 0, None))
+
+    def test_reconciliar_corrige_desfases(self):
+        usuario = _crear_usuario()
+        Pedido.objects.create(usuario=usuario, total=Decimal('50.00'))
+        Pedido.objects.create(usuario=usuario, total=Decimal('25.00'))
+
+        call_command('reconciliar_pedidos_usuario', stdout=StringIO())
+        usuario.refresh_from_db()
+        self.assertEqual((usuario.pedidos_count, usuario.total_gastado), (2, Decimal('75.00')))
+        self.assertEqual(Usuario.reconciliar_resumen_pedidos(), [])
+
+    def test_ver_usuario_ordena_y_filtra_por_gasto(self):
+        poco, mucho = _crear_usuario(1), _crear_usuario(2)
+        Usuario.objects.filter(pk=poco.pk).update(pedidos_count=1, total_gastado=10)
+        Usuario.objects.filter(pk=mucho.pk).update(pedidos_count=3, total_gastado=900)
+        response = _cliente_admin().get(reverse('ver_usuario'), {'orden': 'gastado'})
+        self.assertEqual([u.id for u in response.context['usuarios']], [mucho.id, poco.id])
+        response = _cliente_admin().get(reverse('ver_usuario'), {'min_pedidos': '2'})
+        self.assertEqual([u.id for u in response.context['usuarios']], [mucho.id])
+
+
+# ==========================================================
+# BORRADO DE USUARIOS
+# ==========================================================
+
+class BorradoUsuariosTests(TestCase):
+    def test_borra_usuario_con_historial_y_datos_huerfanos(self):
+        celular = _crear_celular(stock=5)
+        usuario = _crear_usuario(1)
+        vecino = _crear_usuario(2)
+        # El vecino comparte la dirección: esa no debe borrarse
+        Usuario.objects.filter(pk=vecino.pk).update(direccion=usuario.direccion)
+        _confirmar_compra(_cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+        }))
+        carrito = Carrito.objects.create(usuario=usuario)
+        CarritoItem.objects.create(carrito=carrito, celular=celular)
+
+        response = _cliente_admin().post(reverse('borrar_usuario', args=[usuario.id]))
+        self.assertRedirects(response, reverse('ver_usuario'), fetch_redirect_response=False)
+
+        self.assertFalse(Usuario.objects.filter(pk=usuario.pk).exists())
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(DetallePedido.objects.exists())
+        self.assertFalse(CarritoItem.objects.exists())
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+        self.assertFalse(MetodoPago.objects.filter(pk=usuario.metodo_pago_id).exists())
+        self.assertTrue(Direccion.objects.filter(pk=usuario.direccion_id).exists())
+        self.assertTrue(Usuario.objects.filter(pk=vecino.pk).exists())
+
+    def test_purga_solo_cuentas_inactivas(self):
+        activo, inactivo = _crear_usuario(1), _crear_usuario(2)
+        Usuario.objects.filter(pk=inactivo.pk).update(ultimo_acceso=timezone.now() - timedelta(days=1000))
+        call_command('purgar_inactivos', '--dias', '365', '--pausa', '0', stdout=StringIO())
+        self.assertEqual(list(Usuario.objects.values_list('id', flat=True)), [activo.id])
+
+
+# ==========================================================
+# IDEMPOTENCIA DEL CHECKOUT
+# ==========================================================
+
+class IdempotenciaTests(TestCase):
+    def test_reintento_devuelve_el_mismo_pedido(self):
+        celular = _crear_celular(stock=5)
+        usuario = _crear_usuario()
+        client = _cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+        })
+        resumen = client.get(reverse('tienda_resumen_pedido')).context
+        clave, version = resumen['clave_idempotencia'], resumen['version_carrito']
+
+        primera = _confirmar_compra(client, clave, version)
+        segunda = _confirmar_compra(client, clave, version)
+
+        self.assertEqual(primera.context['pedido'].id, segunda.context['pedido'].id)
+        self.assertEqual(Pedido.objects.count(), 1)
+        celular.refresh_from_db()
+        self.assertEqual(celular.stock, 4)
+
+    def test_clave_de_otro_usuario_no_revela_su_pedido(self):
+        celular = _crear_celular(stock=5)
+        cart = {f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1}}
+        _confirmar_compra(_cliente_con_carrito(_crear_usuario(1), cart), 'compartida')
+        response = _confirmar_compra(_cliente_con_carrito(_crear_usuario(2), cart), 'compartida')
+        self.assertRedirects(response, reverse('tienda_resumen_pedido'), fetch_redirect_response=False)
+
+
+@override_settings(TAREAS_EJECUCION='externa')
+class IdempotenciaConcurrenteTests(TransactionTestCase):
+    def test_envios_duplicados_en_paralelo_crean_un_pedido(self):
+        celular = _crear_celular(stock=10)
+        usuario = _crear_usuario()
+        original = _cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+        })
+        version = _version_resumen(original)
+        # Mismo navegador (misma cookie de sesión) reenviando el mismo formulario
+        clientes = []
+        for _ in range(8):
+            client = Client()
+            client.cookies = original.cookies
+            clientes.append(client)
+        barrera = threading.Barrier(len(clientes))
+        pedidos_vistos = []
+
+        def enviar(client):
+            try:
+                barrera.wait()
+                response = _confirmar_compra(client, 'doble-clic', version)
+                pedidos_vistos.append(response.context['pedido'].id)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=enviar, args=(c,)) for c in clientes]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(Pedido.objects.count(), 1)
+        self.assertEqual(ClaveIdempotencia.objects.count(), 1)
+        self.assertEqual(set(pedidos_vistos), {Pedido.objects.get().id})
+        self.assertEqual(len(pedidos_vistos), len(clientes))
+        celular.refresh_from_db()
+        self.assertEqual(celular.stock, 9)
+
+
+# ==========================================================
+# TAREAS EN SEGUNDO PLANO
+# ==========================================================
+
+@tarea('prueba_siempre_falla', max_intentos=2)
+def _tarea_que_falla():
+    raise RuntimeError('servicio caído')
+
+
+@override_settings(TAREAS_EJECUCION='inmediata')
+class TareasTests(TestCase):
+    def test_checkout_envia_confirmacion_al_confirmar(self):
+        celular = _crear_celular(stock=5)
+        usuario = _crear_usuario()
+        client = _cliente_con_carrito(usuario, {
+            f'celular_{celular.id}': {'id': celular.id, 'type': 'celular', 'qty': 1},
+        })
+        with self.captureOnCommitCallbacks() as callbacks:
+            _confirmar_compra(client)
+        # La respuesta no espera al correo: solo queda encolado
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Tarea.objects.get().estado, Tarea.PENDIENTE)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Tarea.objects.get().estado, Tarea.COMPLETADA)
+        self.assertEqual(mail.outbox[0].to, [usuario.email])
+
+    def test_reintenta_con_espera_y_marca_fallida(self):
+        with transaction.atomic():
+            registro = encolar(_tarea_que_falla)
+        procesar_pendientes()
+        registro.refresh_from_db()
+        self.assertEqual((registro.estado, registro.intentos), (Tarea.PENDIENTE, 1))
+        self.assertIn('servicio caído', registro.ultimo_error)
+
+        # Aún no llega su hora de reintento
+        self.assertEqual(procesar_pendientes(), 0)
+
+        Tarea.objects.filter(pk=registro.pk).update(ejecutar_despues=timezone.now() - timedelta(seconds=1))
+        procesar_pendientes()
+        registro.refresh_from_db()
+        self.assertEqual((registro.estado, registro.intentos), (Tarea.FALLIDA, 2))
+
+
+# ==========================================================
+# RÉPLICAS DE LECTURA
+# ==========================================================
+
+@skipUnless('replica_1' in settings.DATABASES, 'Réplicas no declaradas: REPLICAS_ACTIVAS=1 manage.py test app_Iphone.tests.ReplicasLecturaTests')
+@override_settings(REPLICAS_LECTURA=['replica_1'], TAREAS_EJECUCION='externa')
+class ReplicasLecturaTests(TransactionTestCase):
+    databases = {'default'} | ({'replica_1'} & set(settings.DATABASES))
+
+    def test_catalogo_lee_de_replica_y_tras_escribir_del_primario(self):
+        replicado = _crear_celular(modelo='iPhone Replicado', stock=5)
+        sincronizar_replicas()
+        _crear_celular(modelo='iPhone Sin Replicar')
+
+        client = Client()
+        response = client.get(reverse('tienda_celulares'))
+        self.assertContains(response, 'iPhone Replicado')
+        self.assertNotContains(response, 'iPhone Sin Replicar')
+
+        # El mismo navegador escribe: sus siguientes lecturas van al primario
+        client.post(reverse('tienda_agregar_al_carrito'), {
+            'product_id': replicado.id, 'product_type': 'celular', 'cantidad': 1,
+        })
+        response = client.get(reverse('tienda_celulares'))
+        self.assertContains(response, 'iPhone Sin Replicar')
+
+    def test_reporte_de_usuarios_leido_de_replica_no_se_sirve_al_primario(self):
+        _crear_usuario(0)
+        sincronizar_replicas()
+        _crear_usuario(1)
+
+        token = usar_replica.set(True)
+        try:
+            self.assertEqual(len(reportes.usuarios()), 1)
+        finally:
+            usar_replica.reset(token)
+        self.assertEqual(len(reportes.usuarios()), 2)
+
+
+# ==========================================================
+# CONFIGURACIÓN DE GUNICORN
+# ==========================================================
+
+class ConfiguracionGunicornTests(TransactionTestCase):
+    def test_precarga_y_recicla_trabajadores(self):
+        configuracion = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        self.assertTrue(configuracion['preload_app'])
+        self.assertEqual(configuracion['worker_class'], 'gthread')
+        self.assertGreater(configuracion['max_requests'], 0)
+        self.assertGreater(configuracion['max_requests_jitter'], 0)
+
+        mensajes = []
+        servidor = SimpleNamespace(log=SimpleNamespace(info=lambda *args: mensajes.append(args)))
+        try:
+            configuracion['when_ready'](servidor)
+        finally:
+            gc.unfreeze()
+        self.assertIn('plantillas', mensajes[0][1])
+        # El maestro no se queda con conexiones abiertas antes del fork
+        self.assertIsNone(connection.connection)
+
+    def test_cada_hilo_del_trabajador_abre_su_conexion(self):
+        configuracion = runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))
+        hilos = 3
+        mensajes = []
+        with futures.ThreadPoolExecutor(max_workers=hilos) as tpool:
+            trabajador = SimpleNamespace(
+                pid=1, tpool=tpool, cfg=SimpleNamespace(threads=hilos),
+                log=SimpleNamespace(info=lambda *args: mensajes.append(args), warning=self.fail),
+            )
+            configuracion['post_worker_init'](trabajador)
+
+            barrera = threading.Barrier(hilos)
+
+            def revisar():
+                barrera.wait(timeout=10)
+                abierta = connection.connection is not None
+                connection.close()
+                return threading.get_ident(), abierta
+
+            resultados = [f.result() for f in [tpool.submit(revisar) for _ in range(hilos)]]
+        self.assertEqual(len({ident for ident, _ in resultados}), hilos)
+        self.assertTrue(all(abierta for _, abierta in resultados))
+        self.assertEqual(mensajes[0][2], hilos)
 
-# Create your tests here.
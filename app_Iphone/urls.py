@@ -9,6 +9,8 @@ urlpatterns = [
     path('login/', views.tienda_login, name='tienda_login'),
     path('logout/', views.tienda_logout, name='tienda_logout'),
     path('registro/', views.tienda_registro, name='tienda_registro'),
+    # Navbar y token CSRF de las páginas servidas desde caché
+    path('sesion/estado/', views.tienda_estado_sesion, name='tienda_estado_sesion'),
     
     # Categorías de Productos
     path('productos/celulares/', views.tienda_celulares, name='tienda_celulares'),
@@ -16,6 +18,8 @@ urlpatterns = [
     path('productos/tablets/', views.tienda_tablets, name='tienda_tablets'),
     path('productos/airpods/', views.tienda_airpods, name='tienda_airpods'),
     path('productos/accesorios/', views.tienda_accesorios, name='tienda_accesorios'),  
+    # Sugerencias de la búsqueda (índice en memoria, sin consultas por tecla)
+    path('productos/sugerencias/', views.tienda_autocompletar, name='tienda_autocompletar'),
 
     # =======================================================
     # RUTAS DEL CARRITO
@@ -24,12 +28,16 @@ urlpatterns = [
     path('carrito/agregar/', views.tienda_agregar_al_carrito, name='tienda_agregar_al_carrito'),
     path('carrito/eliminar/<str:item_key>/', views.tienda_eliminar_del_carrito, name='tienda_eliminar_del_carrito'),
     path('carrito/actualizar/<str:item_key>/', views.tienda_actualizar_item_carrito, name='tienda_actualizar_item_carrito'),
+    # API JSON: varias operaciones por petición, responde solo lo que cambió
+    path('carrito/api/', views.tienda_carrito_api, name='tienda_carrito_api'),
 
     # =======================================================
     # RUTAS DE CHECKOUT (DIRECCIÓN -> PAGO -> RESUMEN -> FIN)
     # =======================================================
     path('checkout/direccion/', views.tienda_mostrar_direccion, name='tienda_mostrar_direccion'),
     path('checkout/guardar_direccion/', views.tienda_guardar_direccion, name='tienda_guardar_direccion'),
+    # Autollenado de colonia, ciudad y país a partir del código postal (?cp=)
+    path('checkout/codigo_postal/', views.tienda_codigo_postal, name='tienda_codigo_postal'),
     
     # NUEVAS RUTAS DE PAGO Y FINALIZACIÓN
     path('checkout/pago/', views.tienda_pago, name='tienda_pago'),
@@ -37,12 +45,15 @@ urlpatterns = [
     path('checkout/resumen/', views.tienda_resumen_pedido, name='tienda_resumen_pedido'),
     path('checkout/finalizar/', views.tienda_finalizar_compra, name='tienda_finalizar_compra'),
     path('mis-pedidos/', views.tienda_mis_pedidos, name='tienda_mis_pedidos'),
+    # Avisos en vivo del estado de los pedidos (SSE, solo con ASGI)
+    path('mis-pedidos/eventos/', views.tienda_eventos_pedidos, name='tienda_eventos_pedidos'),
 
 
     # =======================================================
     # RUTAS DEL SISTEMA DE ADMINISTRACIÓN (CRUD)
     # =======================================================
     path('admin/inicio/', views.inicio_crud, name='inicio_crud'),
+    path('admin/metricas/', views.metricas_rendimiento, name='metricas_rendimiento'),
     
     # --- CRUD USUARIO ---
     path('admin/usuario/agregar/', views.agregar_usuario, name='agregar_usuario'),
@@ -53,6 +64,8 @@ urlpatterns = [
 
     # --- CRUD PEDIDOS (Necesario para los botones dentro de Usuario) ---
     path('admin/pedido/actualizar/<int:pedido_id>/', views.actualizar_pedido, name='actualizar_pedido'),
+    # Cola de pedidos por estado con cambio de estado masivo
+    path('admin/pedido/cola/', views.cola_pedidos, name='cola_pedidos'),
     # Nota: Aunque borres desde el usuario, esta ruta sirve para borrar pedidos individuales si fuera necesario
     # O si decides usar la vista independiente de pedidos más adelante.
     
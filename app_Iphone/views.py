@@ -1,12 +1,27 @@
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
-from django.db import IntegrityError
-from decimal import Decimal
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.db import IntegrityError, transaction
+from django.db.models import Case, CharField, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+from decimal import Decimal, InvalidOperation
+import json
+import uuid
 # IMPORTANTE: Se agregó MetodoPago a los imports
 from .models import (
     Usuario, Direccion, MetodoPago, Celular, Laptop, Tablet, Airpod, Accesorio,
-    Carrito, CarritoItem, Pedido, DetallePedido 
+    Carrito, CarritoItem, Pedido, DetallePedido, ClaveIdempotencia
 ) 
+from . import (
+    autocompletar, carrito, catalogo, codigos_postales, compatibilidad, estados_pedido,
+    eventos_pedido, recomendaciones, reportes
+)
+from .archivo import historial_pedidos
+from .borrado import borrar_usuarios
+from .middleware import registro_metricas
+from .tareas import encolar, enviar_confirmacion_pedido
 
 # ==========================================================
 # FUNCIONES AUXILIARES DEL CARRITO
@@ -23,10 +38,42 @@ def _get_product_model(product_type):
     }
     return models_map.get(product_type.lower())
 
+def _productos_del_carrito(ids_por_tipo):
+    """
+    {(tipo, id): fila} de los productos del carrito con un solo UNION ALL de
+    las tablas de producto presentes. Cada fila trae nombre, generacion,
+    imagen_url, precio y stock.
+    """
+    columnas = ('tipo_producto', 'pk_producto', 'nombre', 'gen', 'imagen', 'precio_actual', 'existencias')
+    consultas = []
+    for product_type, ids in ids_por_tipo.items():
+        Model = _get_product_model(product_type)
+        if Model is None:
+            continue
+        nombre = 'tipo' if Model is Accesorio else 'modelo'
+        generacion = F('generacion') if Model is Airpod else Value(None, output_field=CharField())
+        consultas.append(
+            Model.objects.filter(pk__in=ids).order_by()
+            .annotate(
+                tipo_producto=Value(product_type, output_field=CharField()), pk_producto=F('pk'),
+                nombre=F(nombre), gen=generacion, imagen=F('imagen_url'),
+                precio_actual=F('precio'), existencias=F('stock'),
+            )
+            .values_list(*columnas)
+        )
+    if not consultas:
+        return {}
+    filas = consultas[0].union(*consultas[1:], all=True) if len(consultas) > 1 else consultas[0]
+    return {
+        (tipo, pk): {'nombre': nombre, 'generacion': gen, 'imagen_url': imagen, 'precio': precio, 'stock': stock}
+        for tipo, pk, nombre, gen, imagen, precio, stock in filas
+    }
+
 def _get_cart_data(request):
     """
     Recupera los datos del carrito de la sesión, los enriquece con datos del modelo 
     y calcula el total. También actualiza el conteo de items en la sesión.
+    Lee todos los productos del carrito en una sola consulta (UNION ALL).
     """
     cart = request.session.get('cart', {})
     cart_items = []
@@ -34,38 +81,42 @@ def _get_cart_data(request):
     item_count = 0
     items_to_delete = []
 
+    # 1. Agrupar los IDs por tipo y leer todas las tablas en una consulta
+    ids_por_tipo = {}
+    for key, item in cart.items():
+        ids_por_tipo.setdefault(item['type'], []).append(item['id'])
+    productos = _productos_del_carrito(ids_por_tipo)
+
+    # 2. Recorrer el carrito en su orden original
     for key, item in cart.items():
         product_type = item['type']
         product_id = item['id']
         cantidad = item['qty']
         
-        Model = _get_product_model(product_type)
-        if Model:
-            try:
-                product_obj = Model.objects.get(pk=product_id)
-                precio = product_obj.precio
-                subtotal = precio * cantidad
-                nombre = getattr(product_obj, 'modelo', getattr(product_obj, 'tipo', 'Producto'))
-                
-                cart_items.append({
-                    'key': key,
-                    'type': product_type,
-                    'id': product_id,
-                    'nombre': nombre,
-                    'generacion': getattr(product_obj, 'generacion', None),
-                    'imagen_url': product_obj.imagen_url,
-                    'cantidad': cantidad,
-                    'precio_unitario': precio,
-                    'subtotal': subtotal
-                })
-                
-                total_general += subtotal
-                item_count += cantidad
-                
-            except Model.DoesNotExist:
-                items_to_delete.append(key)
-        else:
+        producto = productos.get((product_type, product_id))
+        if producto is None:
             items_to_delete.append(key)
+            continue
+
+        precio = producto['precio']
+        subtotal = precio * cantidad
+        
+        cart_items.append({
+            'key': key,
+            'type': product_type,
+            'id': product_id,
+            'nombre': producto['nombre'],
+            'generacion': producto['generacion'],
+            'imagen_url': producto['imagen_url'],
+            'cantidad': cantidad,
+            'precio_unitario': precio,
+            'subtotal': subtotal,
+            'stock': producto['stock'],
+            'sin_stock': producto['stock'] < cantidad,
+        })
+        
+        total_general += subtotal
+        item_count += cantidad
 
     if items_to_delete:
         for key in items_to_delete:
@@ -73,10 +124,54 @@ def _get_cart_data(request):
                 del request.session['cart'][key]
         request.session.modified = True
                 
-    request.session['cart_item_count'] = item_count
+    # Solo se escribe la sesión si el conteo cambió
+    if request.session.get('cart_item_count') != item_count:
+        request.session['cart_item_count'] = item_count
 
     return {'cart_items': cart_items, 'total_general': total_general, 'item_count': item_count}
 
+class StockInsuficiente(Exception):
+    """Se lanza dentro de la transacción del pedido para deshacerla."""
+
+def _reservar_stock(cart_items):
+    """
+    Descuenta las existencias del carrito con un UPDATE condicional por tipo
+    de producto (UPDATE ... SET stock = stock - qty WHERE id IN (...) AND stock >= qty).
+    El mismo UPDATE suma las piezas a `vendidos` (popularidad del autocompletado).
+    Si alguna línea no alcanza, lanza StockInsuficiente; debe llamarse dentro
+    de transaction.atomic() para que los tipos ya descontados se deshagan.
+    """
+    cantidades_por_tipo = {}
+    for item in cart_items:
+        cantidades_por_tipo.setdefault(item['type'], {})[item['id']] = item['cantidad']
+
+    for product_type, cantidades in cantidades_por_tipo.items():
+        Model = _get_product_model(product_type)
+        cantidad = Case(
+            *[When(pk=pk, then=Value(qty)) for pk, qty in cantidades.items()],
+            output_field=PositiveIntegerField()
+        )
+        actualizados = Model.objects.filter(pk__in=cantidades, stock__gte=cantidad).update(
+            stock=F('stock') - cantidad, vendidos=F('vendidos') + cantidad
+        )
+        if actualizados != len(cantidades):
+            raise StockInsuficiente()
+
+def _get_cart_count(request):
+    """
+    Conteo de piezas del carrito para el navbar, leído solo de la sesión.
+    Las páginas que no muestran el carrito no necesitan consultar productos.
+    """
+    cart = request.session.get('cart', {})
+    return sum(item['qty'] for item in cart.values())
+
+def _con_accesorios(productos, tipo):
+    """Agrega a cada dispositivo sus accesorios compatibles (índice en caché con el catálogo)."""
+    compatibles = compatibilidad.por_categoria(tipo)
+    for producto in productos:
+        producto.accesorios_compatibles = compatibles.get(producto.pk, [])
+    return productos
+
 
 # ==========================================================
 # LÓGICA DEL CARRITO (NUEVAS VISTAS)
@@ -88,9 +183,13 @@ def tienda_ver_carrito(request):
 
     context = {
         'titulo': 'Mi Carrito de Compras',
+        'error_carrito': request.session.pop('error_carrito', None),
+        'hay_sin_stock': any(item['sin_stock'] for item in cart_data['cart_items']),
         'cart_items': cart_data['cart_items'],
         'total_general': cart_data['total_general'],
         'cart_item_count': cart_data['item_count'],
+        # Una consulta indexada a las listas precalculadas
+        'recomendaciones': recomendaciones.para_carrito(item['key'] for item in cart_data['cart_items']),
     }
     return render(request, 'tienda/carrito.html', context)
 
@@ -118,21 +217,11 @@ def tienda_agregar_al_carrito(request):
 
         # Usar la sesión para almacenar el carrito
         cart = request.session.get('cart', {})
-        item_key = f"{product_type}_{product_id}"
-
-        if item_key in cart:
-            cart[item_key]['qty'] += cantidad
-        else:
-            cart[item_key] = {
-                'id': int(product_id), 
-                'type': product_type,
-                'qty': cantidad
-            }
+        carrito.aplicar_operacion(cart, {'op': 'agregar', 'type': product_type, 'id': product_id, 'cantidad': cantidad})
 
         request.session['cart'] = cart
-        request.session.modified = True
-        
-        _get_cart_data(request) 
+        request.session['cart_item_count'] = _get_cart_count(request)
+        carrito.descartar_foto(request.session)
 
         return redirect(request.POST.get('next', 'tienda_ver_carrito'))
 
@@ -143,10 +232,10 @@ def tienda_eliminar_del_carrito(request, item_key):
     if request.method == 'POST':
         cart = request.session.get('cart', {})
         if item_key in cart:
-            del cart[item_key]
+            carrito.aplicar_operacion(cart, {'op': 'eliminar', 'key': item_key})
             request.session['cart'] = cart
-            request.session.modified = True
-            _get_cart_data(request)
+            request.session['cart_item_count'] = _get_cart_count(request)
+            carrito.descartar_foto(request.session)
     return redirect('tienda_ver_carrito')
 
 def tienda_actualizar_item_carrito(request, item_key):
@@ -162,110 +251,214 @@ def tienda_actualizar_item_carrito(request, item_key):
 
         cart = request.session.get('cart', {})
         if item_key in cart:
-            cart[item_key]['qty'] = nueva_cantidad
+            carrito.aplicar_operacion(cart, {'op': 'actualizar', 'key': item_key, 'cantidad': nueva_cantidad})
             request.session['cart'] = cart
-            request.session.modified = True
-            _get_cart_data(request)
+            request.session['cart_item_count'] = _get_cart_count(request)
+            carrito.descartar_foto(request.session)
             
     return redirect('tienda_ver_carrito')
 
+def _linea_json(item):
+    """Línea del carrito lista para JSON (los Decimal viajan como texto)."""
+    return {
+        'key': item['key'],
+        'type': item['type'],
+        'id': item['id'],
+        'nombre': item['nombre'],
+        'generacion': item['generacion'],
+        'imagen_url': item['imagen_url'],
+        'cantidad': item['cantidad'],
+        'precio_unitario': str(item['precio_unitario']),
+        'subtotal': str(item['subtotal']),
+        'stock': item['stock'],
+        'sin_stock': item['sin_stock'],
+    }
+
+def tienda_carrito_api(request):
+    """
+    API JSON del carrito. GET devuelve el carrito completo (para hidratar la
+    página). POST aplica una lista de operaciones en una sola petición:
+        {"operaciones": [{"op": "agregar", "type": "celular", "id": 3, "cantidad": 1},
+                         {"op": "actualizar", "key": "laptop_2", "cantidad": 4},
+                         {"op": "eliminar", "key": "airpod_1"}]}
+    y devuelve solo las líneas que cambiaron, las eliminadas, el total y el
+    conteo del badge. El carrito se arma una vez (una consulta).
+    """
+    if request.method == 'GET':
+        cart_data = _get_cart_data(request)
+        return JsonResponse({
+            'lineas': [_linea_json(item) for item in cart_data['cart_items']],
+            'eliminadas': [],
+            'total_general': str(cart_data['total_general']),
+            'item_count': cart_data['item_count'],
+            'hay_sin_stock': any(item['sin_stock'] for item in cart_data['cart_items']),
+        })
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Método no permitido.'}, status=405)
+
+    try:
+        operaciones = json.loads(request.body)['operaciones']
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Se esperaba {"operaciones": [...]}.'}, status=400)
+    if not isinstance(operaciones, list) or len(operaciones) > carrito.MAX_OPERACIONES:
+        return JsonResponse(
+            {'error': f'Se aceptan hasta {carrito.MAX_OPERACIONES} operaciones.'}, status=400
+        )
+
+    # Se valida todo antes de escribir: o se aplican todas o ninguna
+    cart = {key: dict(item) for key, item in request.session.get('cart', {}).items()}
+    cambiadas = set()
+    for i, operacion in enumerate(operaciones):
+        try:
+            if not isinstance(operacion, dict):
+                raise carrito.OperacionInvalida('operación inválida')
+            cambiadas.add(carrito.aplicar_operacion(cart, operacion))
+        except carrito.OperacionInvalida as error:
+            return JsonResponse({'error': f'Operación {i}: {error}.'}, status=400)
+
+    request.session['cart'] = cart
+    carrito.descartar_foto(request.session)
+    claves = cambiadas | set(cart)
+    # Descarta los productos que no existen y recalcula el total y el badge
+    cart_data = _get_cart_data(request)
+    presentes = {item['key'] for item in cart_data['cart_items']}
+    return JsonResponse({
+        'lineas': [_linea_json(item) for item in cart_data['cart_items'] if item['key'] in cambiadas],
+        'eliminadas': sorted(claves - presentes),
+        'total_general': str(cart_data['total_general']),
+        'item_count': cart_data['item_count'],
+        'hay_sin_stock': any(item['sin_stock'] for item in cart_data['cart_items']),
+    })
+
 
 # ==========================================================
 # LÓGICA DE TIENDA (VISTAS PRINCIPALES)
 # ==========================================================
 
+def tienda_estado_sesion(request):
+    """
+    Lo personal de las páginas en caché (ver PaginaAnonimaCacheMiddleware):
+    estado de la sesión, conteo del carrito y token CSRF. Nunca se guarda en caché.
+    """
+    usuario_id = request.session.get('usuario_id')
+    response = JsonResponse({
+        'autenticado': bool(usuario_id) and not request.session.get('es_admin', False),
+        'nombre': request.session.get('usuario_nombre') if usuario_id else None,
+        'cart_item_count': _get_cart_count(request),
+        'csrf_token': get_token(request),
+    })
+    response['Cache-Control'] = 'no-store'
+    return response
+
+def tienda_autocompletar(request):
+    """Sugerencias de productos para lo escrito en la búsqueda (?q=)."""
+    response = JsonResponse({'sugerencias': autocompletar.sugerir(request.GET.get('q', '')[:100])})
+    # Cambia solo con el catálogo: el navegador puede repetir la respuesta un momento
+    response['Cache-Control'] = 'max-age=60'
+    return response
+
 def tienda_index(request):
     """Muestra la página principal de la tienda."""
     es_admin = request.session.get('es_admin', False)
-    cart_data = _get_cart_data(request)
+    cart_item_count = _get_cart_count(request)
     
     context = {
         'titulo': 'Inicio - Tienda Apple',
         'es_admin': es_admin,
-        'cart_item_count': cart_data['item_count'],
+        'cart_item_count': cart_item_count,
     }
     return render(request, 'tienda/index.html', context)
 
 def tienda_celulares(request):
-    productos_celulares = Celular.objects.all()
+    # Lista en caché (ver catalogo.py); sin consultas mientras siga vigente
+    productos_celulares = _con_accesorios(catalogo.productos('celular'), 'celular')
     es_admin = request.session.get('es_admin', False)
-    cart_data = _get_cart_data(request)
+    cart_item_count = _get_cart_count(request)
     
     context = {
         'titulo': 'Celulares - iPhone',
         'es_admin': es_admin,
         'productos_celulares': productos_celulares, 
-        'hay_productos': productos_celulares.exists(), 
-        'cart_item_count': cart_data['item_count'],
+        'hay_productos': bool(productos_celulares), 
+        'cart_item_count': cart_item_count,
+        'recomendaciones': recomendaciones.para_categoria('celular'),
     }
     return render(request, 'tienda/celulares.html', context)
     
 def tienda_laptops(request):
-    productos_laptops = Laptop.objects.all()
+    # Lista en caché (ver catalogo.py); sin consultas mientras siga vigente
+    productos_laptops = _con_accesorios(catalogo.productos('laptop'), 'laptop')
     es_admin = request.session.get('es_admin', False)
-    cart_data = _get_cart_data(request)
+    cart_item_count = _get_cart_count(request)
     
     context = {
         'titulo': 'Laptops - MacBook',
         'es_admin': es_admin,
         'productos_laptops': productos_laptops,
-        'hay_productos': productos_laptops.exists(),
-        'cart_item_count': cart_data['item_count'],
+        'hay_productos': bool(productos_laptops),
+        'cart_item_count': cart_item_count,
+        'recomendaciones': recomendaciones.para_categoria('laptop'),
     }
     return render(request, 'tienda/laptops.html', context)
 
 def tienda_tablets(request):
-    productos_tablets = Tablet.objects.all()
+    # Lista en caché (ver catalogo.py); sin consultas mientras siga vigente
+    productos_tablets = _con_accesorios(catalogo.productos('tablet'), 'tablet')
     es_admin = request.session.get('es_admin', False)
-    cart_data = _get_cart_data(request)
+    cart_item_count = _get_cart_count(request)
     
     context = {
         'titulo': 'Tablets - iPad',
         'es_admin': es_admin,
         'productos_tablets': productos_tablets,
-        'hay_productos': productos_tablets.exists(),
-        'cart_item_count': cart_data['item_count'],
+        'hay_productos': bool(productos_tablets),
+        'cart_item_count': cart_item_count,
+        'recomendaciones': recomendaciones.para_categoria('tablet'),
     }
     return render(request, 'tienda/tablets.html', context)
 
 def tienda_airpods(request):
-    productos_airpods = Airpod.objects.all()
+    # Lista en caché (ver catalogo.py); sin consultas mientras siga vigente
+    productos_airpods = _con_accesorios(catalogo.productos('airpod'), 'airpod')
     es_admin = request.session.get('es_admin', False)
-    cart_data = _get_cart_data(request)
+    cart_item_count = _get_cart_count(request)
     
     context = {
         'titulo': 'Airpods - Apple',
         'es_admin': es_admin,
         'productos_airpods': productos_airpods,
-        'hay_productos': productos_airpods.exists(),
-        'cart_item_count': cart_data['item_count'],
+        'hay_productos': bool(productos_airpods),
+        'cart_item_count': cart_item_count,
+        'recomendaciones': recomendaciones.para_categoria('airpod'),
     }
     return render(request, 'tienda/airpods.html', context)
 
 def tienda_accesorios(request):
-    productos_accesorios = Accesorio.objects.all()
+    # Lista en caché (ver catalogo.py); sin consultas mientras siga vigente
+    productos_accesorios = catalogo.productos('accesorio')
     es_admin = request.session.get('es_admin', False)
-    cart_data = _get_cart_data(request)
+    cart_item_count = _get_cart_count(request)
     
     context = {
         'titulo': 'Accesorios - Apple',
         'es_admin': es_admin,
         'productos_accesorios': productos_accesorios,
-        'hay_productos': productos_accesorios.exists(),
-        'cart_item_count': cart_data['item_count'],
+        'hay_productos': bool(productos_accesorios),
+        'cart_item_count': cart_item_count,
+        'recomendaciones': recomendaciones.para_categoria('accesorio'),
     }
     return render(request, 'tienda/accesorios.html', context)
 
 def tienda_login(request):
     """Maneja la lógica de inicio de sesión y redirección inteligente."""
-    cart_data = _get_cart_data(request) 
+    cart_item_count = _get_cart_count(request)
     
     # Capturamos si hay una página siguiente pendiente (ej: ir al checkout)
     next_url = request.GET.get('next') or request.POST.get('next') or 'tienda_index'
 
     context = {
         'titulo': 'Iniciar Sesión',
-        'cart_item_count': cart_data['item_count'],
+        'cart_item_count': cart_item_count,
         'next': next_url # Pasamos la url al template
     }
 
@@ -286,14 +479,15 @@ def tienda_login(request):
                 request.session['es_admin'] = False
                 request.session['usuario_id'] = usuario.id
                 request.session['usuario_nombre'] = usuario.nombre
+                Usuario.objects.filter(pk=usuario.pk).update(ultimo_acceso=timezone.now())
                 
                 # --- REDIRECCIÓN INTELIGENTE ---
                 # Si venía del carrito, lo mandamos al checkout. Si no, al inicio.
                 return redirect(next_url)
             else:
-                return render(request, 'tienda/login.html', {'error': 'Contraseña incorrecta.', 'cart_item_count': cart_data['item_count'], 'next': next_url})
+                return render(request, 'tienda/login.html', {'error': 'Contraseña incorrecta.', 'cart_item_count': cart_item_count, 'next': next_url})
         except Usuario.DoesNotExist:
-            return render(request, 'tienda/login.html', {'error': 'Usuario no encontrado.', 'cart_item_count': cart_data['item_count'], 'next': next_url})
+            return render(request, 'tienda/login.html', {'error': 'Usuario no encontrado.', 'cart_item_count': cart_item_count, 'next': next_url})
 
     return render(request, 'tienda/login.html', context)
 
@@ -304,10 +498,10 @@ def tienda_logout(request):
 
 def tienda_registro(request):
     """Maneja el registro de usuarios desde la tienda."""
-    cart_data = _get_cart_data(request) 
+    cart_item_count = _get_cart_count(request)
     context = {
         'titulo': 'Registro de Usuario',
-        'cart_item_count': cart_data['item_count'],
+        'cart_item_count': cart_item_count,
         'datos': request.POST
     }
 
@@ -356,6 +550,18 @@ def inicio_crud(request):
         return redirect('tienda_login')
     return render(request, 'crud/inicio.html', {'titulo': 'Inicio CRUD'})
 
+def metricas_rendimiento(request):
+    """Percentiles de latencia y consultas por ruta (solo administrador)."""
+    if not request.session.get('es_admin'):
+        return redirect('tienda_login')
+    if request.method == 'POST':
+        registro_metricas.limpiar()
+    return JsonResponse({
+        'activa': settings.INSTRUMENTACION_ACTIVA,
+        'rutas': registro_metricas.resumen(),
+        'autocompletar': autocompletar.estadisticas(),
+    })
+
 # ----------------------------------------------------------
 # AGREGAR USUARIO (MODIFICADO CON PAGOS)
 # ----------------------------------------------------------
@@ -382,8 +588,8 @@ def agregar_usuario(request):
         cvv = request.POST.get('cvv')
         
         try:
-            # 1. Crear Dirección
-            direccion_nueva = Direccion.objects.create(
+            # 1. Dirección (se reutiliza si ya existe una idéntica)
+            direccion_nueva = Direccion.obtener(
                 calle=calle, codigo_postal=codigo_postal,
                 colonia=colonia, ciudad=ciudad, pais=pais
             )
@@ -408,8 +614,8 @@ def agregar_usuario(request):
             return redirect('ver_usuario') 
 
         except IntegrityError:
-            # Limpieza si falla por email duplicado
-            if 'direccion_nueva' in locals(): direccion_nueva.delete()
+            # Limpieza si falla por email duplicado (la dirección puede ser
+            # compartida con otros usuarios o pedidos: no se borra)
             if 'pago_nuevo' in locals(): pago_nuevo.delete()
 
             return render(request, 'crud/usuario/agregar_usuario.html', {
@@ -423,11 +629,30 @@ def agregar_usuario(request):
 # ----------------------------------------------------------
 # VER USUARIO
 # ----------------------------------------------------------
+# Orden de la tabla de usuarios (?orden=...). Los contadores tienen índice.
 def ver_usuario(request):
-    """Muestra tabla de usuarios."""
-    usuarios = Usuario.objects.all()
+    """Muestra tabla de usuarios, con orden y filtros por su resumen de pedidos."""
+    orden = request.GET.get('orden', 'id')
+    if orden not in reportes.ORDEN_USUARIOS:
+        orden = 'id'
+    min_pedidos = request.GET.get('min_pedidos', '')
+    min_gastado = request.GET.get('min_gastado', '')
+    try:
+        gastado = Decimal(min_gastado)
+    except InvalidOperation:
+        gastado = None
+        min_gastado = ''
+
+    # En caché y calculado una sola vez aunque lleguen varias peticiones juntas
+    usuarios = reportes.usuarios(
+        orden, int(min_pedidos) if min_pedidos.isdigit() else None, gastado
+    )
+
     context = {
         'usuarios': usuarios,
+        'orden': orden,
+        'min_pedidos': min_pedidos,
+        'min_gastado': min_gastado,
         'titulo': 'Ver Usuarios'
     }
     return render(request, 'crud/usuario/ver_usuario.html', context)
@@ -437,7 +662,7 @@ def ver_usuario(request):
 # ----------------------------------------------------------
 def actualizar_usuario(request, usuario_id):
     """Formulario para editar usuario, dirección y pago."""
-    usuario = get_object_or_404(Usuario, pk=usuario_id)
+    usuario = get_object_or_404(Usuario.objects.select_related('direccion', 'metodo_pago'), pk=usuario_id)
     # Obtenemos las relaciones para pasarlas al template
     direccion = usuario.direccion 
     metodo_pago = usuario.metodo_pago
@@ -466,21 +691,10 @@ def realizar_actualizacion_usuario(request, usuario_id):
         if nueva_contraseña:
             usuario.contraseña = nueva_contraseña
         
-        # 2. Actualizar o Crear Dirección
-        if usuario.direccion:
-            dir_obj = usuario.direccion
-        else:
-            dir_obj = Direccion()
-            
-        dir_obj.calle = request.POST.get('calle')
-        dir_obj.codigo_postal = request.POST.get('codigo_postal')
-        dir_obj.colonia = request.POST.get('colonia')
-        dir_obj.ciudad = request.POST.get('ciudad')
-        dir_obj.pais = request.POST.get('pais')
-        dir_obj.save()
-        
-        if not usuario.direccion:
-            usuario.direccion = dir_obj
+        # 2. Dirección: las direcciones no se editan (los pedidos anteriores
+        # conservan la suya); se usa la que tenga exactamente estos datos
+        dir_obj = Direccion.obtener(**{campo: request.POST.get(campo) for campo in Direccion.CAMPOS})
+        usuario.direccion = dir_obj
 
         # 3. Actualizar o Crear Método de Pago
         if usuario.metodo_pago:
@@ -516,16 +730,12 @@ def realizar_actualizacion_usuario(request, usuario_id):
 # ----------------------------------------------------------
 def borrar_usuario(request, usuario_id):
     """Elimina usuario y opcionalmente sus datos asociados."""
-    usuario = get_object_or_404(Usuario, pk=usuario_id)
+    usuario = get_object_or_404(Usuario.objects.select_related('direccion', 'metodo_pago'), pk=usuario_id)
     
     if request.method == 'POST':
-        # Borrar datos relacionados para evitar registros huérfanos
-        if usuario.direccion:
-            usuario.direccion.delete()
-        if usuario.metodo_pago:
-            usuario.metodo_pago.delete()
-            
-        usuario.delete()
+        # Pedidos, carrito, dirección y tarjeta se borran con DELETEs por
+        # conjunto, sin cargar el historial del usuario en memoria
+        borrar_usuarios([usuario.id])
         return redirect('ver_usuario')
         
     context = {
@@ -544,11 +754,12 @@ def agregar_celular(request):
         modelo = request.POST.get('modelo')
         descripcion = request.POST.get('descripcion')
         precio = request.POST.get('precio')
+        stock = request.POST.get('stock') or 0
         imagen_url = request.POST.get('imagen_url')
         try:
             Celular.objects.create(
                 modelo=modelo, descripcion=descripcion,
-                precio=precio, imagen_url=imagen_url
+                precio=precio, stock=stock, imagen_url=imagen_url
             )
             return redirect('ver_celular') 
         except Exception as e:
@@ -571,6 +782,7 @@ def realizar_actualizacion_celular(request, celular_id):
         celular.modelo = request.POST.get('modelo')
         celular.descripcion = request.POST.get('descripcion')
         celular.precio = request.POST.get('precio')
+        celular.stock = request.POST.get('stock') or 0
         celular.imagen_url = request.POST.get('imagen_url')
         try:
             celular.save()
@@ -598,11 +810,12 @@ def agregar_laptop(request):
         modelo = request.POST.get('modelo')
         descripcion = request.POST.get('descripcion')
         precio = request.POST.get('precio')
+        stock = request.POST.get('stock') or 0
         imagen_url = request.POST.get('imagen_url')
         try:
             Laptop.objects.create(
                 modelo=modelo, descripcion=descripcion,
-                precio=precio, imagen_url=imagen_url
+                precio=precio, stock=stock, imagen_url=imagen_url
             )
             return redirect('ver_laptop') 
         except Exception as e:
@@ -625,6 +838,7 @@ def realizar_actualizacion_laptop(request, laptop_id):
         laptop.modelo = request.POST.get('modelo')
         laptop.descripcion = request.POST.get('descripcion')
         laptop.precio = request.POST.get('precio')
+        laptop.stock = request.POST.get('stock') or 0
         laptop.imagen_url = request.POST.get('imagen_url')
         try:
             laptop.save()
@@ -653,11 +867,12 @@ def agregar_airpod(request):
         modelo = request.POST.get('modelo')
         descripcion = request.POST.get('descripcion')
         precio = request.POST.get('precio')
+        stock = request.POST.get('stock') or 0
         imagen_url = request.POST.get('imagen_url')
         try:
             Airpod.objects.create(
                 generacion=generacion, modelo=modelo, descripcion=descripcion,
-                precio=precio, imagen_url=imagen_url
+                precio=precio, stock=stock, imagen_url=imagen_url
             )
             return redirect('ver_airpod') 
         except Exception as e:
@@ -681,6 +896,7 @@ def realizar_actualizacion_airpod(request, airpod_id):
         airpod.modelo = request.POST.get('modelo')
         airpod.descripcion = request.POST.get('descripcion')
         airpod.precio = request.POST.get('precio')
+        airpod.stock = request.POST.get('stock') or 0
         airpod.imagen_url = request.POST.get('imagen_url')
         try:
             airpod.save()
@@ -708,11 +924,12 @@ def agregar_tablet(request):
         modelo = request.POST.get('modelo')
         descripcion = request.POST.get('descripcion')
         precio = request.POST.get('precio')
+        stock = request.POST.get('stock') or 0
         imagen_url = request.POST.get('imagen_url')
         try:
             Tablet.objects.create(
                 modelo=modelo, descripcion=descripcion,
-                precio=precio, imagen_url=imagen_url
+                precio=precio, stock=stock, imagen_url=imagen_url
             )
             return redirect('ver_tablet') 
         except Exception as e:
@@ -735,6 +952,7 @@ def realizar_actualizacion_tablet(request, tablet_id):
         tablet.modelo = request.POST.get('modelo')
         tablet.descripcion = request.POST.get('descripcion')
         tablet.precio = request.POST.get('precio')
+        tablet.stock = request.POST.get('stock') or 0
         tablet.imagen_url = request.POST.get('imagen_url')
         try:
             tablet.save()
@@ -763,11 +981,12 @@ def agregar_accesorio(request):
         modelo_compatible = request.POST.get('modelo_compatible')
         descripcion = request.POST.get('descripcion')
         precio = request.POST.get('precio')
+        stock = request.POST.get('stock') or 0
         imagen_url = request.POST.get('imagen_url')
         try:
             Accesorio.objects.create(
                 tipo=tipo, modelo_compatible=modelo_compatible, descripcion=descripcion,
-                precio=precio, imagen_url=imagen_url
+                precio=precio, stock=stock, imagen_url=imagen_url
             )
             return redirect('ver_accesorio') 
         except Exception as e:
@@ -791,6 +1010,7 @@ def realizar_actualizacion_accesorio(request, accesorio_id):
         accesorio.modelo_compatible = request.POST.get('modelo_compatible')
         accesorio.descripcion = request.POST.get('descripcion')
         accesorio.precio = request.POST.get('precio')
+        accesorio.stock = request.POST.get('stock') or 0
         accesorio.imagen_url = request.POST.get('imagen_url')
         try:
             accesorio.save()
@@ -819,14 +1039,14 @@ def tienda_mostrar_direccion(request):
         return redirect('tienda_login')
 
     usuario_id = request.session.get('usuario_id')
-    usuario = get_object_or_404(Usuario, pk=usuario_id)
+    usuario = get_object_or_404(Usuario.objects.select_related('direccion'), pk=usuario_id)
     direccion_actual = usuario.direccion 
-    cart_data = _get_cart_data(request)
+    cart_item_count = _get_cart_count(request)
 
     context = {
         'titulo': 'Dirección de Envío',
         'direccion': direccion_actual,
-        'cart_item_count': cart_data['item_count'],
+        'cart_item_count': cart_item_count,
     }
     return render(request, 'tienda/checkout_direccion.html', context)
 
@@ -840,31 +1060,23 @@ def tienda_guardar_direccion(request):
         usuario_id = request.session.get('usuario_id')
         usuario = get_object_or_404(Usuario, pk=usuario_id)
 
-        # 2. Obtener la Dirección actual o crear una nueva
-        if usuario.direccion:
-            direccion_obj = usuario.direccion
-        else:
-            direccion_obj = Direccion()
-            
-        # 3. Guardar los datos del formulario en el objeto
-        direccion_obj.calle = request.POST.get('calle')
-        direccion_obj.codigo_postal = request.POST.get('codigo_postal')
-        direccion_obj.colonia = request.POST.get('colonia')
-        direccion_obj.ciudad = request.POST.get('ciudad')
-        direccion_obj.pais = request.POST.get('pais')
+        # 2. Datos del formulario (todavía sin guardar)
+        direccion_obj = Direccion(**{campo: request.POST.get(campo) for campo in Direccion.CAMPOS})
         
         # Validación simple
         if not all([direccion_obj.calle, direccion_obj.codigo_postal, direccion_obj.colonia, direccion_obj.ciudad, direccion_obj.pais]):
              return redirect('tienda_mostrar_direccion') 
 
+        # Misma escritura de colonia, ciudad y país que el catálogo de códigos postales
+        codigos_postales.normalizar_direccion(direccion_obj)
+
         try:
-            # 4. Guardar en la Base de Datos
-            direccion_obj.save()
-            
-            # Asignar al usuario si es nueva
-            if not usuario.direccion:
+            # 3. Las direcciones no se editan: se reutiliza la que tenga estos
+            # datos o se crea una nueva, y los pedidos anteriores conservan la suya
+            direccion_obj = Direccion.obtener(**{campo: getattr(direccion_obj, campo) for campo in Direccion.CAMPOS})
+            if usuario.direccion_id != direccion_obj.id:
                 usuario.direccion = direccion_obj
-                usuario.save()
+                usuario.save(update_fields=['direccion'])
             
             # =========================================================
             # AQUÍ ESTÁ LA MAGIA: REDIRECCIONAR AL PAGO
@@ -878,6 +1090,15 @@ def tienda_guardar_direccion(request):
     # Si no es POST, recargamos la página
     return redirect('tienda_mostrar_direccion')
 
+def tienda_codigo_postal(request):
+    """Colonias, ciudad y país de un código postal (?cp=) para autollenar la dirección."""
+    datos = codigos_postales.buscar(request.GET.get('cp', ''))
+    if datos is None:
+        return JsonResponse({'error': 'Código postal no encontrado.'}, status=404)
+    response = JsonResponse(datos)
+    response['Cache-Control'] = 'max-age=3600'
+    return response
+
 def tienda_confirmar_pedido(request):
     """Vista de ejemplo para el paso final del checkout."""
     return HttpResponse("¡Pedido Confirmado! Gracias por tu compra.")
@@ -890,7 +1111,7 @@ def tienda_pago(request):
     if not request.session.get('usuario_id'):
         return redirect('tienda_login')
 
-    usuario = get_object_or_404(Usuario, pk=request.session['usuario_id'])
+    usuario = get_object_or_404(Usuario.objects.select_related('metodo_pago'), pk=request.session['usuario_id'])
     cart_data = _get_cart_data(request)
 
     # Si el carrito está vacío, no debería estar aquí
@@ -945,7 +1166,9 @@ def tienda_resumen_pedido(request):
     if not request.session.get('usuario_id'):
         return redirect('tienda_login')
 
-    usuario = get_object_or_404(Usuario, pk=request.session['usuario_id'])
+    usuario = get_object_or_404(
+        Usuario.objects.select_related('direccion', 'metodo_pago'), pk=request.session['usuario_id']
+    )
     cart_data = _get_cart_data(request)
 
     # Validaciones de seguridad
@@ -954,6 +1177,14 @@ def tienda_resumen_pedido(request):
     if not usuario.metodo_pago:
         return redirect('tienda_pago')
 
+    # Foto de lo que se muestra: es lo que se cobrará al confirmar. Si difiere
+    # de la foto anterior (precio cambiado o producto retirado) se avisa
+    foto = carrito.tomar_foto(cart_data['cart_items'])
+    anterior = request.session.get(carrito.CLAVE_SESION)
+    cambios_precio = carrito.comparar(anterior, foto)
+    if foto != anterior:
+        request.session[carrito.CLAVE_SESION] = foto
+
     context = {
         'titulo': 'Resumen del Pedido',
         'usuario': usuario,
@@ -962,49 +1193,111 @@ def tienda_resumen_pedido(request):
         'cart_items': cart_data['cart_items'],
         'total_general': cart_data['total_general'],
         'cart_item_count': cart_data['item_count'],
+        'cambios_precio': cambios_precio,
+        'version_carrito': foto['version'],
+        # Clave única por resumen mostrado: identifica el envío del formulario
+        'clave_idempotencia': uuid.uuid4().hex,
     }
     return render(request, 'tienda/checkout_resumen.html', context)
 
+def _respuesta_pedido_existente(request, registro, usuario):
+    """Repite la respuesta original de un checkout ya procesado con la misma clave."""
+    if registro.usuario_id != usuario.id or registro.pedido is None:
+        return redirect('tienda_resumen_pedido')
+    # El carrito de esta petición ya se convirtió en ese pedido
+    request.session['cart'] = {}
+    request.session['cart_item_count'] = 0
+    request.session.pop(carrito.CLAVE_SESION, None)
+    return render(request, 'tienda/gracias.html', {'pedido': registro.pedido})
+
 def tienda_finalizar_compra(request):
-    """Guarda el Pedido y Detalles en la BD y limpia el carrito."""
+    """Guarda el Pedido y Detalles en la BD, descuenta existencias y limpia el carrito."""
     if request.method == 'POST':
-        usuario = get_object_or_404(Usuario, pk=request.session['usuario_id'])
-        cart_data = _get_cart_data(request)
-        
-        if cart_data['item_count'] == 0:
-             return redirect('tienda_index')
-
-        # 1. Crear el objeto Pedido
-        pedido = Pedido.objects.create(
-            usuario=usuario,
-            direccion_envio=usuario.direccion,
-            metodo_pago=usuario.metodo_pago,
-            total=cart_data['total_general'],
-            estado='Pendiente'
+        usuario = get_object_or_404(
+            Usuario.objects.select_related('direccion', 'metodo_pago'), pk=request.session['usuario_id']
         )
 
-        # 2. Crear los DetallePedido (iterando el carrito)
-        for item in cart_data['cart_items']:
-            # Lógica para asignar el producto correcto según el tipo
-            kw_args = {
-                'pedido': pedido,
-                'cantidad': item['cantidad'],
-                'precio_unitario': item['precio_unitario']
-            }
-            
-            # Buscamos el objeto real en la BD para asignarlo a la FK correcta
-            product_model = _get_product_model(item['type'])
-            if product_model:
-                producto_obj = product_model.objects.get(pk=item['id'])
-                
-                # Asignación dinámica: 'celular': obj, o 'laptop': obj...
-                kw_args[item['type']] = producto_obj
-                
-                DetallePedido.objects.create(**kw_args)
+        # Un reintento con la misma clave devuelve el pedido original sin insertar nada
+        clave = request.POST.get('clave_idempotencia')
+        if not clave:
+            return redirect('tienda_resumen_pedido')
+        registro = ClaveIdempotencia.objects.select_related('pedido').filter(clave=clave).first()
+        if registro:
+            return _respuesta_pedido_existente(request, registro, usuario)
+
+        if not request.session.get('cart'):
+            return redirect('tienda_index')
+
+        # Se cobra la foto del resumen que vio el usuario, no un recálculo.
+        # Si el carrito o algún precio cambió desde entonces, de vuelta al
+        # resumen, que muestra la diferencia
+        foto = request.session.get(carrito.CLAVE_SESION)
+        if (
+            not foto
+            or request.POST.get('version_carrito') != foto['version']
+            or not carrito.coincide_con_carrito(foto, request.session['cart'])
+            or carrito.precios_cambiados(foto)
+        ):
+            return redirect('tienda_resumen_pedido')
+
+        try:
+            with transaction.atomic():
+                # 0. Registrar la clave primero: si otra petición con la misma
+                # clave ya la insertó, el índice único lanza IntegrityError
+                registro = ClaveIdempotencia.objects.create(clave=clave, usuario=usuario)
+
+                # 1. Apartar existencias (si algo no alcanza se deshace todo)
+                _reservar_stock(foto['lineas'])
+
+                # 2. Crear el objeto Pedido
+                pedido = Pedido.objects.create(
+                    usuario=usuario,
+                    direccion_envio=usuario.direccion,
+                    metodo_pago=usuario.metodo_pago,
+                    total=Decimal(foto['total']),
+                    estado='Pendiente'
+                )
+
+                # 3. Crear los DetallePedido en un solo INSERT.
+                # Asignación dinámica de la FK: 'celular_id', 'laptop_id'...
+                DetallePedido.objects.bulk_create([
+                    DetallePedido(
+                        pedido=pedido,
+                        cantidad=linea['cantidad'],
+                        precio_unitario=Decimal(linea['precio']),
+                        producto_nombre=linea['nombre'],
+                        categoria=linea['type'],
+                        sku=DetallePedido.sku_para(linea['type'], linea['id']),
+                        **{f"{linea['type']}_id": linea['id']}
+                    )
+                    for linea in foto['lineas']
+                ])
+
+                registro.pedido = pedido
+                registro.save(update_fields=['pedido'])
+
+                # Resumen de pedidos del usuario (conteo, total, último pedido)
+                Usuario.registrar_pedido(pedido)
+
+                # 4. Trabajo posterior (correo, etc.): se ejecuta fuera de la
+                # petición y solo si la transacción se confirma
+                encolar(enviar_confirmacion_pedido, pedido_id=pedido.id)
+        except IntegrityError:
+            registro = ClaveIdempotencia.objects.select_related('pedido').filter(clave=clave).first()
+            if registro is None:
+                raise
+            return _respuesta_pedido_existente(request, registro, usuario)
+        except StockInsuficiente:
+            # Regresamos al carrito, donde se marcan las líneas sin existencias
+            request.session['error_carrito'] = (
+                'Algunos productos ya no tienen existencias suficientes. Ajusta las cantidades para continuar.'
+            )
+            return redirect('tienda_ver_carrito')
 
-        # 3. Limpiar el carrito de la sesión
+        # 5. Limpiar el carrito de la sesión
         request.session['cart'] = {}
         request.session['cart_item_count'] = 0
+        request.session.pop(carrito.CLAVE_SESION, None)
         request.session.modified = True
 
         return render(request, 'tienda/gracias.html', {'pedido': pedido})
@@ -1015,30 +1308,76 @@ def tienda_finalizar_compra(request):
 # ==========================================================
 
 def actualizar_pedido(request, pedido_id):
-    """Permite cambiar el estado del pedido y ver sus detalles."""
-    pedido = get_object_or_404(Pedido, pk=pedido_id)
-    detalles = DetallePedido.objects.filter(pedido=pedido)
+    """Permite cambiar el estado del pedido (solo a los estados válidos) y ver sus detalles e historial."""
+    pedido = get_object_or_404(Pedido.objects.select_related('usuario'), pk=pedido_id)
+    detalles = pedido.detallepedido_set.all()
+    error = None
 
     if request.method == 'POST':
-        pedido.estado = request.POST.get('estado')
-        pedido.save()
-        # Al guardar, nos regresamos al perfil del usuario dueño del pedido
-        return redirect('actualizar_usuario', usuario_id=pedido.usuario.id)
+        nuevo = request.POST.get('estado')
+        if nuevo == pedido.estado:
+            return redirect('actualizar_usuario', usuario_id=pedido.usuario.id)
+        try:
+            actualizados, _ = estados_pedido.transicionar([pedido.id], nuevo)
+        except estados_pedido.TransicionInvalida:
+            actualizados = []
+        if actualizados:
+            # Al guardar, nos regresamos al perfil del usuario dueño del pedido
+            return redirect('actualizar_usuario', usuario_id=pedido.usuario.id)
+        pedido.refresh_from_db(fields=['estado'])
+        error = f'No se puede pasar el pedido de "{pedido.estado}" a "{nuevo}".'
 
     context = {
         'pedido': pedido,
         'detalles': detalles,
+        'historial': pedido.historial_estados.order_by('fecha', 'id'),
+        'error': error,
         'titulo': 'Actualizar Estado del Pedido'
     }
     return render(request, 'crud/pedido/actualizar_pedido.html', context)
 
+def cola_pedidos(request):
+    """
+    Pedidos en un estado (los más antiguos primero) con cambio de estado
+    masivo: los marcados pasan al estado elegido con un UPDATE por conjunto.
+    """
+    if not request.session.get('es_admin'):
+        return redirect('tienda_login')
+    estado = request.GET.get('estado', Pedido.PENDIENTE)
+    if estado not in Pedido.TRANSICIONES:
+        estado = Pedido.PENDIENTE
+
+    mensaje = None
+    if request.method == 'POST':
+        try:
+            actualizados, rechazados = estados_pedido.transicionar(
+                request.POST.getlist('pedidos'), request.POST.get('nuevo_estado')
+            )
+            mensaje = f'{len(actualizados)} pedidos actualizados'
+            if rechazados:
+                mensaje += f', {len(rechazados)} rechazados (su estado no admite el cambio)'
+        except (estados_pedido.TransicionInvalida, ValueError):
+            mensaje = 'Estado o pedidos no válidos.'
+
+    context = {
+        'estado': estado,
+        'estados': [valor for valor, _ in Pedido.ESTADOS],
+        'siguientes': Pedido.TRANSICIONES[estado],
+        'pedidos': estados_pedido.cola(estado),
+        'mensaje': mensaje,
+        'titulo': 'Cola de Pedidos',
+    }
+    return render(request, 'crud/pedido/cola_pedidos.html', context)
+
 def borrar_pedido(request, pedido_id):
     """Borra un pedido individualmente."""
     pedido = get_object_or_404(Pedido, pk=pedido_id)
     usuario_id = pedido.usuario.id # Guardamos el ID para volver
     
     if request.method == 'POST':
-        pedido.delete()
+        with transaction.atomic():
+            pedido.delete()
+            Usuario.descontar_pedido(pedido)
         return redirect('actualizar_usuario', usuario_id=usuario_id)
         
     return render(request, 'crud/pedido/borrar_pedido.html', {'pedido': pedido})
@@ -1053,18 +1392,46 @@ def tienda_mis_pedidos(request):
     # 2. Obtener usuario
     usuario = get_object_or_404(Usuario, pk=request.session['usuario_id'])
     
-    # 3. Obtener sus pedidos (del más reciente al más antiguo)
-    # Usamos prefetch_related o simplemente accedemos en el template al detalle_set si está configurado,
-    # pero para simplificar, pasamos los pedidos y en el template iteramos.
-    pedidos = Pedido.objects.filter(usuario=usuario).order_by('-fecha_pedido')
+    # 3. Obtener sus pedidos (del más reciente al más antiguo), incluidos los
+    # que ya pasaron al archivo. Consultas fijas: pedidos+dirección, detalles
+    # (con la copia del producto, sin JOIN a catálogos) y archivo.
+    pedidos = historial_pedidos(usuario)
     
     # 4. Datos del carrito (para el navbar)
-    cart_data = _get_cart_data(request)
+    cart_item_count = _get_cart_count(request)
     
     context = {
         'titulo': 'Mis Pedidos',
         'usuario': usuario,
         'pedidos': pedidos,
-        'cart_item_count': cart_data['item_count']
+        'cart_item_count': cart_item_count
     }
-    return render(request, 'tienda/mis_pedidos.html', context)
\ No newline at end of file
+    return render(request, 'tienda/mis_pedidos.html', context)
+
+async def tienda_eventos_pedidos(request):
+    """
+    Avisos en vivo (Server-Sent Events) cuando cambia el estado de un pedido
+    del usuario logueado. La conexión se queda abierta esperando en una cola
+    del event loop; la BD la revisa una sola tarea por proceso (eventos_pedido.py).
+    """
+    if not isinstance(request, ASGIRequest):
+        # Con WSGI cada conexión ocuparía un hilo: 204 le indica al
+        # navegador que no reintente (la página funciona sin avisos)
+        return HttpResponse(status=204)
+    usuario_id = await request.session.aget('usuario_id')
+    if not usuario_id or await request.session.aget('es_admin', False):
+        return HttpResponse(status=204)
+
+    try:
+        # Al reconectarse, el navegador manda el id del último evento que recibió
+        ultimo_visto = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        ultimo_visto = None
+
+    response = StreamingHttpResponse(
+        eventos_pedido.flujo(usuario_id, ultimo_visto), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Que nginx no junte los eventos en su búfer
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,115 @@
+"""
+Cálculo único por clave ("single flight") con copia obsoleta mientras se
+recalcula (stale-while-revalidate). Cuando una entrada de caché vence o cambia
+de versión, solo una petición la recalcula:
+
+- Dentro del proceso, los hilos se turnan con un candado local y los que
+  esperaban leen de la caché lo que calculó el primero.
+- Entre procesos, un candado en la caché (cache.add) elige quién calcula.
+- Si existe una copia anterior, los demás la reciben sin esperar. Si no
+  existe, esperan hasta VUELO_UNICO_ESPERA_SEGUNDOS y después calculan por su
+  cuenta (el candado nunca deja una página sin responder).
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Candados locales repartidos por hash de la clave: número fijo, sin crecer
+# con las claves. Dos claves que caen en el mismo solo se turnan un momento.
+# Son reentrantes: un cálculo puede pedir otra clave (la página anónima pide
+# el catálogo) y esa clave puede caer en el mismo candado.
+_CANDADOS = [threading.RLock() for _ in range(64)]
+
+
+def _candado_local(clave):
+    return _CANDADOS[hash(clave) % len(_CANDADOS)]
+
+
+def version(nombre):
+    """Versión vigente de un grupo de entradas (p. ej. 'catalogo')."""
+    clave = f'{nombre}:version'
+    actual = cache.get(clave)
+    if actual is None:
+        cache.add(clave, uuid.uuid4().hex[:12], None)
+        actual = cache.get(clave)
+    return actual
+
+
+def nueva_version(nombre):
+    """Deja de considerar vigentes las entradas del grupo (siguen sirviendo como copia obsoleta)."""
+    # Versión aleatoria (no un contador): si la clave se pierde de la caché no
+    # puede volver a coincidir con entradas viejas
+    cache.set(f'{nombre}:version', uuid.uuid4().hex[:12], None)
+
+
+def _vigente(sobre, version):
+    return sobre is not None and sobre[0] == version and sobre[1] > time.time()
+
+
+def _calcular_y_guardar(clave, calcular, segundos, version, gracia):
+    valor = calcular()
+    if valor is not None:
+        # Se guarda más tiempo del vigente para poder servirlo como copia obsoleta
+        cache.set(clave, (version, time.time() + segundos, valor), segundos + gracia)
+    return valor
+
+
+def obtener(clave, calcular, segundos, version=None, gracia=None, espera=None):
+    """
+    Devuelve el valor de `clave` si está vigente (misma `version` y dentro de
+    `segundos`). Si no, lo recalcula una sola petición a la vez con
+    `calcular()`; si `calcular` devuelve None no se guarda.
+    """
+    if gracia is None:
+        gracia = getattr(settings, 'VUELO_UNICO_GRACIA_SEGUNDOS', 300)
+    if espera is None:
+        espera = getattr(settings, 'VUELO_UNICO_ESPERA_SEGUNDOS', 5)
+
+    sobre = cache.get(clave)
+    if _vigente(sobre, version):
+        return sobre[2]
+
+    local = _candado_local(clave)
+    clave_candado = f'{clave}:calculando'
+    token = uuid.uuid4().hex
+
+    if sobre is not None:
+        # Hay copia anterior: si alguien más ya recalcula, se sirve esa copia
+        if not local.acquire(blocking=False):
+            return sobre[2]
+        try:
+            if not cache.add(clave_candado, token, espera * 2):
+                return sobre[2]
+            try:
+                return _calcular_y_guardar(clave, calcular, segundos, version, gracia)
+            finally:
+                if cache.get(clave_candado) == token:
+                    cache.delete(clave_candado)
+        finally:
+            local.release()
+
+    # Sin copia: se espera al que calcula (primero a los hilos del proceso)
+    limite = time.monotonic() + espera
+    if not local.acquire(timeout=espera):
+        return calcular()
+    try:
+        sobre = cache.get(clave)
+        if _vigente(sobre, version):
+            return sobre[2]
+        while not cache.add(clave_candado, token, espera * 2):
+            if time.monotonic() >= limite:
+                return calcular()
+            time.sleep(0.05)
+            sobre = cache.get(clave)
+            if _vigente(sobre, version):
+                return sobre[2]
+        try:
+            return _calcular_y_guardar(clave, calcular, segundos, version, gracia)
+        finally:
+            if cache.get(clave_candado) == token:
+                cache.delete(clave_candado)
+    finally:
+        local.release()
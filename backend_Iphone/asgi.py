@@ -13,4 +13,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_Iphone.settings')
 
+# Los avisos en vivo de "Mis pedidos" (tienda_eventos_pedidos, SSE) solo se
+# sirven con este punto de entrada, p. ej.: uvicorn backend_Iphone.asgi:application
+
 application = get_asgi_application()
@@ -42,8 +42,18 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Va primero para medir la petición completa (se desactiva sola si
+    # INSTRUMENTACION_ACTIVA es False)
+    'app_Iphone.middleware.InstrumentacionMiddleware',
+    # Rechaza con 429 los POST que exceden LIMITES_PETICIONES antes de que se
+    # cargue la sesión o se toque la BD
+    'app_Iphone.middleware.LimitePeticionesMiddleware',
+    # Inicio y categorías para visitantes sin sesión, servidos desde caché
+    'app_Iphone.middleware.PaginaAnonimaCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    # Lecturas de catálogo/historial a réplicas (se desactiva sola sin réplicas)
+    'app_Iphone.middleware.ReplicaLecturaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -83,10 +93,44 @@ WSGI_APPLICATION = 'backend_Iphone.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLITE_PATH permite apuntar a otra base (p. ej. la del benchmark de servidores)
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        # gunicorn.conf.py lo sube para conservar la conexión de cada hilo
+        'CONN_MAX_AGE': int(os.environ.get('CONN_MAX_AGE', '0')),
+        'OPTIONS': {
+            # WAL permite leer mientras otra conexión escribe; IMMEDIATE toma el
+            # candado de escritura al abrir la transacción (sin "database is locked"
+            # al intentar subir de lectura a escritura a mitad del checkout).
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'TEST': {
+            # Base de pruebas en archivo para que las pruebas con varios hilos
+            # compartan la misma base de datos
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
+# Réplicas de lectura: copias SQLite de db.sqlite3 que se actualizan con
+# `python manage.py sincronizar_replicas`. Solo se declaran con
+# REPLICAS_ACTIVAS=1; sin eso todo se lee del primario y ni las pruebas ni
+# migrate abren otra base.
+REPLICAS_ACTIVAS = os.environ.get('REPLICAS_ACTIVAS') == '1'
+NUM_REPLICAS = int(os.environ.get('NUM_REPLICAS', '1')) if REPLICAS_ACTIVAS else 0
+for _i in range(1, NUM_REPLICAS + 1):
+    DATABASES[f'replica_{_i}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'db_replica_{_i}.sqlite3',
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'OPTIONS': {'timeout': 20},
+        'TEST': {'NAME': BASE_DIR / f'test_db_replica_{_i}.sqlite3'},
+    }
+REPLICAS_LECTURA = [f'replica_{_i}' for _i in range(1, NUM_REPLICAS + 1)]
+REPLICAS_PEGAJOSIDAD_SEGUNDOS = 5  # Tras escribir, ese navegador lee del primario
+DATABASE_ROUTERS = ['app_Iphone.replicas.RouterReplicas']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -124,6 +168,85 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Existencias que la migración 0003 da a los productos que ya estaban en el
+# catálogo cuando se agregó el stock. Por omisión 0: no hay inventario previo
+# del que sacar un número, así que quedan agotados hasta que el administrador
+# cargue las existencias reales. Fijar la variable de entorno antes de migrar
+# para seguir vendiendo mientras tanto.
+STOCK_INICIAL_MIGRACION = int(os.environ.get('STOCK_INICIAL_MIGRACION', '0'))
+
+# Instrumentación de peticiones (latencia, consultas, Server-Timing)
+# Activar con la variable de entorno INSTRUMENTACION_ACTIVA=1
+INSTRUMENTACION_ACTIVA = os.environ.get('INSTRUMENTACION_ACTIVA') == '1'
+INSTRUMENTACION_VENTANA = 1000  # Muestras por ruta para los percentiles
+INSTRUMENTACION_UMBRAL_N_MAS_1 = 3  # Repeticiones del mismo SQL para marcar N+1
+
+# Tareas en segundo plano (app_Iphone/tareas.py)
+# 'local': hilo trabajador dentro del servidor web
+# 'externa': solo las procesa `python manage.py procesar_tareas`
+# 'inmediata': se ejecutan al confirmar la transacción (útil en pruebas)
+TAREAS_EJECUCION = os.environ.get('TAREAS_EJECUCION', 'local')
+TAREAS_HILOS = 2
+TAREAS_PLAZO_SEGUNDOS = 300  # Tras este tiempo una tarea 'En proceso' se reintenta
+
+# Catálogo en caché (app_Iphone/catalogo.py): máximo de segundos que otro
+# proceso puede tardar en ver un cambio de productos
+CATALOGO_CACHE_SEGUNDOS = 60
+
+# Reportes del administrador en caché (app_Iphone/reportes.py)
+REPORTES_CACHE_SEGUNDOS = 30
+
+# Recomendaciones "Se compran juntos" (app_Iphone/recomendaciones.py): vecinos
+# guardados por producto al ejecutar recalcular_recomendaciones
+RECOMENDACIONES_TOP = 8
+
+# Autocompletado de la búsqueda (app_Iphone/autocompletar.py): índice de
+# prefijos en memoria de cada proceso, con tope de nodos
+AUTOCOMPLETAR_PROFUNDIDAD = 20
+AUTOCOMPLETAR_SUGERENCIAS = 8
+AUTOCOMPLETAR_MAX_NODOS = 200_000
+
+# Consultas de código postal en caché (app_Iphone/codigos_postales.py); una
+# nueva importación las descarta de inmediato
+CODIGOS_POSTALES_CACHE_SEGUNDOS = 86400
+
+# Avisos en vivo del estado de los pedidos por SSE (app_Iphone/eventos_pedido.py,
+# solo con ASGI): cada proceso revisa el historial de estados cada SONDEO
+# segundos; latido para conexiones inactivas y avisos en espera por conexión
+PEDIDOS_EVENTOS_SONDEO_SEGUNDOS = 1
+PEDIDOS_EVENTOS_LATIDO_SEGUNDOS = 25
+PEDIDOS_EVENTOS_MAX_PENDIENTES = 100
+
+# Al vencer una entrada de catálogo, página o reporte solo una petición la
+# recalcula (app_Iphone/vuelo_unico.py). Las demás reciben la copia anterior,
+# que se conserva hasta GRACIA segundos más; sin copia esperan hasta ESPERA.
+VUELO_UNICO_GRACIA_SEGUNDOS = 300
+VUELO_UNICO_ESPERA_SEGUNDOS = 5
+
+# Precalentar cada proceso al arrancar (plantillas, URLs, catálogo y conexión
+# a la BD) para que la primera petición no pague la carga. Pensado para los
+# trabajadores de producción; ver `manage.py perfil_importacion`.
+PRECALENTAR_AL_INICIAR = os.environ.get('PRECALENTAR_AL_INICIAR') == '1'
+
+# Páginas completas para visitantes sin cookie de sesión (inicio y
+# categorías). El navbar y el token CSRF se completan con /sesion/estado/.
+# 0 desactiva la caché.
+PAGINAS_ANONIMAS_CACHE_SEGUNDOS = 60
+
+# Límite de POST por IP y por sesión (token bucket, app_Iphone/middleware.py)
+# nombre de URL: (ráfaga permitida, peticiones por minuto sostenidas)
+LIMITES_PETICIONES = {
+    'tienda_login': (5, 10),
+    'tienda_registro': (3, 5),
+    'tienda_agregar_al_carrito': (20, 60),
+    'tienda_carrito_api': (30, 120),
+}
+LIMITES_CACHE = 'default'  # Con varios servidores, una caché compartida
+
+# Correos (confirmación de pedido): en desarrollo se imprimen en consola
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'ventas@tienda-iphone.local'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,82 @@
+"""
+Configuración de gunicorn para producción:
+
+    pip install -r requirements.txt
+    gunicorn -c gunicorn.conf.py
+
+El maestro carga la aplicación completa (preload_app), la precalienta
+(plantillas, URLs, catálogo y autocompletado, ver app_Iphone/arranque.py) y
+congela el heap con gc.freeze() antes de crear los trabajadores, para que
+esas páginas de memoria se compartan por copy-on-write. Las conexiones a la
+BD no se heredan: cada trabajador abre la suya en cada hilo antes de aceptar
+peticiones (post_worker_init). Cada trabajador
+atiende con un número fijo de hilos, se recicla tras max_requests peticiones
+(con variación para que no se reciclen todos a la vez) y termina lo que
+tiene en curso antes de salir (graceful_timeout). SIGHUP reinicia los
+trabajadores de forma escalonada.
+
+Los valores se pueden cambiar con variables de entorno GUNICORN_*.
+"""
+import gc
+import multiprocessing
+import os
+import threading
+
+# Conexión persistente por hilo: se reutiliza entre peticiones
+os.environ.setdefault('CONN_MAX_AGE', '600')
+
+wsgi_app = 'backend_Iphone.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+preload_app = True
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = max_requests // 10
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+
+def when_ready(server):
+    """En el maestro, después de cargar la aplicación y antes del primer fork."""
+    from django.db import connections
+
+    from app_Iphone.arranque import precalentar
+
+    tiempos = precalentar(bd=True)
+    # Nada de conexiones abiertas en el maestro: no deben compartirse tras el fork
+    connections.close_all()
+    gc.collect()
+    gc.freeze()
+    server.log.info('Aplicación precargada %s', tiempos)
+
+
+def post_worker_init(worker):
+    """En cada trabajador, antes de aceptar peticiones: conexión abierta en cada hilo."""
+    from django.db import DatabaseError
+
+    from app_Iphone.arranque import abrir_conexiones
+
+    hilos = getattr(worker, 'tpool', None)
+    if hilos is None:
+        # Trabajador sync: atiende en el hilo principal
+        pendientes = [abrir_conexiones]
+    else:
+        # Las conexiones de Django son por hilo: una tarea por hilo del pool.
+        # La barrera impide que un mismo hilo tome dos tareas.
+        barrera = threading.Barrier(worker.cfg.threads)
+
+        def abrir():
+            barrera.wait(timeout=10)
+            abrir_conexiones()
+
+        pendientes = [hilos.submit(abrir).result for _ in range(worker.cfg.threads)]
+    try:
+        for pendiente in pendientes:
+            pendiente()
+    except (DatabaseError, threading.BrokenBarrierError) as error:
+        # La petición que llegue abrirá la conexión que falte
+        worker.log.warning('No se abrieron todas las conexiones: %s', error)
+    else:
+        worker.log.info('Trabajador %s con %s conexiones abiertas', worker.pid, len(pendientes))